@@ -15,6 +15,15 @@ from .diff.diffproc_fixed import DiffCodec
 from .capture_thread import start_capture_thread
 from .encode_thread import start_encode_thread
 from .send_thread import start_send_thread
+from .feedback_thread import start_feedback_thread
+from .fec.adaptive import AdaptiveFec
+from .udp_batch import BatchSender, MODES as SEND_BATCH_MODES
+from .destinations import parse_destination, setup_multicast
+from .retransmit import DEFAULT_MAX_AGE, DEFAULT_MAX_FRAMES, Retransmitter
+from .pacer import DEFAULT_BURST, Pacer
+from .mtu import resolve_payload
+from .fec.gf256 import check_rs_params
+from .fec.packet_header import MAX_PAYLOAD, check_fec_k
 
 
 # ============================================================
@@ -30,6 +39,11 @@ def parse_args():
                    help="Server IP address")
     p.add_argument("--server-port", type=int, default=5000,
                    help="Server UDP port")
+    p.add_argument("--dest", action="append", default=[],
+                   help="Extra destination ip[:port][/fec] (repeatable; the frame is encoded once and sent to "
+                        "--server-ip and every --dest; a multicast group address is allowed)")
+    p.add_argument("--multicast-ttl", type=int, default=1,
+                   help="TTL for multicast destinations")
 
     # --- カメラ / フレーム関連 ---
     p.add_argument("--width", type=int, default=640,
@@ -56,17 +70,90 @@ def parse_args():
                    help="JPEG gate ratio for diff")
     p.add_argument("--zlib-level", type=int, default=6,
                    help="Zlib compression level for diff")
+    p.add_argument("--jpeg-gate-refresh", type=int, default=30,
+                   help="Re-encode the gate JPEG after this many P-frames (0: every frame)")
+    p.add_argument("--me-range", type=int, default=0,
+                   help="Motion search range in pixels for diff P-frames (0: zero motion only)")
+    p.add_argument("--chroma", choices=["on", "off"], default="off",
+                   help="Send U/V residuals in diff P-frames")
+    p.add_argument("--dxf-version", type=int, choices=[1, 2], default=1,
+                   help="Diff P-frame format (2: int8 residuals in one zlib stream)")
+    p.add_argument("--qstep", type=int, default=2,
+                   help="Residual quantization step for --dxf-version 2")
     p.add_argument("--reset-interval", type=float, default=1.0,
                    help="Force I-frame interval for diff coding (sec)")
     
 
     # --- FEC 関連 ---
-    p.add_argument("--fec", choices=["none", "low", "mid", "high"], default="none",
-                   help="FEC mode")
+    p.add_argument("--fec", choices=["none", "low", "mid", "high", "rs", "adaptive"], default="none",
+                   help="FEC mode (adaptive: follow the receiver's loss reports, needs header v2)")
     p.add_argument("--fec-k", type=int, default=8,
                    help="FEC data packet count k")
+    p.add_argument("--fec-r", type=int, default=4,
+                   help="FEC parity packet count r (fec=rs only)")
+    p.add_argument("--interleave", type=int, default=1,
+                   help="Interleave depth across FEC groups (mid/high/rs, 1: off, 0: all groups in a frame)")
+    p.add_argument("--interleave-frames", type=int, default=1,
+                   help="Interleave packets across this many consecutive frames (1: off, adds N-1 frames of latency)")
+    p.add_argument("--slices", choices=["on", "off"], default="off",
+                   help="Packetize on independently decodable units (JPEG restart segments / diff blocks) "
+                        "so the receiver can show partial frames; needs header v2")
+    p.add_argument("--jpeg-rst", type=int, default=4,
+                   help="JPEG restart interval in MCUs when --slices on")
+    p.add_argument("--nack", choices=["on", "off"], default="off",
+                   help="Resend only the chunks the receiver NACKs (with or instead of FEC, needs header v2)")
+    p.add_argument("--nack-max-age", type=float, default=DEFAULT_MAX_AGE,
+                   help="Do not resend frames older than this many seconds")
+    p.add_argument("--nack-cache", type=int, default=DEFAULT_MAX_FRAMES,
+                   help="Frames kept for retransmission")
+    p.add_argument("--send-batch", choices=SEND_BATCH_MODES, default="auto",
+                   help="Send a frame in few syscalls (gso: UDP_SEGMENT, mmsg: sendmmsg, loop: one sendto per packet)")
+    p.add_argument("--pace-rate", type=float, default=0.0,
+                   help="Pace packets at this rate in Mbps (0: off)")
+    p.add_argument("--pace-spread", type=float, default=0.0,
+                   help="Spread each frame's packets over this many ms (0: off)")
+    p.add_argument("--pace-auto", type=float, default=0.0,
+                   help="Spread each frame over this fraction of the frame interval, e.g. 0.5 (0: off)")
+    p.add_argument("--pace-burst", type=int, default=DEFAULT_BURST,
+                   help="Packets per paced send")
+    p.add_argument("--payload", type=str, default=str(MAX_PAYLOAD),
+                   help="Bytes per packet including our header (e.g. 1472 for 1500-byte Ethernet, "
+                        "8972 for jumbo frames; auto: probe the path MTU, up to jumbo)")
+    p.add_argument("--header-version", type=int, choices=[1, 2, 3], default=2,
+                   help="Packet header version (1: legacy frame_id/chunk_id/total only, 3: v2 + stream id)")
+    p.add_argument("--stream-id", type=int, default=0,
+                   help="Stream id for multi-stream receivers (0-65535, needs --header-version 3)")
 
-    return p.parse_args()
+    args = p.parse_args()
+    try:
+        args.destinations = [(args.server_ip, args.server_port, None)] + [
+            parse_destination(d, args.server_port) for d in args.dest
+        ]
+    except ValueError as e:
+        p.error(f"--dest: {e}")
+    try:
+        args.payload = resolve_payload(args.payload, [ip for ip, _port, _fec in args.destinations])
+    except ValueError as e:
+        p.error(f"--payload: {e}")
+    try:
+        check_fec_k(args.fec_k, args.header_version)
+    except ValueError as e:
+        p.error(f"--fec-k: {e}")
+    if any((fec or args.fec) == "rs" for _ip, _port, fec in args.destinations):
+        try:
+            check_rs_params(args.fec_k, args.fec_r)
+        except ValueError as e:
+            p.error(f"--fec-k/--fec-r: {e}")
+    args.adaptive = any((fec or args.fec) == "adaptive" for _ip, _port, fec in args.destinations)
+    if args.adaptive and args.header_version < 2:
+        p.error("--fec adaptive needs --header-version 2 (the receiver reads the scheme per packet)")
+    if args.nack == "on" and args.header_version < 2:
+        p.error("--nack on needs --header-version 2")
+    if args.stream_id and args.header_version < 3:
+        p.error("--stream-id needs --header-version 3")
+    if not 0 <= args.stream_id <= 0xFFFF:
+        p.error("--stream-id must be 0-65535")
+    return args
 
 
 # ============================================================
@@ -80,13 +167,22 @@ def main():
     # 起動時の概要だけ表示（ループ中のログは削除）
     print("[CLIENT] Step8 start (3-thread, FEC none/low/mid/high, diff on/off)")
     print(f"  server = {server_addr}")
+    for ip, port, fec in args.destinations[1:]:
+        print(f"  dest   = {(ip, port)}" + (f" fec={fec}" if fec else ""))
     print(f"  size   = {args.width}x{args.height}, fps={args.fps}")
     print(f"  jpeg   = quality {args.jpeg_quality}")
     print(f"  diff   = {args.diff} (block={args.block}, T={args.T}, "
           f"sad_skip={args.sad_skip_per_px}, "
           f"scene_ratio={args.scene_change_ratio}, "
-          f"jpeg_gate={args.jpeg_gate_ratio}, zlib={args.zlib_level})")
-    print(f"  fec    = {args.fec} (k={args.fec_k})")
+          f"jpeg_gate={args.jpeg_gate_ratio}/{args.jpeg_gate_refresh}, zlib={args.zlib_level}, "
+          f"me_range={args.me_range}, chroma={args.chroma}, dxf v{args.dxf_version} q{args.qstep})")
+    print(f"  fec    = {args.fec} (k={args.fec_k}, r={args.fec_r}, header v{args.header_version}, stream {args.stream_id})")
+    print(f"  interleave = {args.interleave} groups, {args.interleave_frames} frames")
+    print(f"  slices = {args.slices} (jpeg rst={args.jpeg_rst})")
+    print(f"  send   = batch {args.send_batch}, payload {args.payload} bytes/packet")
+    print(f"  pacing = rate {args.pace_rate}Mbps, spread {args.pace_spread}ms, auto {args.pace_auto}, "
+          f"burst {args.pace_burst}")
+    print(f"  nack   = {args.nack} (max age {args.nack_max_age}s, cache {args.nack_cache} frames)")
     print(f"  reset-interval = {args.reset_interval}s")
 
     # DiffCodec 準備（diff=on の場合のみ）
@@ -99,6 +195,12 @@ def main():
             scene_change_ratio=args.scene_change_ratio,
             jpeg_gate_ratio=args.jpeg_gate_ratio,
             zlib_level=args.zlib_level,
+            jpeg_rst_interval=args.jpeg_rst if args.slices == "on" else 0,
+            jpeg_gate_refresh=args.jpeg_gate_refresh,
+            me_range=args.me_range,
+            chroma=args.chroma,
+            dxf_version=args.dxf_version,
+            qstep=args.qstep,
         )
 
     # --------------------------------------------------------
@@ -125,6 +227,26 @@ def main():
     # ソケット
     # --------------------------------------------------------
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    tx = BatchSender(sock, args.send_batch)#1フレーム分をまとめて送る（GSO / sendmmsg）
+    setup_multicast(sock, args.destinations, args.multicast_ttl)
+
+    # fec=adaptive: 受信側の損失レポートで FEC を切り替える
+    fec_ctrl = None
+    if args.adaptive:
+        fec_ctrl = AdaptiveFec()
+
+    # nack=on: 送ったパケットを保持し、受信側の NACK で再送する
+    retx = None
+    if args.nack == "on":
+        retx = Retransmitter(sock, args.nack_cache, args.nack_max_age)
+
+    # ペーシング（--pace-rate / --pace-spread / --pace-auto のどれか）
+    pacer = None
+    if args.pace_rate > 0 or args.pace_spread > 0 or args.pace_auto > 0:
+        pacer = Pacer(args.pace_rate, args.pace_spread, args.pace_auto, args.fps, args.pace_burst)
+
+    if fec_ctrl is not None or retx is not None:
+        sock.settimeout(0.5)#feedback スレッドが停止フラグを確認できるように
 
     # ========================================================
     # スレッド起動（外部モジュール）
@@ -150,8 +272,21 @@ def main():
         args=args,
         server_addr=server_addr,
         sock=sock,
+        fec_ctrl=fec_ctrl,
+        tx=tx,
+        destinations=args.destinations,
+        retx=retx,
+        pacer=pacer,
     )
 
+    if fec_ctrl is not None or retx is not None:
+        t_fb = start_feedback_thread(
+            sock=sock,
+            stop_flag=stop_flag,
+            fec_ctrl=fec_ctrl,
+            retx=retx,
+        )
+
     print("[CLIENT] running... (Ctrl+C to stop)")
 
     try:
@@ -161,6 +296,11 @@ def main():
         print("\n[CLIENT] KeyboardInterrupt -> stopping...")
         stop_flag.set()
 
+    print("[CLIENT] send stats:", tx.stats())
+    if retx is not None:
+        print("[CLIENT] nack stats:", retx.stats())
+    if pacer is not None:
+        print("[CLIENT] pacing stats:", pacer.stats())
     cap.release()
     sock.close()
     print("[CLIENT] clean exit.")
@@ -1,18 +1,22 @@
 
 import cv2
 
-def encode_jpeg(frame, quality: int = 80) -> bytes:
+def encode_jpeg(frame, quality: int = 80, rst_interval: int = 0) -> bytes:
     """
     フレームをJPEGに圧縮してバイト列を返す
     Args:
         frame: numpy.ndarray (BGR画像)
         quality: JPEG品質 (1〜100)
+        rst_interval: リスタート区間のMCU数 (0 はリスタートマーカーなし。スライス分割用)
     Returns:
         bytes: JPEG圧縮済みバイト列
     Raises:
         RuntimeError: エンコード失敗時
     """
-    ok, encoded = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)])
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)]
+    if rst_interval > 0:
+        params += [int(cv2.IMWRITE_JPEG_RST_INTERVAL), int(rst_interval)]
+    ok, encoded = cv2.imencode(".jpg", frame, params)
     if not ok:
         raise RuntimeError("JPEG encode failed")
     return encoded.tobytes()
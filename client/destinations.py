@@ -0,0 +1,65 @@
+# destinations.py --- 複数の送信先（ユニキャスト・マルチキャスト）
+"""
+1 回エンコード・パケット化したフレームを複数の受信側へ送るための送信先指定。
+
+  "192.168.0.10"            : server_port へ、既定の FEC で
+  "192.168.0.11:5001"       : ポート指定
+  "192.168.0.12:5000/high"  : この送信先だけ FEC を変える（同じ FEC の送信先どうしはパケットを共有）
+  "239.0.0.1:5000"          : マルチキャストグループ（TTL は multicast_ttl）
+
+送信先は (ip, port, fec) で表す。fec が None なら送信側の既定（args.fec）。
+"""
+import ipaddress
+import socket
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+FEC_MODES = ("none", "low", "mid", "high", "rs", "adaptive")
+
+Destination = Tuple[str, int, Optional[str]]
+
+
+def parse_destination(spec: Union[str, Sequence], default_port: int) -> Destination:
+    """"ip[:port][/fec]" または (ip, port[, fec]) を (ip, port, fec) にする"""
+    if isinstance(spec, str):
+        fec = None
+        if "/" in spec:
+            spec, fec = spec.rsplit("/", 1)
+        host, sep, port = spec.rpartition(":")
+        if not sep:
+            host, port = port, default_port
+        ip, port = host, int(port)
+    else:
+        ip, port = spec[0], int(spec[1])
+        fec = spec[2] if len(spec) > 2 else None
+
+    if fec is not None and fec not in FEC_MODES:
+        raise ValueError(f"送信先 {ip}:{port} の FEC {fec!r} は {'/'.join(FEC_MODES)} のいずれかです")
+    if not 0 < port <= 0xFFFF:
+        raise ValueError(f"送信先 {ip} のポート {port} が不正です")
+    return ip, port, fec
+
+
+def is_multicast(ip: str) -> bool:
+    try:
+        return ipaddress.ip_address(ip).is_multicast
+    except ValueError:#ホスト名
+        return False
+
+
+def setup_multicast(sock: socket.socket, destinations: Iterable[Destination], ttl: int = 1) -> bool:
+    """マルチキャスト送信先があれば送信ソケットに TTL を設定する（設定したら True）"""
+    if not any(is_multicast(ip) for ip, _port, _fec in destinations):
+        return False
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, int(ttl))
+    return True
+
+
+def group_by_fec(destinations: Iterable[Destination], default: Optional[str] = None) -> List[Tuple[Optional[str], List[Tuple[str, int]]]]:
+    """
+    実際に使う FEC 毎に送信先をまとめる（パケット列は FEC 毎に 1 回だけ作る）。
+    fec None の送信先は default（args.fec）として数えるので、明示した同じ FEC の送信先とパケットを共有する。
+    """
+    groups: dict = {}
+    for ip, port, fec in destinations:
+        groups.setdefault(fec or default, []).append((ip, port))
+    return list(groups.items())
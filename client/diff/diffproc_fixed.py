@@ -3,18 +3,22 @@ import zlib
 import struct
 import numpy as np
 import cv2
-from typing import List, Optional
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import Dict, List, Optional, Tuple
 
 # ==========================
 # このファイル内で JPEG エンコード関数を定義
 # ==========================
-def encode_jpeg(bgr: np.ndarray, quality: int = 80) -> bytes:
+def encode_jpeg(bgr: np.ndarray, quality: int = 80, rst_interval: int = 0) -> bytes:
     """
     BGR画像を JPEG にエンコードして bytes を返す。
     OpenCV の imencode を使用（quality: 0〜100）。
+    rst_interval > 0 ならリスタートマーカーを入れる（スライス分割用、MCU数）。
     """
     # OpenCV の JPEG 品質指定
     params = [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)]#JPEG品質指定
+    if rst_interval > 0:
+        params += [int(cv2.IMWRITE_JPEG_RST_INTERVAL), int(rst_interval)]#リスタート区間
     ok, buf = cv2.imencode(".jpg", bgr, params)#JPEGエンコード
     if not ok:
         raise RuntimeError("encode_jpeg: cv2.imencode に失敗しました")
@@ -22,25 +26,170 @@ def encode_jpeg(bgr: np.ndarray, quality: int = 80) -> bytes:
 
 
 # ==========================
-HDR_FMT = "!4sBBHHHBBH"#magic(4='DXF0'), ver(1), frame_type(1;0=I,1=P), reserved(2) width(2), height(2), block_size(1), T(1), nblocks(2)
+HDR_FMT = "!4sBBHHHBBH"#magic(4='DXF0'), ver(1), frame_type(1;0=I,1=P), flags(2; 旧 reserved) width(2), height(2), block_size(1), T(1), nblocks(2)
 MAGIC = b"DXF0"
 VER = 1
+VER_Q = 2             # P フレームが量子化残差＋フレームで 1 本の zlib ストリーム（I フレームは VER と同じ）
+FLAG_CHROMA = 0x0001  # P フレームの残差ブロックが Y に続けて U, V（各 block/2 × block/2）の残差を持つ
 # ==========================
-# ブロックヘッダ構造体
+# ブロックヘッダ構造体（VER）
 BLK_HDR_FMT = "!HHbbH"#bx(2), by(2), dx(1), dy(1), datalen(2) + data(?)
+# VER_Q の P フレーム: [HDR][P2_HDR][zlib( 送信ブロックのビットマップ + (dx, dy)×n + 残差ありのビットマップ + int8 残差×残差ありブロック数 )]
+#   ビットマップは全ブロック（行優先）/ 送信ブロック毎に 1 ビット（np.packbits、MSB から）
+#   残差は round(残差 / qstep) を int8 に丸めたもの（Y、FLAG_CHROMA なら続けて U, V）
+P2_HDR_FMT = "!BB"#qstep(1), reserved(1)
+QSTEP_MAX = 255
 
+JPEG_SIZE_EMA = 0.5  # JPEG サイズ推定の更新率（実際に JPEG を作る度）
+ME_MAX_RANGE = 127   # 動きベクトルの上限（BLK_HDR の dx, dy は int8）
+SAD_OOB = 1 << 30    # 参照の外にはみ出す候補の SAD
 
-def _bgr_to_y(bgr: np.ndarray) -> np.ndarray:
+
+def _bgr_to_yuv420(bgr: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """I420 に 1 回だけ変換して Y, U, V（U/V は H/2 × W/2）を返す（受信側 DiffDecoder と同じ分け方）"""
     h, w = bgr.shape[:2]#高さ、幅
-    yuv2d = cv2.cvtColor(bgr, cv2.COLOR_BGR2YUV_I420)#YUV変換 輝度成分抽出
-    y = yuv2d[:h, :].copy()#輝度成分取得
-    return y
+    yuv2d = cv2.cvtColor(bgr, cv2.COLOR_BGR2YUV_I420)#YUV変換
+    uv = yuv2d[h:, :].reshape(2, h // 2, w // 2)#残り H/2 行が U, V の順に並ぶ
+    return yuv2d[:h, :], uv[0], uv[1]#変換結果は毎回新しい配列なのでコピー不要、そのまま参照にも使う
+
+
+def _chroma_pred(ref_c: np.ndarray, cb: int, bys: np.ndarray, bxs: np.ndarray, dy: np.ndarray, dx: np.ndarray) -> np.ndarray:
+    """
+    色差ブロック (bys, bxs)（cb × cb）の予測。輝度の動き (dy, dx) の 1/2 だけずらし、半画素は 2 画素の平均
+    （受信側 DiffDecoder._chroma_pred と同じ計算）。戻り値は (n, cb, cb) の uint16
+    """
+    refp = np.pad(_pad_to_blocks(ref_c, cb), ((0, 1), (0, 1)), mode="edge")#半画素用に 1 画素広げる
+    g = sliding_window_view(refp, (cb + 1, cb + 1))[bys * cb + (dy >> 1), bxs * cb + (dx >> 1)].astype(np.uint16)
+    hy = (dy & 1).astype(bool)[:, None, None]
+    hx = (dx & 1).astype(bool)[:, None, None]
+    g = np.where(hy, (g[:, :-1] + g[:, 1:] + 1) >> 1, g[:, :-1])
+    return np.where(hx, (g[:, :, :-1] + g[:, :, 1:] + 1) >> 1, g[:, :, :-1])
+
+
+def _pad_to_blocks(a: np.ndarray, blk: int) -> np.ndarray:
+    """H, W が blk の倍数でなければ右端・下端を 0 で埋める（倍数ならそのまま返す）"""
+    H, W = a.shape
+    nby, nbx = -(-H // blk), -(-W // blk)#切り上げ
+    if (nby * blk, nbx * blk) == (H, W):
+        return a
+    padded = np.zeros((nby * blk, nbx * blk), dtype=a.dtype)
+    padded[:H, :W] = a
+    return padded
+
+
+def _to_blocks(a: np.ndarray, blk: int) -> np.ndarray:
+    """
+    2D 配列を (H/blk, blk, W/blk, blk) に reshape し、(nby, nbx, blk, blk) のビューにして返す。
+    H, W が blk の倍数でなければ右端・下端を 0 で埋めてから分ける（端のブロックも blk×blk で送る）。
+    """
+    a = _pad_to_blocks(a, blk)
+    return a.reshape(a.shape[0] // blk, blk, a.shape[1] // blk, blk).swapaxes(1, 2)
+
+
+def _recon_blocks(ref: np.ndarray, blk: int, bys: np.ndarray, bxs: np.ndarray, pred: np.ndarray, res: np.ndarray) -> np.ndarray:
+    """参照のブロック (bys, bxs) を 予測＋残差 で置き換えた復元面を返す（受信側と同じ結果）"""
+    recon = _pad_to_blocks(ref, blk).copy()
+    _to_blocks(recon, blk)[bys, bxs] = np.clip(pred.astype(np.int16) + res, 0, 255)
+    return recon[:ref.shape[0], :ref.shape[1]]
+
+
+def _valid_px(shape, blk: int) -> np.ndarray:
+    """ブロック毎の有効画素数 (nby, nbx)（端のブロックは画像内の部分だけ）"""
+    H, W = shape
+    hs = np.minimum(blk, H - np.arange(0, H, blk))#各ブロック行の高さ
+    ws = np.minimum(blk, W - np.arange(0, W, blk))#各ブロック列の幅
+    return np.outer(hs, ws)
+
+
+def _block_sad_at(win: np.ndarray, cur_blocks: np.ndarray, y0: np.ndarray, x0: np.ndarray, shape, blk: int) -> np.ndarray:
+    """
+    参照の (y0, x0) から始まる blk×blk を各ブロックの予測として SAD を求める（ブロック数 n の配列）。
+    win は参照 Y 面の sliding_window_view、cur_blocks は (n, blk*blk) の uint8。はみ出す候補は SAD_OOB。
+    """
+    H, W = shape
+    ok = (y0 >= 0) & (y0 <= H - blk) & (x0 >= 0) & (x0 <= W - blk)
+    pred = win[np.clip(y0, 0, H - blk), np.clip(x0, 0, W - blk)].reshape(-1, blk * blk)#候補位置の画素を集める
+    sad = cv2.reduce(cv2.absdiff(pred, cur_blocks), 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S)[:, 0]
+    return np.where(ok, sad, SAD_OOB)
+
+
+def _motion_search(cur: np.ndarray, ref: np.ndarray, blk: int, rng: int, bys: np.ndarray, bxs: np.ndarray):
+    """
+    ブロック (bys, bxs)（画像内に収まるブロックのみ）の動きベクトルを階層探索で求める。
+      1) 1/s に縮小した Y 面で ±rng/s を全探索。候補毎に画面全体を 1 回ずらし、全ブロックの SAD を同時に求める
+      2) 原寸で s/2, …, 1 画素刻みに周囲 8 点を調べて詰める（各ブロックの候補位置の画素を集めて比べる）
+    参照の外にはみ出す候補は使わない。戻り値は (dy, dx, sad)、それぞれブロック数の配列
+    """
+    H, W = cur.shape
+    nby, nbx = H // blk, W // blk
+    s = 4 if blk % 4 == 0 and rng >= 4 else 2 if blk % 2 == 0 and rng >= 2 else 1#縮小率
+    Hs, Ws, b = nby * blk // s, nbx * blk // s, blk // s
+    cs = cur[:nby * blk, :nbx * blk]
+    rs = ref[:nby * blk, :nbx * blk]
+    if s > 1:
+        cs = cv2.resize(cs, (Ws, Hs), interpolation=cv2.INTER_AREA)
+        rs = cv2.resize(rs, (Ws, Hs), interpolation=cv2.INTER_AREA)
+
+    # 1) 縮小画像で全探索（ゼロに近い候補から調べ、同じ SAD なら小さい動きを残す）
+    r = rng // s#切り捨て: r * s <= rng（端数は 2) の s-1 画素分の詰めで届く）
+    rp = cv2.copyMakeBorder(rs, r, r, r, r, cv2.BORDER_REPLICATE)
+    ys, xs = np.arange(nby) * b, np.arange(nbx) * b
+    best = np.full((nby, nbx), np.inf, dtype=np.float32)
+    vy = np.zeros((nby, nbx), dtype=np.int32)
+    vx = np.zeros((nby, nbx), dtype=np.int32)
+    cands = sorted(((dy, dx) for dy in range(-r, r + 1) for dx in range(-r, r + 1)), key=lambda v: abs(v[0]) + abs(v[1]))
+    for dy, dx in cands:
+        shifted = rp[r + dy:r + dy + Hs, r + dx:r + dx + Ws]
+        sad = cv2.resize(cv2.absdiff(cs, shifted), (nbx, nby), interpolation=cv2.INTER_AREA)#ブロック毎の平均絶対差
+        ok = np.outer((ys + dy >= 0) & (ys + dy + b <= Hs), (xs + dx >= 0) & (xs + dx + b <= Ws))
+        better = ok & (sad < best)
+        best[better] = sad[better]
+        vy[better] = dy
+        vx[better] = dx
+    dy, dx = vy[bys, bxs] * s, vx[bys, bxs] * s
+
+    # 2) 原寸で詰める
+    win = sliding_window_view(ref, (blk, blk))
+    cur_blocks = np.ascontiguousarray(_to_blocks(cur, blk)[bys, bxs]).reshape(-1, blk * blk)
+    y0, x0 = bys * blk, bxs * blk
+    sad = _block_sad_at(win, cur_blocks, y0 + dy, x0 + dx, (H, W), blk)
+    sad0 = _block_sad_at(win, cur_blocks, y0, x0, (H, W), blk)#ゼロモーション
+    zero = sad0 <= sad
+    sad = np.where(zero, sad0, sad)
+    dy = np.where(zero, 0, dy)
+    dx = np.where(zero, 0, dx)
+    step = s // 2
+    while step >= 1:
+        cy, cx = dy, dx
+        for oy in (-step, 0, step):
+            for ox in (-step, 0, step):
+                if oy == 0 and ox == 0:
+                    continue
+                ny, nx = cy + oy, cx + ox
+                cand = _block_sad_at(win, cur_blocks, y0 + ny, x0 + nx, (H, W), blk)
+                cand[(np.abs(ny) > rng) | (np.abs(nx) > rng)] = SAD_OOB
+                better = cand < sad
+                sad = np.where(better, cand, sad)
+                dy = np.where(better, ny, dy)
+                dx = np.where(better, nx, dx)
+        step //= 2
+    return dy, dx, sad
 
 
 class DiffCodec:
     """
     I: JPEG（丸ごと）
     P: ブロック毎にY残差を抽出し、閾値/スキップ後に zlib 圧縮して送る。
+       me_range > 0 なら変化したブロックの動きベクトル（±me_range 画素）を探し、動き補償した残差を送る。
+       動きだけで残差が小さいブロックは残差なし（datalen=0）で動きベクトルだけ送る。
+       chroma="on" なら U/V（block/2 × block/2）の残差も送る（ヘッダの flags に FLAG_CHROMA）。
+       dxf_version=2（VER_Q）なら残差を qstep で int8 に量子化し、フレーム全体を 1 回の zlib で圧縮する
+       （ブロック毎のヘッダ・zlib を持たない。スライス分割はできない）。
+
+    サイズ・ゲート（P が JPEG の jpeg_gate_ratio 倍より大きければ I に昇格）は、同じ品質・解像度で
+    直近に作った JPEG のサイズ（指数移動平均）と比べて決め、P で送るフレームでは JPEG を作らない。
+    推定が無いとき、または P を jpeg_gate_refresh 枚続けたときだけ実際に JPEG を作って推定を更新する
+    （jpeg_gate_refresh=0 なら毎回作る = 従来どおり）。
     """
     def __init__(
         self,
@@ -50,6 +199,12 @@ class DiffCodec:
         scene_change_ratio: float,
         jpeg_gate_ratio: float = 0.85,
         zlib_level: int = 4,
+        jpeg_rst_interval: int = 0,
+        jpeg_gate_refresh: int = 30,
+        me_range: int = 0,
+        chroma: str = "off",
+        dxf_version: int = VER,
+        qstep: int = 2,
     ):
         self.block = int(block)
         self.T = int(T)
@@ -57,39 +212,68 @@ class DiffCodec:
         self.scene_change_ratio = float(scene_change_ratio)
         self.jpeg_gate_ratio = float(jpeg_gate_ratio)
         self.zlib_level = int(zlib_level)
+        self.jpeg_rst_interval = int(jpeg_rst_interval)#Iフレームの JPEG リスタート区間（スライス分割用）
+        self.jpeg_gate_refresh = int(jpeg_gate_refresh)#P がこの枚数続いたら JPEG を作ってサイズ推定を更新
+        self.me_range = min(ME_MAX_RANGE, max(0, int(me_range)))#動き探索範囲（0: ゼロモーションのみ）
+        self.chroma = chroma == "on" and self.block % 2 == 0#U/V の残差も送る（ブロックは偶数のみ）
+        if dxf_version not in (VER, VER_Q):
+            raise ValueError(f"dxf_version は {VER} か {VER_Q} です")
+        self.dxf_version = int(dxf_version)
+        self.qstep = min(QSTEP_MAX, max(1, int(qstep)))#VER_Q の量子化幅
         self._refY: Optional[np.ndarray] = None
+        self._refU: Optional[np.ndarray] = None
+        self._refV: Optional[np.ndarray] = None
+        self._jpeg_size: Dict[Tuple[int, int, int], float] = {}#(品質, 幅, 高さ) → JPEG サイズ推定
+        self._since_jpeg = 0#最後に JPEG を作ってからのフレーム数
+
+        # 統計
+        self.frames_I = 0
+        self.frames_P = 0
+        self.jpeg_encodes = 0
+        self.jpeg_skipped = 0#サイズ推定でゲートを決め、JPEG を作らなかった P フレーム
+        self.mv_blocks = 0#動きベクトル付きで送ったブロック数
 
     def reset(self) -> None:
-        self._refY = None
+        self._refY = self._refU = self._refV = None
+
+    def _jpeg(self, frame_bgr: np.ndarray, jpeg_quality: int) -> bytes:
+        """JPEG を作り、サイズ推定を更新する"""
+        h, w = frame_bgr.shape[:2]#高さ、幅
+        jpg = encode_jpeg(frame_bgr, quality=jpeg_quality, rst_interval=self.jpeg_rst_interval)#JPEGエンコード
+        key = (int(jpeg_quality), w, h)
+        est = self._jpeg_size.get(key)
+        self._jpeg_size[key] = len(jpg) if est is None else est + JPEG_SIZE_EMA * (len(jpg) - est)
+        self._since_jpeg = 0
+        self.jpeg_encodes += 1
+        return jpg
 
-    def _encode_I(self, frame_bgr: np.ndarray, jpeg_quality: int) -> bytes:
+    def _encode_I(self, frame_bgr: np.ndarray, jpeg_quality: int, yuv: Optional[Tuple[np.ndarray, ...]] = None,
+                  jpg: Optional[bytes] = None) -> bytes:
+        """I フレーム（yuv / jpg が作ってあれば使い回す）"""
         h, w = frame_bgr.shape[:2]#高さ、幅
-        jpg = encode_jpeg(frame_bgr, quality=jpeg_quality)#JPEGエンコード
-        header = struct.pack(HDR_FMT, MAGIC, VER, 0, 0, w, h, self.block, self.T, 0)
-        self._refY = _bgr_to_y(frame_bgr)  # 参照更新
+        if jpg is None:
+            jpg = self._jpeg(frame_bgr, jpeg_quality)
+        header = struct.pack(HDR_FMT, MAGIC, self.dxf_version, 0, 0, w, h, self.block, self.T, 0)
+        self._refY, self._refU, self._refV = _bgr_to_yuv420(frame_bgr) if yuv is None else yuv  # 参照更新
+        self.frames_I += 1
         return header + jpg #ヘッダ＋JPEGデータ
 
     def encode_frame(self, frame_bgr: np.ndarray, force_I: bool, jpeg_quality: int) -> bytes:
         """
         戻り値: フレーム1枚分のバイナリ
           - I: [HDR][JPEG]
-          - P: [HDR][(BLK_HDR+comp_residual)*n]
+          - P: [HDR][(BLK_HDR+comp_residual)*n]（動きだけのブロックは comp_residual なし）
+               comp_residual は Y 残差（FLAG_CHROMA なら続けて U, V 残差）の int16 を zlib 圧縮したもの
         """
         h, w = frame_bgr.shape[:2]#高さ、幅
-        y = _bgr_to_y(frame_bgr)#輝度成分取得
-
-        # サイズ・ゲート用に毎回JPEGを先に作成
-        jpg_bytes = encode_jpeg(frame_bgr, quality=jpeg_quality)
-        jpg_size = len(jpg_bytes)#JPEGデータサイズ
+        yuv = _bgr_to_yuv420(frame_bgr)#色変換はフレーム毎に 1 回
+        y, u, v = yuv
 
         # --- Iフレーム ---
         if force_I or self._refY is None:
-            # 既に作ったJPEGを使う（再圧縮しない）
-            header = struct.pack(HDR_FMT, MAGIC, VER, 0, 0, w, h, self.block, self.T, 0)
-            self._refY = y.copy()
-            return header + jpg_bytes
+            return self._encode_I(frame_bgr, jpeg_quality, yuv)
 
-        # --- Pフレーム（ゼロモーション差分） ---
+        # --- Pフレーム（ブロック差分。me_range > 0 なら動き補償） ---
         blk = self.block
         ref = self._refY
         assert ref.shape == y.shape
@@ -98,46 +282,131 @@ class DiffCodec:
 
         # 微小差分のゼロ化
         if self.T > 0:
-            mask = np.abs(diff) < self.T#閾値未満のマスク
-            diff[mask] = 0#true部分を0に
-
-        H, W = y.shape
-        blocks: List[bytes] = []
-        nblocks = 0
-        total_blocks = (H // blk) * (W // blk)#全ブロック数
-
-        # Pの総バイトを見積もる（ヘッダ＋ブロック列）
-        p_bytes_sum = 0
-
-        for by in range(0, H, blk):
-            for bx in range(0, W, blk):
-                rblk = diff[by:by+blk, bx:bx+blk]#ブロック差分取得
-                sad_per_px = np.abs(rblk).sum() / (rblk.size)#SAD計算 ブロック内の1画素あたり平均絶対差分
-                if sad_per_px < self.sad_skip_per_px:#スキップ判定
-                    continue
+            diff[np.abs(diff) < self.T] = 0#閾値未満を0に
 
-                raw = rblk.astype(np.int16).tobytes()#バイト列化
-                comp = zlib.compress(raw, level=self.zlib_level)#zlib圧縮
-                blk_hdr = struct.pack(BLK_HDR_FMT, bx, by, 0, 0, len(comp))#ブロックヘッダ作成
-                blocks.append(blk_hdr + comp)#ブロックデータ追加
-                nblocks += 1
-                p_bytes_sum += len(blk_hdr) + len(comp)
+        # ブロック毎の SAD を 1 回の配列演算で求める（端の半端なブロックは 0 詰めし、有効画素数で割る）
+        rblks = _to_blocks(diff, blk)#(nby, nbx, blk, blk)
+        sad = np.abs(rblks).sum(axis=(2, 3), dtype=np.int64)#ブロック毎の SAD
+        thr = self.sad_skip_per_px * _valid_px(diff.shape, blk)#スキップ判定の SAD
+
+        # 動き探索（ゼロモーションで変化したブロックのうち、画像内に収まるものだけ）
+        mvy = np.zeros(sad.shape, dtype=np.int32)
+        mvx = np.zeros(sad.shape, dtype=np.int32)
+        if self.me_range > 0 and blk % 2 == 0:#色差の動き補償は dx//2, dy//2 なので偶数ブロックのみ
+            active = sad >= thr
+            active[h // blk:, :] = False
+            active[:, w // blk:] = False
+            ays, axs = np.nonzero(active)
+            if len(ays):
+                dy, dx, _ = _motion_search(y, ref, blk, self.me_range, ays, axs)
+                moved = (dy != 0) | (dx != 0)
+                ays, axs, dy, dx = ays[moved], axs[moved], dy[moved], dx[moved]
+                pred = sliding_window_view(ref, (blk, blk))[ays * blk + dy, axs * blk + dx]#動き補償した予測
+                res = _to_blocks(y, blk)[ays, axs].astype(np.int16) - pred.astype(np.int16)
+                if self.T > 0:
+                    res[np.abs(res) < self.T] = 0
+                rblks[ays, axs] = res
+                sad[ays, axs] = np.abs(res).sum(axis=(1, 2))
+                mvy[ays, axs] = dy
+                mvx[ays, axs] = dx
+        keep = sad >= thr#残差を送るブロック
+
+        # 色差の残差（予測は動きベクトルの 1/2。Y と同じく閾値・スキップ判定し、どちらかが変化したブロックを送る）
+        if self.chroma:
+            cb = blk // 2
+            mys, mxs = np.nonzero((mvy != 0) | (mvx != 0))
+            rc = []
+            sad_c = 0
+            for cur_c, ref_c in ((u, self._refU), (v, self._refV)):
+                dc = cur_c.astype(np.int16) - ref_c.astype(np.int16)
+                cblks = _to_blocks(dc, cb)#(nby, nbx, cb, cb)
+                if len(mys):
+                    pred_c = _chroma_pred(ref_c, cb, mys, mxs, mvy[mys, mxs], mvx[mys, mxs])
+                    cblks[mys, mxs] = _to_blocks(cur_c, cb)[mys, mxs].astype(np.int16) - pred_c.astype(np.int16)
+                if self.T > 0:
+                    cblks[np.abs(cblks) < self.T] = 0
+                sad_c = sad_c + np.abs(cblks).sum(axis=(2, 3), dtype=np.int64)
+                rc.append(cblks)
+            keep |= sad_c >= self.sad_skip_per_px * 2 * _valid_px(u.shape, cb)
+        nblocks = int(np.count_nonzero(keep))
 
-        # --- シーンチェンジ検出 → I昇格 ---
-        changed_ratio = (nblocks / max(1, total_blocks))#変化ブロック率計算
+        # --- シーンチェンジ検出 → I昇格（残差の圧縮より先に判定する） ---
+        changed_ratio = nblocks / keep.size#変化ブロック率計算（動き補償しても残差が残るブロック）
         if changed_ratio > self.scene_change_ratio:#シーンチェンジ判定
-            header = struct.pack(HDR_FMT, MAGIC, VER, 0, 0, w, h, blk, self.T, 0)
-            self._refY = y.copy()
-            return header + jpg_bytes
+            return self._encode_I(frame_bgr, jpeg_quality, yuv)
+
+        # 送るブロックだけ取り出す（行優先 = 従来のループと同じ順）
+        bys, bxs = np.nonzero(keep | (mvy != 0) | (mvx != 0))
+        nblocks = len(bys)
+        sel = rblks[bys, bxs]#(nblocks, blk, blk) int16
+        if self.chroma:
+            sel_u, sel_v = rc[0][bys, bxs], rc[1][bys, bxs]#(nblocks, cb, cb) int16
+            raws = np.concatenate([sel.reshape(nblocks, blk * blk), sel_u.reshape(nblocks, cb * cb), sel_v.reshape(nblocks, cb * cb)], axis=1)
+        else:
+            raws = sel.reshape(nblocks, blk * blk)
+        kept = keep[bys, bxs]#残差を送るブロック（それ以外は動きだけ）
+        dys, dxs = mvy[bys, bxs], mvx[bys, bxs]
+        assert not len(dys) or max(np.abs(dys).max(), np.abs(dxs).max()) <= ME_MAX_RANGE#dx, dy は int8
+        if self.dxf_version == VER_Q:
+            # 量子化して 1 本のストリームにまとめる（参照は量子化後の残差で復元する）
+            q = np.clip(np.rint(raws[kept] / self.qstep), -127, 127).astype(np.int8)
+            stream = b"".join((
+                np.packbits(keep | (mvy != 0) | (mvx != 0)).tobytes(),
+                np.stack([dxs, dys], axis=1).astype(np.int8).tobytes(),
+                np.packbits(kept).tobytes(),
+                q.tobytes(),
+            ))
+            body = struct.pack(P2_HDR_FMT, self.qstep, 0) + zlib.compress(stream, level=self.zlib_level)
+            raws = np.zeros_like(raws)
+            raws[kept] = q.astype(np.int16) * self.qstep
+        else:
+            blocks: List[bytes] = []
+            for i in range(nblocks):
+                by, bx = int(bys[i]), int(bxs[i])
+                comp = zlib.compress(raws[i].tobytes(), level=self.zlib_level) if kept[i] else b""#zlib圧縮（動きだけなら残差なし）
+                blk_hdr = struct.pack(BLK_HDR_FMT, bx * blk, by * blk, int(dxs[i]), int(dys[i]), len(comp))#ブロックヘッダ作成
+                blocks.append(blk_hdr + comp)#ブロックデータ追加
+            body = b"".join(blocks)
+            raws = np.where(kept[:, None], raws, 0)
+        p_bytes_sum = len(body)#Pの総バイト（ブロック列）
 
         # --- サイズ・ゲート → I昇格 ---
+        # JPEG サイズは推定で比べる（推定が無い・古いときだけ実際に作る）
+        jpg: Optional[bytes] = None
+        jpg_size = self._jpeg_size.get((int(jpeg_quality), w, h))
+        self._since_jpeg += 1
+        if jpg_size is None or self.jpeg_gate_refresh <= 0 or self._since_jpeg >= self.jpeg_gate_refresh:
+            jpg = self._jpeg(frame_bgr, jpeg_quality)
+            jpg_size = len(jpg)
         p_total_est = struct.calcsize(HDR_FMT) + p_bytes_sum#Pフレーム総サイズ見積もり
         if p_total_est > self.jpeg_gate_ratio * jpg_size:#iフレームのが小さい場合
-            header = struct.pack(HDR_FMT, MAGIC, VER, 0, 0, w, h, blk, self.T, 0)
-            self._refY = y.copy()
-            return header + jpg_bytes
+            return self._encode_I(frame_bgr, jpeg_quality, yuv, jpg)
 
         # --- Pで送る ---
-        self._refY = y.copy()
-        header = struct.pack(HDR_FMT, MAGIC, VER, 1, 0, w, h, blk, self.T, nblocks)
-        return header + b"".join(blocks)
+        if jpg is None:
+            self.jpeg_skipped += 1
+        self.frames_P += 1
+        self.mv_blocks += int(np.count_nonzero(mvy[bys, bxs] | mvx[bys, bxs]))
+
+        # 参照は受信側と同じ復元結果にする（予測＋送った残差。省いたブロック・残差は参照のまま）
+        # 原画を参照にすると、しきい値未満の変化や動き補償の誤差が受信側だけに溜まっていく
+        pred = sliding_window_view(_pad_to_blocks(ref, blk), (blk, blk))[bys * blk + dys, bxs * blk + dxs]
+        self._refY = _recon_blocks(ref, blk, bys, bxs, pred, raws[:, :blk * blk].reshape(nblocks, blk, blk))
+        flags = 0
+        if self.chroma:
+            flags |= FLAG_CHROMA
+            res_u = raws[:, blk * blk:blk * blk + cb * cb].reshape(nblocks, cb, cb)
+            res_v = raws[:, blk * blk + cb * cb:].reshape(nblocks, cb, cb)
+            self._refU = _recon_blocks(self._refU, cb, bys, bxs, _chroma_pred(self._refU, cb, bys, bxs, dys, dxs), res_u)
+            self._refV = _recon_blocks(self._refV, cb, bys, bxs, _chroma_pred(self._refV, cb, bys, bxs, dys, dxs), res_v)
+        header = struct.pack(HDR_FMT, MAGIC, self.dxf_version, 1, flags, w, h, blk, self.T, nblocks)
+        return header + body
+
+    def stats(self) -> dict:
+        return {
+            "frames_I": self.frames_I,
+            "frames_P": self.frames_P,
+            "jpeg_encodes": self.jpeg_encodes,
+            "jpeg_skipped": self.jpeg_skipped,
+            "mv_blocks_per_P": round(self.mv_blocks / self.frames_P, 1) if self.frames_P else 0.0,
+        }
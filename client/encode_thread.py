@@ -27,6 +27,7 @@ def start_encode_thread(
         frame_id = 0
         last_I_time = time.time()
         codec = diff_codec
+        rst_interval = args.jpeg_rst if args.slices == "on" else 0#スライス分割時はリスタート区間を入れる
 
         # ★ ここでエンコードFPSを決める
         interval = 1.0 / args.fps if getattr(args, "fps", 0) > 0 else 0.0
@@ -68,7 +69,7 @@ def start_encode_thread(
                         last_I_time = now
                 else:
                     # diff=off → そのままJPEG
-                    frame_bytes = encode_jpeg(frame, quality=args.jpeg_quality)
+                    frame_bytes = encode_jpeg(frame, quality=args.jpeg_quality, rst_interval=rst_interval)
 
             except Exception as e:
                 # エラー時のみログ（頻度は低い想定）
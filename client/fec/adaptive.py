@@ -0,0 +1,80 @@
+# adaptive.py --- 受信側の損失レポートから FEC方式・k・r を選ぶ（fec="adaptive"）
+"""
+冗長度の低い順に並べた段階表 LEVELS から、
+  必要冗長度 = 損失率 × safety × max(1, 平均バースト長)
+を満たす最小の段階を選ぶ。悪化時は即座に上げ、改善時は down_after 回続けて
+余裕がある場合に 1 段ずつ下げる（ばたつき防止）。
+
+受信側は v2 ヘッダの scheme / k / r で毎パケット判別するので（fec="auto"）、
+フレーム毎に切り替えても設定変更は要らない。
+"""
+from typing import List, Tuple
+
+# (mode, k, r)  冗長度 r/k の昇順
+LEVELS: List[Tuple[str, int, int]] = [
+    ("none", 8, 0),
+    ("low", 8, 1),
+    ("mid", 8, 2),
+    ("rs", 8, 3),
+    ("high", 8, 4),
+    ("rs", 6, 4),
+]
+DEFAULT_LEVEL = 2
+
+
+class AdaptiveFec:
+    def __init__(self, level: int = DEFAULT_LEVEL, safety: float = 3.0, down_after: int = 4):
+        self.level = min(max(0, int(level)), len(LEVELS) - 1)
+        self.safety = float(safety)
+        self.down_after = max(1, int(down_after))
+        self._good = 0#下げてよいレポートが続いた回数
+
+        self.current: Tuple[str, int, int] = LEVELS[self.level]#send_thread はこれだけ読む
+        self.reports = 0
+        self.switches = 0
+        self.last_loss = 0.0
+
+    def _target(self, loss: float, mean_burst: float) -> int:
+        need = loss * self.safety * max(1.0, mean_burst)
+        for i, (_, k, r) in enumerate(LEVELS):
+            if r / k >= need:
+                return i
+        return len(LEVELS) - 1
+
+    def update(self, received: int, lost: int, max_burst: int, bursts: int) -> None:
+        """損失レポート 1 件を反映する（feedback スレッドから）"""
+        total = received + lost
+        if total <= 0:
+            return
+        self.reports += 1
+        self.last_loss = lost / total
+        mean_burst = lost / bursts if bursts else 0.0
+
+        target = self._target(self.last_loss, mean_burst)
+        level = self.level
+        if target > level:#悪化 → 即座に上げる
+            level = target
+            self._good = 0
+        elif target < level:#改善 → 続いたら 1 段下げる
+            self._good += 1
+            if self._good >= self.down_after:
+                level -= 1
+                self._good = 0
+        else:
+            self._good = 0
+
+        if level != self.level:
+            self.level = level
+            self.current = LEVELS[level]#タプルごと差し替え（送信側は 1 回の参照で読む）
+            self.switches += 1
+
+    def stats(self) -> dict:
+        mode, k, r = self.current
+        return {
+            "mode": mode,
+            "k": k,
+            "r": r,
+            "loss": round(self.last_loss, 4),
+            "reports": self.reports,
+            "switches": self.switches,
+        }
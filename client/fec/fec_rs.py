@@ -0,0 +1,31 @@
+# fec_rs.py --- Reed-Solomon（GF(256) Cauchy 行列）によるFEC。グループ毎に任意の r 個の欠損を復元可能
+from typing import List, Tuple
+
+import numpy as np
+
+from .gf256 import cauchy_matrix, gf_mul_acc
+from .packet_buffer import grouped_items, pack_frame
+from .packet_header import HEADER_VERSION, MAX_PAYLOAD, SCHEME_RS, VER2, header_size
+from .parity import split_groups, stack_groups
+from .slicer import data_chunks
+
+
+def _make_rs_parity(mat: np.ndarray, lens: np.ndarray, k: int, r: int) -> Tuple[np.ndarray, np.ndarray]:
+    """全グループの RS パリティ (G, r, W) と各パリティ長 (G, r) を返す"""
+    C = cauchy_matrix(k, r)
+    G, _, W = mat.shape
+    parity = np.zeros((G, r, W), dtype=np.uint8)
+    for j in range(r):
+        for i in range(k):
+            gf_mul_acc(parity[:, j, :], C[j][i], mat[:, i, :])#p_j ^= C[j][i] * d_i（全グループ同時）
+    plen = np.repeat(lens.max(axis=1, initial=0)[:, None], r, axis=1)#パリティ長はグループ内の最大チャンク長
+    return parity, plen
+
+def make_packets_fec_rs(frame_id: int, frame_bytes: bytes, k: int = 8, r: int = 4, *, version: int = HEADER_VERSION, interleave: int = 1, slices: bool = False, payload: int = MAX_PAYLOAD) -> List[memoryview]:
+    chunk_size = payload - header_size(version)
+    data, flags = data_chunks(frame_bytes, chunk_size, slices and version >= VER2)#チャンク分割（slices は単位境界で）
+    mat, lens = stack_groups(data, chunk_size, k) if flags else split_groups(frame_bytes, chunk_size, k)#グループ分割
+    parity, plen = _make_rs_parity(mat, lens, k, r)
+
+    items, total_data = grouped_items(data, k, parity, plen, interleave)
+    return pack_frame(version, SCHEME_RS, k, r, frame_id, total_data, len(frame_bytes), items, flags)
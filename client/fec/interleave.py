@@ -0,0 +1,75 @@
+# interleave.py --- バースト損失対策のインターリーブ（グループ間・フレーム間）
+"""
+グループ型FEC（mid/high/rs）はグループ毎に [data][parity] を続けて送るので、
+連続 5 パケット程度のバースト損失で 1 グループが丸ごと失われ、フレームが復元できない。
+
+- interleave_groups : フレーム内で depth グループずつ列方向に並べ替える
+                      （g0[0], g1[0], ..., g0[1], g1[1], ...）
+- FrameInterleaver  : 連続する depth フレームのパケットを畳み込み式に混ぜて送る
+
+どちらも送信順を入れ替えるだけで chunk_id は変えないので、受信側の配置表はそのまま使える。
+バーストは多数のグループの単発損失に分散され、各グループのパリティで復元できる。
+"""
+from collections import deque
+from typing import Any, Deque, List, Sequence
+
+
+def _round_robin(lists: Sequence[Sequence[Any]]) -> List[Any]:
+    out: List[Any] = []
+    n = max((len(x) for x in lists), default=0)
+    for i in range(n):
+        for x in lists:
+            if i < len(x):
+                out.append(x[i])
+    return out
+
+
+def interleave_groups(groups: Sequence[Sequence[Any]], depth: int) -> List[Any]:
+    """
+    groups（グループ毎のパケット列）を depth グループ単位のブロックで列方向に並べる。
+    depth <= 0 はフレーム内の全グループ、depth == 1 は並べ替えなし。
+    """
+    if depth <= 0:
+        depth = len(groups)
+    if depth == 1 or len(groups) <= 1:
+        return [p for g in groups for p in g]
+
+    out: List[Any] = []
+    for b in range(0, len(groups), depth):
+        out.extend(_round_robin(groups[b:b + depth]))
+    return out
+
+
+class FrameInterleaver:
+    """
+    フレーム間インターリーブ（畳み込み式）。
+
+    各フレームのパケットを depth 本のスライス（packets[j::depth]）に分け、
+    push() の度に「新しいフレームのスライス0、1つ前のスライス1、...」を交互に並べて返す。
+    送信量はフレーム毎にほぼ一定のまま、1 フレームのパケットが depth フレーム分の時間に散らばる。
+    代わりに各フレームの最後のスライスが出るまで depth-1 フレーム分の遅延が増える。
+    """
+
+    def __init__(self, depth: int = 1):
+        self.depth = max(1, int(depth))
+        self.pending: Deque[Deque[Sequence[Any]]] = deque()#フレーム毎の未送信スライス（古い順）
+
+    def _tick(self) -> List[Any]:
+        slices = [p.popleft() for p in self.pending]
+        while self.pending and not self.pending[0]:#送り切ったフレームを外す
+            self.pending.popleft()
+        return _round_robin(slices)
+
+    def push(self, packets: Sequence[Any]) -> List[Any]:
+        """1 フレーム分のパケット列を入れ、今送るべきパケット列を返す"""
+        if self.depth == 1:
+            return list(packets)
+        self.pending.append(deque(packets[j::self.depth] for j in range(self.depth)))
+        return self._tick()
+
+    def flush(self) -> List[Any]:
+        """残っているスライスを全て返す（フレームが途切れた時に呼ぶ）"""
+        out: List[Any] = []
+        while self.pending:
+            out.extend(self._tick())
+        return out
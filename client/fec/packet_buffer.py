@@ -0,0 +1,103 @@
+# packet_buffer.py --- パケット列を1つのバッファへ直接書き込む共通処理
+import struct
+from typing import Any, List, Sequence, Tuple
+
+from .interleave import interleave_groups
+from .packet_header import HEADER_V1, HEADER_V2, HEADER_V3, MAGIC, VER2, VER3
+
+
+def pack_packets(
+    header: struct.Struct,
+    items: Sequence[Tuple[int, int, Any]],
+    head: tuple = (),
+    tail: tuple = (),
+) -> List[memoryview]:
+    """
+    items の (chunk_id, total_chunks, payload) を、事前確保した 1 つの bytearray に
+    [ヘッダ][ペイロード] の順で書き込み、各パケットの memoryview を返す。
+
+    - ヘッダは header.pack_into(*head, chunk_id, total_chunks, *tail) で直接書くので、
+      パケット毎の bytes 連結や再パックが無い
+    - payload は bytes / memoryview / uint8 の ndarray などバッファプロトコル対応のもの
+    - 戻り値の memoryview はそのまま sock.sendto() に渡せる
+    """
+    hsize = header.size
+    sizes = [hsize + len(p) for _, _, p in items]#各パケット長
+    buf = bytearray(sum(sizes))#フレーム分を一括確保
+    view = memoryview(buf)
+
+    out: List[memoryview] = []
+    off = 0
+    for (cid, total, payload), size in zip(items, sizes):
+        header.pack_into(buf, off, *head, cid, total, *tail)#ヘッダ書き込み
+        view[off + hsize:off + size] = payload#ペイロード書き込み
+        out.append(view[off:off + size])
+        off += size
+    return out
+
+
+def pack_frame(
+    version: int,
+    scheme: int,
+    k: int,
+    r: int,
+    frame_id: int,
+    data_total: int,
+    frame_len: int,
+    items: Sequence[Tuple[int, int, Any]],
+    flags: int = 0,
+) -> List[memoryview]:
+    """ヘッダのバージョンに応じて pack_packets する（v1 は frame_id, chunk_id, total_chunks のみ）"""
+    if version >= VER3:#stream_id は送信時に書き込む
+        return pack_packets(
+            HEADER_V3, items,
+            head=(MAGIC, VER3, scheme, k, r, flags, 0, frame_id),
+            tail=(data_total, frame_len, 0),
+        )
+    if version >= VER2:
+        return pack_packets(
+            HEADER_V2, items,
+            head=(MAGIC, VER2, scheme, k, r, flags, 0, frame_id),
+            tail=(data_total, frame_len),
+        )
+    return pack_packets(HEADER_V1, items, head=(frame_id,))
+
+
+def split_chunks(frame_bytes: bytes, chunk_size: int) -> List[memoryview]:
+    """frame_bytes を chunk_size ごとのデータチャンク（コピーなしの memoryview）に分ける"""
+    mv = memoryview(frame_bytes)
+    return [mv[i:i + chunk_size] for i in range(0, len(frame_bytes), chunk_size)]
+
+
+def grouped_items(
+    data: Sequence[Any],
+    k: int,
+    parity: Any,
+    plen: Any,
+    interleave: int = 1,
+) -> Tuple[List[Tuple[int, int, Any]], int]:
+    """
+    [data×d0][parity×R][data×d1][parity×R]... の並び（mid/high/rs 共通）で items を作る。
+    data はデータチャンク列（split_chunks() またはスライス分割の結果）。
+    parity / plen は (G, R, W) / (G, R)。戻り値は (items, データチャンク数)。
+    interleave != 1 なら chunk_id はそのままで送信順だけ interleave グループ単位で列方向に並べ替える
+    （0 はフレーム内の全グループ）。
+    """
+    G, R = plen.shape
+    total_data = len(data)#データチャンク数
+    total_chunks = total_data + R * G#全パケット数を先に確定
+
+    groups = []
+    next_chunk_id = 0
+    for g in range(G):
+        items = []
+        for i in range(g * k, min((g + 1) * k, total_data)):
+            items.append((next_chunk_id, total_chunks, data[i]))
+            next_chunk_id += 1
+
+        for b in range(R):
+            items.append((next_chunk_id, total_chunks, parity[g, b, :plen[g, b]]))
+            next_chunk_id += 1
+        groups.append(items)
+
+    return interleave_groups(groups, interleave), total_data
@@ -0,0 +1,71 @@
+# packet_header.py --- パケットヘッダ定義（server/fec/packet_header.py と同一仕様）
+"""
+v1: "!IHH"  frame_id, chunk_id, total_chunks（従来形式）
+
+v2: "!2sBBBBBBIHHHI"
+    magic(2)='UV', ver(1)=2, scheme(1), k(1), r(1), flags(1), seq(1),
+    frame_id(4), chunk_id(2), total_chunks(2), data_total(2), frame_len(4)
+    FEC方式・k・r・データチャンク数・フレーム長を載せるので、受信側は推定なしで再構成できる。
+    seq は送信時に 1 パケット毎に +1 する 8bit 通し番号（受信側の損失・バースト長計測用）。
+    パケット生成時は 0 で、send_thread が送信直前に SEQ_OFFSET へ書き込む。
+
+v3: "!2sBBBBBBIHHHIH"
+    v2 の後ろに stream_id(2) を足したもの（ver=3）。同じ送信元から複数カメラを送るときの識別用。
+    パケット生成時は 0 で、send_thread が送信直前に STREAM_OFFSET へ書き込む。
+"""
+import struct
+
+V1_FMT = "!IHH"
+V1_SIZE = struct.calcsize(V1_FMT)
+V2_FMT = "!2sBBBBBBIHHHI"
+V2_SIZE = struct.calcsize(V2_FMT)
+MAGIC = b"UV"
+VER2 = 2
+SEQ_OFFSET = 7  # v2 ヘッダ内の seq の位置
+V3_FMT = V2_FMT + "H"
+V3_SIZE = struct.calcsize(V3_FMT)
+VER3 = 3
+STREAM_OFFSET = V2_SIZE  # v3 ヘッダ内の stream_id の位置
+FRAME_ID_OFFSET = 8      # v2/v3 ヘッダ内の frame_id の位置
+CHUNK_OFFSET = 12        # v2/v3 ヘッダ内の chunk_id の位置
+
+# flags
+FLAG_SLICED = 0x01      # データチャンクが独立復号できる単位で区切られている（slicer.py）
+FLAG_SLICE_JPEG = 0x02  # 単位が JPEG のリスタート区間（欠損は空の区間で埋める）
+FLAG_RESEND = 0x04      # NACK に応じた再送（seq は初回送信時のまま。受信側の損失計測から外す）
+FLAGS_OFFSET = 6        # v2/v3 ヘッダ内の flags の位置
+
+HEADER_VERSION = VER2  # 送信側の既定（旧受信機向けには 1）
+
+# 1 パケット（このヘッダ込みの UDP ペイロード）のバイト数。送信セッション毎に payload で変えられる
+MAX_PAYLOAD = 1048       # 既定（従来値）
+MIN_PAYLOAD = 128
+MAX_UDP_PAYLOAD = 65507  # IPv4 UDP の上限
+JUMBO_PAYLOAD = 8972     # 9000 バイトのジャンボフレーム（IP/UDP ヘッダ 28 バイトを除く）
+
+# FEC方式ID
+SCHEME_NONE = 0
+SCHEME_LOW = 1
+SCHEME_MID = 2
+SCHEME_HIGH = 3
+SCHEME_RS = 4
+SCHEME_IDS = {"none": SCHEME_NONE, "low": SCHEME_LOW, "mid": SCHEME_MID, "high": SCHEME_HIGH, "rs": SCHEME_RS}
+
+HEADER_V1 = struct.Struct(V1_FMT)
+HEADER_V2 = struct.Struct(V2_FMT)
+HEADER_V3 = struct.Struct(V3_FMT)
+STREAM_ID = struct.Struct("!H")
+
+
+def header_size(version: int) -> int:
+    if version >= VER3:
+        return V3_SIZE
+    return V2_SIZE if version >= VER2 else V1_SIZE
+
+
+def check_fec_k(k: int, version: int) -> None:
+    """v2/v3 ヘッダの k は 1 バイトなので 1..255 に限る（範囲外は make_packets の struct.error で送信スレッドが落ちる）"""
+    if k < 1:
+        raise ValueError(f"fec_k must be >= 1 (got {k})")
+    if version >= VER2 and k > 0xFF:
+        raise ValueError(f"fec_k must be 1-255 with header version {version} (got {k})")
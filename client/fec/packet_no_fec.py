@@ -1,24 +1,18 @@
 # packet_no_fec.py
-import struct
+from typing import List
 
-HEADER_FMT = "!IHH"  # !;ネットワーク送信　I;４バイトframe_id H;2バイトchunk_id H;2バイトtotal_chunks
-HEADER_SIZE = struct.calcsize(HEADER_FMT)
-MAX_PAYLOAD = 1048
-DATA_SIZE = MAX_PAYLOAD - HEADER_SIZE
+from .packet_buffer import pack_frame
+from .packet_header import HEADER_VERSION, MAX_PAYLOAD, SCHEME_NONE, VER2, header_size
+from .slicer import data_chunks
 
-def make_packets_no_fec(frame_id: int, frame_bytes: bytes):
-    packets = []
 
-    total_chunks = (len(frame_bytes) + DATA_SIZE - 1) // DATA_SIZE # 切り上げ　分割
-    if total_chunks == 0:
-        total_chunks = 1
+def make_packets_no_fec(frame_id: int, frame_bytes: bytes, *, version: int = HEADER_VERSION, slices: bool = False, payload: int = MAX_PAYLOAD) -> List[memoryview]:
+    data_size = payload - header_size(version)
+    data, flags = data_chunks(frame_bytes, data_size, slices and version >= VER2) # 切り上げ　分割（slices は単位境界で）
+    if not data:
+        data = [b""]
+    total_chunks = len(data)
 
-    for chunk_id in range(total_chunks):
-        start = chunk_id * DATA_SIZE #チャンクの開始位置
-        end = start + DATA_SIZE #チャンクの終了位置
-        payload = frame_bytes[start:end]
+    items = [(chunk_id, total_chunks, chunk) for chunk_id, chunk in enumerate(data)]
 
-        header = struct.pack(HEADER_FMT, frame_id, chunk_id, total_chunks)
-        packets.append(header + payload) #ヘッダとペイロードを結合してパケットにする
-
-    return packets
+    return pack_frame(version, SCHEME_NONE, 0, 0, frame_id, total_chunks, len(frame_bytes), items, flags) #ヘッダとペイロードを1つのバッファに書き込む
@@ -0,0 +1,83 @@
+# parity.py --- FEC パケット化共通の XOR パリティ計算（NumPy 一括版）
+import numpy as np
+from typing import Sequence, Tuple
+
+WORD = 8  # uint64 単位で XOR するため、行幅は 8 バイト境界に切り上げる
+
+
+def split_groups(frame_bytes: bytes, chunk_size: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    frame_bytes を chunk_size ごとのチャンクに分け、k チャンクずつのグループ行列にする。
+
+    戻り値:
+        chunks: (G, k, W) の uint8 配列。W は chunk_size を WORD 境界に切り上げた幅。
+                短い末尾チャンクや最終グループの空き行はゼロ埋め。
+        lens:   (G, k) の各チャンク実長（空き行は 0）
+    """
+    n = len(frame_bytes)
+    total = (n + chunk_size - 1) // chunk_size #データチャンク数
+    G = (total + k - 1) // k #グループ数
+    W = (chunk_size + WORD - 1) // WORD * WORD
+
+    chunks = np.zeros((G * k, W), dtype=np.uint8)
+    lens = np.zeros(G * k, dtype=np.int64)
+    if total:
+        flat = np.frombuffer(frame_bytes, dtype=np.uint8)
+        full = n // chunk_size #満杯のチャンク数
+        chunks[:full, :chunk_size] = flat[:full * chunk_size].reshape(full, chunk_size)
+        lens[:full] = chunk_size
+        if full < total:#末尾の短いチャンク
+            rest = n - full * chunk_size
+            chunks[full, :rest] = flat[full * chunk_size:]
+            lens[full] = rest
+
+    return chunks.reshape(G, k, W), lens.reshape(G, k)
+
+
+def stack_groups(data: Sequence[bytes], chunk_size: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    長さがまちまちなデータチャンク列（スライス分割など、各 chunk_size 以下）から
+    split_groups() と同じ (G, k, W) 行列と (G, k) の実長を作る。
+    """
+    total = len(data)
+    G = (total + k - 1) // k
+    W = (chunk_size + WORD - 1) // WORD * WORD
+
+    chunks = np.zeros((G * k, W), dtype=np.uint8)
+    lens = np.zeros(G * k, dtype=np.int64)
+    for i, d in enumerate(data):
+        n = len(d)
+        chunks[i, :n] = np.frombuffer(d, dtype=np.uint8)
+        lens[i] = n
+
+    return chunks.reshape(G, k, W), lens.reshape(G, k)
+
+
+def xor_parity(chunks: np.ndarray, lens: np.ndarray, coef: np.ndarray, min_len: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    全グループのパリティ行を一括で計算する。
+
+    chunks: split_groups() の (G, k, W)
+    lens:   split_groups() の (G, k)
+    coef:   (R, k) の 0/1 係数。パリティ行 j はグループ内の coef[j, i] == 1 のチャンク i の XOR
+    min_len: パリティ長の下限（従来実装の b"\\x00" 初期値に合わせるため）
+
+    戻り値:
+        parity: (G, R, W) の uint8
+        plen:   (G, R) の各パリティ実長（対象チャンクの最大長、最低 min_len）
+    """
+    G, k, W = chunks.shape
+    coef = np.asarray(coef, dtype=bool)
+    R = coef.shape[0]
+
+    words = chunks.view(np.uint64)#8バイト単位でXOR
+    parity = np.zeros((G, R, W // WORD), dtype=np.uint64)
+    plen = np.zeros((G, R), dtype=np.int64)
+    for j in range(R):
+        cols = np.flatnonzero(coef[j, :k])#このパリティに含めるチャンク
+        if cols.size == 0:
+            continue
+        parity[:, j, :] = np.bitwise_xor.reduce(words[:, cols, :], axis=1)
+        plen[:, j] = lens[:, cols].max(axis=1)
+
+    return parity.view(np.uint8), np.maximum(plen, min_len)
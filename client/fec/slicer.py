@@ -0,0 +1,148 @@
+# slicer.py --- 独立に復号できる単位（スライス）境界でのチャンク分割
+"""
+通常のパケット化はフレームを chunk_size で機械的に切るので、1 パケット欠けるとフレーム全体が使えない。
+スライス分割では各データチャンクが「丸ごとの単位」だけを運ぶ:
+
+  - JPEG（diff=off / DXF の Iフレーム）: リスタート区間（RSTn マーカーで区切られたエントロピー符号）
+  - DXF の Pフレーム: BLK_HDR_FMT のブロック（ヘッダ＋圧縮残差）。ver=2（フレームで 1 本の zlib）は分けられない
+
+チャンク0 はフレームヘッダ部（DXF ヘッダ・JPEG ヘッダ〜SOS）を運ぶ。
+受信側はチャンク0 さえあれば、欠けた単位を埋めて（JPEG は空のリスタート区間、DXF は省略）
+部分フレームを復号できる（server/fec/slices.py）。
+
+各チャンクの先頭には SLICE_FMT を付ける:
+    first_unit(2), n_units(2), length(2)   length は SLICE 以降の実バイト数（復元時の末尾ゼロ埋め除去用）
+    チャンク0 は first_unit = HEAD_UNIT、n_units = 全単位数
+"""
+import struct
+from typing import Any, List, Optional, Tuple
+
+from .packet_buffer import split_chunks
+from .packet_header import FLAG_SLICED, FLAG_SLICE_JPEG
+
+SLICE_FMT = "!HHH"
+SLICE_SIZE = struct.calcsize(SLICE_FMT)
+HEAD_UNIT = 0xFFFF
+_SLICE = struct.Struct(SLICE_FMT)
+
+# ===== diffproc_fixed.py と同じ DXF 仕様（自前定義） =====
+DXF_HDR_FMT = "!4sBBHHHBBH"  # magic, ver, frame_type, reserved, w, h, block, T, nblocks
+DXF_HDR_SIZE = struct.calcsize(DXF_HDR_FMT)
+DXF_MAGIC = b"DXF0"
+DXF_VER = 1                  # ブロック単位の P フレーム（ver=2 は 1 本のストリーム）
+BLK_HDR_FMT = "!HHbbH"       # bx, by, dx, dy, datalen
+BLK_HDR_SIZE = struct.calcsize(BLK_HDR_FMT)
+# ==========================================================
+
+_SOI = b"\xff\xd8"
+_SOS = 0xDA
+
+
+def _jpeg_units(jpg: memoryview) -> Optional[Tuple[int, List[memoryview]]]:
+    """JPEG を (ヘッダ長, [リスタート区間...]) に分ける。RST マーカーが無ければ None"""
+    if bytes(jpg[:2]) != _SOI:
+        return None
+    i = 2
+    n = len(jpg)
+    while i + 4 <= n:#SOS セグメントの終わりまでがヘッダ
+        if jpg[i] != 0xFF:
+            return None
+        marker = jpg[i + 1]
+        seg_len = (jpg[i + 2] << 8) | jpg[i + 3]
+        i += 2 + seg_len
+        if marker == _SOS:
+            break
+    else:
+        return None
+
+    # 単位 = 区間データ + 直後の RSTn（最後の単位は EOI まで）
+    ent = bytes(jpg[i:])
+    units: List[memoryview] = []
+    start = 0
+    pos = ent.find(b"\xff")
+    while 0 <= pos < len(ent) - 1:
+        if 0xD0 <= ent[pos + 1] <= 0xD7:#RSTn（0xFF00 はバイトスタッフィング）
+            units.append(jpg[i + start:i + pos + 2])
+            start = pos + 2
+        pos = ent.find(b"\xff", pos + 1)
+    if not units:
+        return None
+    units.append(jpg[i + start:])
+    return i, units
+
+
+def _dxf_blocks(frame: memoryview, nblocks: int) -> Optional[List[memoryview]]:
+    units: List[memoryview] = []
+    off = DXF_HDR_SIZE
+    for _ in range(nblocks):
+        if off + BLK_HDR_SIZE > len(frame):
+            return None
+        datalen = (frame[off + 6] << 8) | frame[off + 7]
+        end = off + BLK_HDR_SIZE + datalen
+        units.append(frame[off:end])
+        off = end
+    return units
+
+
+def _pack(prefix: memoryview, units: List[memoryview], chunk_size: int) -> Optional[List[bytes]]:
+    cap = chunk_size - SLICE_SIZE
+    if len(prefix) > cap or len(units) >= HEAD_UNIT:
+        return None
+
+    chunks = [_SLICE.pack(HEAD_UNIT, len(units), len(prefix)) + prefix]
+    first, body = 0, []
+    size = 0
+    for u, unit in enumerate(units):
+        if len(unit) > cap:#1 単位がチャンクに収まらない → スライス分割しない
+            return None
+        if size + len(unit) > cap:
+            chunks.append(_SLICE.pack(first, u - first, size) + b"".join(body))
+            first, body, size = u, [], 0
+        body.append(unit)
+        size += len(unit)
+    if body:
+        chunks.append(_SLICE.pack(first, len(units) - first, size) + b"".join(body))
+    return chunks
+
+
+def slice_frame(frame_bytes: bytes, chunk_size: int) -> Optional[Tuple[List[bytes], int]]:
+    """
+    frame_bytes（DXF または JPEG）を単位境界でデータチャンク列に分け、(chunks, flags) を返す。
+    単位が見つからない・1 単位が chunk_size を超えるなどで分けられなければ None（通常分割に戻す）。
+    """
+    mv = memoryview(frame_bytes)
+    if bytes(mv[:4]) == DXF_MAGIC and len(mv) >= DXF_HDR_SIZE:
+        _m, ver, ftype, _res, _w, _h, _blk, _T, nblocks = struct.unpack_from(DXF_HDR_FMT, mv)
+        if ftype == 1:#Pフレーム: ブロック単位
+            if ver != DXF_VER:#フレームで 1 本の zlib ストリーム → 通常分割
+                return None
+            units = _dxf_blocks(mv, nblocks)
+            if units is None:
+                return None
+            chunks = _pack(mv[:DXF_HDR_SIZE], units, chunk_size)
+            return None if chunks is None else (chunks, FLAG_SLICED)
+        jpg = _jpeg_units(mv[DXF_HDR_SIZE:])#Iフレーム: DXF ヘッダ＋JPEG
+        if jpg is None:
+            return None
+        head, units = jpg
+        chunks = _pack(mv[:DXF_HDR_SIZE + head], units, chunk_size)
+        return None if chunks is None else (chunks, FLAG_SLICED | FLAG_SLICE_JPEG)
+
+    jpg = _jpeg_units(mv)
+    if jpg is None:
+        return None
+    head, units = jpg
+    chunks = _pack(mv[:head], units, chunk_size)
+    return None if chunks is None else (chunks, FLAG_SLICED | FLAG_SLICE_JPEG)
+
+
+def data_chunks(frame_bytes: bytes, chunk_size: int, slices: bool) -> Tuple[List[Any], int]:
+    """
+    パケット化に使うデータチャンク列と v2 ヘッダの flags を返す。
+    slices=True でスライス分割できればその結果、できなければ chunk_size 固定分割（flags=0）。
+    """
+    if slices:
+        res = slice_frame(frame_bytes, chunk_size)
+        if res is not None:
+            return res
+    return split_chunks(frame_bytes, chunk_size), 0
@@ -0,0 +1,50 @@
+# feedback_thread.py
+import threading
+import socket
+import struct
+from typing import Optional
+
+from .fec.adaptive import AdaptiveFec
+from .retransmit import Retransmitter
+
+# 受信側の損失レポート（server/feedback.py と同じ仕様）
+FB_FMT = "!2sBBIIIHH"  # magic, ver, reserved, window, received, lost, max_burst, bursts
+FB_MAGIC = b"UF"
+FB_VER = 1
+_FB = struct.Struct(FB_FMT)
+
+
+def start_feedback_thread(
+    sock: socket.socket,
+    stop_flag: threading.Event,
+    fec_ctrl: Optional[AdaptiveFec] = None,
+    retx: Optional[Retransmitter] = None,
+) -> threading.Thread:
+    """
+    送信ソケットに返ってくる損失レポートを受け取り、fec_ctrl に反映するスレッド。
+    retx があれば NACK も受け、要求されたチャンクを再送する。
+    sock にはタイムアウトを設定しておくこと（停止フラグを確認するため）。
+    """
+
+    def feedback_loop():
+        while not stop_flag.is_set():
+            try:
+                msg, addr = sock.recvfrom(2048)
+            except socket.timeout:
+                continue
+            except OSError:
+                # ソケットクローズ時など
+                break
+
+            if retx is not None and retx.on_nack(msg, addr):#再送要求
+                continue
+            if fec_ctrl is None or len(msg) != _FB.size or msg[:2] != FB_MAGIC:
+                continue
+            _magic, ver, _res, _window, received, lost, max_burst, bursts = _FB.unpack(msg)
+            if ver != FB_VER:
+                continue
+            fec_ctrl.update(received, lost, max_burst, bursts)
+
+    t = threading.Thread(target=feedback_loop, daemon=True)
+    t.start()
+    return t
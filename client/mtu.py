@@ -0,0 +1,74 @@
+# mtu.py --- 断片化せずに届く最大パケット長の推定（payload="auto"）
+"""
+IP_MTU_DISCOVER=IP_PMTUDISC_DO（DF ビット）のソケットを宛先へ connect し、カーネルの経路 MTU（IP_MTU）を読む。
+経路 MTU より大きいプローブを送ると EMSGSIZE になり、途中のルータからの ICMP（Fragmentation Needed）で
+経路 MTU が下がるので、変化しなくなるまで数回繰り返す。
+
+プローブは宛先 IP の discard ポート（9）へ送る（経路 MTU は IP 単位なので受信側の映像ポートを汚さない）。
+結果は max_payload（既定はジャンボフレーム 9000 バイト分）で頭打ちにする（ループバックは 64KB になるため）。
+Linux 以外・オプションが無い環境では fallback を返す。
+"""
+import errno
+import socket
+import time
+from typing import Iterable
+
+from .fec.packet_header import JUMBO_PAYLOAD, MAX_PAYLOAD, MAX_UDP_PAYLOAD, MIN_PAYLOAD
+
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)  # linux/in.h
+IP_PMTUDISC_DO = getattr(socket, "IP_PMTUDISC_DO", 2)
+IP_MTU = getattr(socket, "IP_MTU", 14)
+IPV4_UDP_OVERHEAD = 28  # IP(20) + UDP(8)
+PROBE_PORT = 9
+PROBE_ROUNDS = 4
+PROBE_WAIT = 0.05       # ICMP を待つ秒数（1 回あたり）
+
+
+def probe_payload(host: str, max_payload: int = JUMBO_PAYLOAD, fallback: int = MAX_PAYLOAD) -> int:
+    """host まで断片化せずに届く UDP ペイロード長（このヘッダ込み）を返す"""
+    try:
+        ip = socket.gethostbyname(host)
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    except OSError:
+        return fallback
+    try:
+        s.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+        s.connect((ip, PROBE_PORT))
+        mtu = s.getsockopt(socket.IPPROTO_IP, IP_MTU)#最初はインターフェース MTU（キャッシュ済みなら経路 MTU）
+        for _ in range(PROBE_ROUNDS):
+            size = min(max_payload, mtu - IPV4_UDP_OVERHEAD)
+            try:
+                s.send(bytes(size))
+            except OSError as e:
+                if e.errno not in (errno.EMSGSIZE, errno.ECONNREFUSED):
+                    break
+            time.sleep(PROBE_WAIT)
+            try:
+                new = s.getsockopt(socket.IPPROTO_IP, IP_MTU)
+            except OSError:
+                break
+            if new >= mtu:
+                break
+            mtu = new
+    except OSError:
+        return fallback
+    finally:
+        s.close()
+    return max(MIN_PAYLOAD, min(max_payload, mtu - IPV4_UDP_OVERHEAD))
+
+
+def probe_destinations(hosts: Iterable[str], max_payload: int = JUMBO_PAYLOAD, fallback: int = MAX_PAYLOAD) -> int:
+    """全送信先に届く長さ（最小値）"""
+    sizes = [probe_payload(h, max_payload, fallback) for h in set(hosts)]
+    return min(sizes) if sizes else fallback
+
+
+def resolve_payload(payload, hosts: Iterable[str]) -> int:
+    """payload（バイト数 or "auto"）を 1 パケットのバイト数にする。範囲外なら ValueError"""
+    if isinstance(payload, str):
+        if payload == "auto":
+            return probe_destinations(hosts)
+        payload = int(payload)
+    if not MIN_PAYLOAD <= payload <= MAX_UDP_PAYLOAD:
+        raise ValueError(f"payload は {MIN_PAYLOAD}〜{MAX_UDP_PAYLOAD} バイトか \"auto\" です")
+    return payload
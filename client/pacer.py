@@ -0,0 +1,88 @@
+# pacer.py --- 送信ペーシング（トークンバケット）
+"""
+1 フレーム分のパケットを回線速度で一気に送ると、スイッチや受信側ソケットのバッファが溢れて
+バースト損失になる。burst パケットずつに分け、各送信の前に wait() で送信時刻まで待つ。
+
+  rate   : 一定レート（Mbps）
+  spread : 1 フレーム分を spread_ms ミリ秒に均等に広げる（レートはフレーム毎に決まる）
+  auto   : spread をフレーム間隔 × auto_ratio にする（fps から自動）
+
+待ちは time.monotonic() の仮想時計（次に送ってよい時刻）と time.sleep で行い、ビジーウェイトしない。
+MIN_SLEEP 未満の遅れは待たずに送る（次の待ちで吸収される）。
+バケットの深さは burst パケット分で、しばらく送らなかった後もそれ以上はまとめて送らない。
+"""
+import time
+from typing import Sequence
+
+MIN_SLEEP = 0.0002   # これより短い待ちは sleep しない（秒）
+DEFAULT_BURST = 4    # 1 回の送信（GSO / sendmmsg）にまとめるパケット数
+MIN_RATE = 1e5       # spread / auto のレート下限（バイト/秒。小さいフレームで待ちすぎないため）
+
+
+def packets_bytes(packets: Sequence) -> int:
+    return sum(len(p) for p in packets)
+
+
+class Pacer:
+    def __init__(
+        self,
+        rate_mbps: float = 0.0,
+        spread_ms: float = 0.0,
+        auto_ratio: float = 0.0,
+        fps: float = 25.0,
+        burst: int = DEFAULT_BURST,
+    ):
+        if rate_mbps > 0:
+            self.mode = "rate"
+        elif spread_ms > 0:
+            self.mode = "spread"
+        elif auto_ratio > 0:
+            self.mode = "auto"
+        else:
+            raise ValueError("pacing には rate_mbps / spread_ms / auto_ratio のどれかが必要です")
+        self.burst = max(1, int(burst))
+        self.rate = rate_mbps * 1e6 / 8 if self.mode == "rate" else MIN_RATE#バイト/秒
+        if self.mode == "spread":
+            self.spread = spread_ms / 1000.0
+        elif self.mode == "auto":
+            self.spread = float(auto_ratio) / max(1.0, float(fps))
+        else:
+            self.spread = 0.0
+        self._next = 0.0#次に送ってよい時刻（monotonic）
+
+        # 統計
+        self.frames = 0
+        self.bytes = 0
+        self.sleeps = 0
+        self.slept = 0.0
+
+    def begin_frame(self, nbytes: int) -> None:
+        """1 フレーム分（全送信先の合計）を送る前に呼ぶ。spread / auto はここでレートを決める"""
+        self.frames += 1
+        if self.spread > 0 and nbytes > 0:
+            self.rate = max(MIN_RATE, nbytes / self.spread)
+
+    def wait(self, nbytes: int) -> None:
+        """nbytes を送ってよい時刻まで待つ"""
+        now = time.monotonic()
+        depth = self.burst * 1500 / self.rate#バケットの深さ（秒換算）
+        if self._next < now - depth:#しばらく送っていない → 溜められるのはバケット分まで
+            self._next = now - depth
+        delay = self._next - now
+        if delay >= MIN_SLEEP:
+            time.sleep(delay)
+            self.sleeps += 1
+            self.slept += delay
+        self._next += nbytes / self.rate
+        self.bytes += nbytes
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "rate_mbps": round(self.rate * 8 / 1e6, 2),
+            "spread_ms": round(self.spread * 1000, 2),
+            "burst": self.burst,
+            "frames": self.frames,
+            "sleeps": self.sleeps,
+            "slept_ms_per_frame": round(self.slept * 1000 / self.frames, 2) if self.frames else 0.0,
+        }
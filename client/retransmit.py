@@ -0,0 +1,121 @@
+# retransmit.py --- 受信側の NACK に応じた選択再送（server/nack.py と同一仕様）
+"""
+send_thread が送ったパケット（フレーム単位、memoryview のまま）を直近 max_frames フレーム分保持し、
+受信側から NACK が届いたら要求されたチャンクだけ送り直す。
+送ってから max_age 秒を過ぎたフレームは受信側で間に合わないので再送しない。
+
+NACK: "!2sBBIH" + "H" × count
+    magic(2)='UN', ver(1)=1, reserved(1), frame_id(4), count(2), chunk_id(2) × count
+
+v2/v3 ヘッダのみ（chunk_id を CHUNK_OFFSET から読む）。FEC と併用でき、fec="none" なら再送だけで損失を埋める。
+再送するパケットは flags に FLAG_RESEND を立てたコピー（seq は初回のままなので、受信側の損失計測から外させる）。
+"""
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Tuple
+
+from .fec.packet_header import CHUNK_OFFSET, FLAG_RESEND, FLAGS_OFFSET
+
+NK_FMT = "!2sBBIH"
+NK_MAGIC = b"UN"
+NK_VER = 1
+_NK = struct.Struct(NK_FMT)
+_CHUNK = struct.Struct("!H")
+
+DEFAULT_MAX_FRAMES = 64
+DEFAULT_MAX_AGE = 0.2  # 秒
+
+
+class Retransmitter:
+    def __init__(self, sock: socket.socket, max_frames: int = DEFAULT_MAX_FRAMES, max_age: float = DEFAULT_MAX_AGE):
+        self.sock = sock
+        self.max_frames = max(1, int(max_frames))
+        self.max_age = float(max_age)
+        self._lock = threading.Lock()#send スレッドが store、feedback スレッドが on_nack
+        # (送信先グループ, frame_id) → (送信時刻, chunk_id → パケット)
+        self._frames: "OrderedDict[Tuple[int, int], Tuple[float, Dict[int, memoryview]]]" = OrderedDict()
+        self._groups: Dict[Tuple[str, int], int] = {}#送信先アドレス → グループ
+        self._ngroups = 0
+
+        # 統計
+        self.packets_sent = 0#キャッシュした（= 初回送信した）パケット数
+        self.nacks = 0
+        self.requested = 0
+        self.resent = 0
+        self.expired = 0#max_age を過ぎていて再送しなかったチャンク数
+        self.missing = 0#キャッシュから落ちていたチャンク数
+
+    def register(self, addrs: Sequence[Tuple[str, int]]) -> int:
+        """同じパケット列を送る送信先の集まりを登録し、グループ番号を返す"""
+        gid = self._ngroups
+        self._ngroups += 1
+        for addr in addrs:
+            self._groups[(socket.gethostbyname(addr[0]), addr[1])] = gid#NACK は IP で届く
+        return gid
+
+    def store(self, gid: int, frame_id: int, packets: Sequence[memoryview]) -> None:
+        """送信するパケット列を保持する（send スレッドから。インターリーブ前のフレーム単位）"""
+        chunks = {_CHUNK.unpack_from(pkt, CHUNK_OFFSET)[0]: pkt for pkt in packets}
+        with self._lock:
+            self._frames[(gid, frame_id)] = (time.monotonic(), chunks)
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+            self.packets_sent += len(chunks)
+
+    def on_nack(self, msg: bytes, addr: Tuple[str, int]) -> bool:
+        """NACK なら要求されたチャンクを addr へ再送して True（feedback スレッドから）"""
+        if len(msg) < _NK.size or msg[:2] != NK_MAGIC:
+            return False
+        _magic, ver, _res, frame_id, count = _NK.unpack_from(msg)
+        if ver != NK_VER or len(msg) < _NK.size + 2 * count:
+            return True
+        chunk_ids = struct.unpack_from(f"!{count}H", msg, _NK.size)
+
+        gid = self._groups.get(addr)
+        if gid is None:
+            if self._ngroups != 1:#どのパケット列か分からない
+                return True
+            gid = 0#マルチキャストのメンバーなど（ユニキャストで返す）
+
+        with self._lock:
+            self.nacks += 1
+            self.requested += count
+            entry = self._frames.get((gid, frame_id))
+            if entry is None:
+                self.missing += count
+                return True
+            sent_ts, chunks = entry
+            if time.monotonic() - sent_ts > self.max_age:#受信側で間に合わない
+                self.expired += count
+                return True
+            packets: List[memoryview] = []
+            for cid in chunk_ids:
+                pkt = chunks.get(cid)
+                if pkt is None:
+                    self.missing += 1
+                else:
+                    packets.append(pkt)
+
+        for pkt in packets:
+            pkt = bytearray(pkt)#キャッシュ（インターリーブ待ちで未送信のこともある）は書き換えない
+            pkt[FLAGS_OFFSET] |= FLAG_RESEND
+            try:
+                self.sock.sendto(pkt, addr)
+            except OSError:
+                break
+            self.resent += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "nacks": self.nacks,
+            "requested": self.requested,
+            "resent": self.resent,
+            "expired": self.expired,
+            "missing": self.missing,
+            # 初回送信に対する再送パケットの割合（FEC の冗長度と比べる）
+            "overhead": round(self.resent / self.packets_sent, 4) if self.packets_sent else 0.0,
+        }
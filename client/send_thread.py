@@ -3,31 +3,122 @@ import threading
 import queue
 import socket
 import struct
-from typing import Tuple
+from typing import List, Optional, Tuple
 
+from .destinations import Destination, group_by_fec
+from .fec.adaptive import AdaptiveFec
 from .fec.fec_low import make_packets_lrc
 from .fec.fec_medium import make_packets_fec_medium
 from .fec.fec_high import make_packets_fec_high
+from .fec.fec_rs import make_packets_fec_rs
+from .fec.interleave import FrameInterleaver
+from .fec.packet_header import MAX_PAYLOAD, SEQ_OFFSET, STREAM_ID, STREAM_OFFSET, VER3
 from .fec.packet_no_fec import make_packets_no_fec
+from .pacer import Pacer, packets_bytes
+from .retransmit import Retransmitter
+from .udp_batch import BatchSender
 
 # FECなし用のヘッダ定義（元 client.py と同じ仕様）
 HEADER_FMT = "!IHH"  # frame_id, chunk_id, total_chunks
 HEADER_SIZE = struct.calcsize(HEADER_FMT)
-MAX_PAYLOAD = 1048
 DATA_SIZE = MAX_PAYLOAD - HEADER_SIZE
 
 
+def make_packets(fec: str, k: int, r: int, frame_id: int, frame_bytes: bytes, args, slices: bool):
+    """FEC none/low/mid/high/rs に応じたパケット列を作る（1 パケットは args.payload バイト以下）"""
+    version = args.header_version
+    interleave = args.interleave
+    payload = args.payload
+
+    if fec == "none":
+        return make_packets_no_fec(frame_id, frame_bytes, version=version, slices=slices, payload=payload)
+
+    elif fec == "low":
+        return make_packets_lrc(frame_bytes, k=k, frame_id=frame_id, version=version, slices=slices, payload=payload)
+
+    elif fec == "mid":
+        return make_packets_fec_medium(frame_id, frame_bytes, k=k, version=version, interleave=interleave, slices=slices, payload=payload)
+
+    elif fec == "high":
+        return make_packets_fec_high(frame_id, frame_bytes, k=k, version=version, interleave=interleave, slices=slices, payload=payload)
+
+    elif fec == "rs":
+        return make_packets_fec_rs(frame_id, frame_bytes, k=k, r=r, version=version, interleave=interleave, slices=slices, payload=payload)
+
+    # 不明な指定の場合はいったん FECなしで送る
+    return make_packets_no_fec(frame_id, frame_bytes, version=version, slices=slices, payload=payload)
+
+
+class _FecGroup:
+    """同じ FEC で送る送信先の集まり（パケット列・seq・フレーム間インターリーブを共有）"""
+
+    def __init__(self, fec: Optional[str], addrs: List[Tuple[str, int]], interleave_frames: int, gid: int = 0):
+        self.fec = fec
+        self.addrs = addrs
+        self.interleaver = FrameInterleaver(interleave_frames)
+        self.seq = 0
+        self.gid = gid#Retransmitter のグループ番号
+
+
 def start_send_thread(
     encoded_buffer: "queue.Queue[Tuple[int, bytes]]",
     stop_flag: threading.Event,
     args,
     server_addr,
     sock: socket.socket,
+    fec_ctrl: Optional[AdaptiveFec] = None,
+    tx: Optional[BatchSender] = None,
+    destinations: Optional[List[Destination]] = None,
+    retx: Optional[Retransmitter] = None,
+    pacer: Optional[Pacer] = None,
 ) -> threading.Thread:
     """
     encoded_buffer から (frame_id, frame_bytes) を取り出し、
-    FEC none/low/mid/high に応じたパケット列を生成し、UDP送信するスレッド。
+    FEC none/low/mid/high/rs に応じたパケット列を生成し、UDP送信するスレッド。
+    args.interleave（グループ間）/ args.interleave_frames（フレーム間）で送信順をインターリーブする。
+    fec_ctrl があれば（fec="adaptive"）フレーム毎に fec_ctrl.current の (mode, k, r) で送る。
+    送信は tx（BatchSender、省略時は args.send_batch で作る）で 1 フレーム分をまとめて行う。
+
+    destinations（(ip, port, fec) のリスト）があれば server_addr の代わりに全送信先へ送る。
+    パケット列は FEC 毎に 1 回だけ作り、同じバッファを各送信先へ送る（fec None は args.fec）。
+    retx があれば送ったパケットを保持し、NACK に応じて再送できるようにする。
+    pacer があれば pacer.burst パケットずつ、送信時刻を待ちながら送る（マイクロバースト対策）。
     """
+    if tx is None:
+        tx = BatchSender(sock, args.send_batch)
+    if destinations is None:
+        destinations = [(server_addr[0], server_addr[1], None)]
+    slices = args.slices == "on"#独立復号できる単位境界で分割（v2 ヘッダのみ）
+    groups = [
+        _FecGroup(fec, addrs, args.interleave_frames, retx.register(addrs) if retx is not None else 0)
+        for fec, addrs in group_by_fec(destinations, args.fec)
+    ]
+    stamp_seq = args.header_version >= 2
+    stream_id = args.stream_id if args.header_version >= VER3 else None#v3 はヘッダに stream_id を載せる
+
+    def send_packets(group: _FecGroup, packets):
+        if not packets:
+            return
+        if stamp_seq:#送信順の通し番号をヘッダに書き込む（受信側の損失計測用。同じ FEC の送信先には同じ列が届く）
+            seq = group.seq
+            for pkt in packets:
+                pkt[SEQ_OFFSET] = seq
+                seq = (seq + 1) & 0xFF
+            group.seq = seq
+        if stream_id:
+            for pkt in packets:
+                STREAM_ID.pack_into(pkt, STREAM_OFFSET, stream_id)
+        # UDP 送信（packets は 1 つのバッファを指す memoryview 列なので GSO / sendmmsg にそのまま渡せる）
+        if pacer is None:
+            for addr in group.addrs:
+                tx.send(packets, addr)
+            return
+        for i in range(0, len(packets), pacer.burst):#burst パケットずつ時刻を待って送る
+            burst = packets[i:i + pacer.burst]
+            nbytes = packets_bytes(burst)
+            for addr in group.addrs:
+                pacer.wait(nbytes)
+                tx.send(burst, addr, new_frame=i == 0)
 
     def send_loop():
         while not stop_flag.is_set():
@@ -35,33 +126,29 @@ def start_send_thread(
             try:
                 frame_id, frame_bytes = encoded_buffer.get(timeout=0.1)
             except queue.Empty:
-                # しばらくフレームが来ないだけなのでループ継続
+                # しばらくフレームが来ない → フレーム間インターリーブの残りを送り切ってループ継続
+                for group in groups:
+                    send_packets(group, group.interleaver.flush())
                 continue
 
-            # FEC 分岐
-            if args.fec == "none":
-                packets = make_packets_no_fec(frame_id, frame_bytes)
+            out = []
+            for group in groups:
+                # FEC 分岐（adaptive は受信側レポートに応じてフレーム毎に切り替わる）
+                fec = group.fec or args.fec
+                if fec == "adaptive" and fec_ctrl is not None:
+                    fec, k, r = fec_ctrl.current
+                else:
+                    k, r = args.fec_k, args.fec_r
 
-            elif args.fec == "low":
-                packets = make_packets_lrc(frame_bytes, k=args.fec_k, frame_id=frame_id)
+                packets = make_packets(fec, k, r, frame_id, frame_bytes, args, slices)
+                if retx is not None:
+                    retx.store(group.gid, frame_id, packets)
+                out.append((group, group.interleaver.push(packets)))
 
-            elif args.fec == "mid":
-                packets = make_packets_fec_medium(frame_id, frame_bytes, k=args.fec_k)
-
-            elif args.fec == "high":
-                packets = make_packets_fec_high(frame_id, frame_bytes, k=args.fec_k)
-
-            else:
-                # 不明な指定の場合はいったん FECなしで送る
-                packets = make_packets_no_fec(frame_id, frame_bytes)
-
-            # UDP 送信
-            for pkt in packets:
-                try:
-                    sock.sendto(pkt, server_addr)
-                except OSError as e:
-                    print("[SEND] send error:", e)
-                    break
+            if pacer is not None:#spread / auto は全送信先の合計をフレーム間隔内に広げる
+                pacer.begin_frame(sum(packets_bytes(p) * len(g.addrs) for g, p in out))
+            for group, packets in out:
+                send_packets(group, packets)
 
     t = threading.Thread(target=send_loop, daemon=True)
     t.start()
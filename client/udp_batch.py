@@ -0,0 +1,234 @@
+# udp_batch.py --- 1フレーム分のパケットを少ないシステムコールで送る
+"""
+mode:
+  gso : Linux UDP GSO。同じ長さで連続するパケット（最後の 1 個だけ短くてよい）を
+        1 回の sendmsg（UDP_SEGMENT）で渡し、カーネル / NIC が個別のデータグラムに分ける
+  mmsg: sendmmsg(2) で最大 MMSG_MAX 個のパケットを 1 回で送る（ctypes 経由、Linux のみ）
+  loop: 従来どおり 1 パケット毎に sendto
+  auto: gso → mmsg → loop の順に使えるものを使う
+
+GSO で束ねられない単発パケット（長さの違うパリティ・スライス等）は sendto で送る
+（sendmmsg は syscall 数は減るが ctypes でのメッセージ組み立てがパケット毎にかかるため）。
+GSO が送信時に拒否された場合（古いカーネル・非対応の経路）は以降 GSO を使わない（auto なら mmsg に落ちる）。
+受信側から見たパケット列は mode によらず同じ。
+"""
+import ctypes
+import errno
+import socket
+import struct
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+MODES = ("auto", "gso", "mmsg", "loop")
+
+SOL_UDP = getattr(socket, "SOL_UDP", 17)
+UDP_SEGMENT = getattr(socket, "UDP_SEGMENT", 103)  # linux/udp.h
+GSO_MAX_SEGS = 64       # UDP_MAX_SEGMENTS
+GSO_MAX_BYTES = 65000   # 1 回の GSO 送信の上限（IP データグラム長 64KB 未満）
+MMSG_MAX = 64           # 1 回の sendmmsg で渡すパケット数
+
+# GSO が使えないことを示す errno（これ以外は通常の送信エラーとして扱う）
+_GSO_UNSUPPORTED = {errno.EINVAL, errno.EIO, errno.ENOPROTOOPT, errno.EOPNOTSUPP}
+
+
+# ==========================
+# sendmmsg(2)（ctypes）
+# ==========================
+class _IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IoVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+def _load_sendmmsg():
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fn = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    fn.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    fn.restype = ctypes.c_int
+    return fn
+
+
+_sendmmsg = _load_sendmmsg()
+
+
+def _sockaddr(family: int, addr: Tuple[str, int]) -> bytes:
+    """(ip, port) → struct sockaddr_in / sockaddr_in6 のバイト列"""
+    host, port = addr[0], addr[1]
+    if family == socket.AF_INET6:
+        ip = socket.getaddrinfo(host, port, socket.AF_INET6, socket.SOCK_DGRAM)[0][4][0]
+        return (struct.pack("=H", family) + struct.pack("!HI", port, 0)
+                + socket.inet_pton(socket.AF_INET6, ip) + struct.pack("=I", 0))
+    ip = socket.gethostbyname(host)
+    return struct.pack("=H", family) + struct.pack("!H", port) + socket.inet_aton(ip) + bytes(8)
+
+
+def _gso_runs(packets: Sequence[Any]):
+    """GSO で 1 回に送れる [i, j) の区間に分ける（同じ長さの連続 + 末尾に短い 1 個まで）"""
+    n = len(packets)
+    i = 0
+    while i < n:
+        seg = len(packets[i])
+        limit = min(GSO_MAX_SEGS, max(1, GSO_MAX_BYTES // seg))
+        j = i + 1
+        while j < n and j - i < limit and len(packets[j]) == seg:
+            j += 1
+        if j < n and j - i < limit and len(packets[j]) < seg:#最後のセグメントだけ短くてよい
+            j += 1
+        yield i, j
+        i = j
+
+
+class BatchSender:
+    def __init__(self, sock: socket.socket, mode: str = "auto"):
+        if mode not in MODES:
+            raise ValueError(f"unknown send batch mode: {mode}")
+        self.sock = sock
+        self.mode = mode
+        self.use_gso = mode in ("auto", "gso") and hasattr(sock, "sendmsg")
+        self.use_mmsg = mode in ("auto", "mmsg") and _sendmmsg is not None
+        self._names: Dict[Tuple[str, int], ctypes.Array] = {}#宛先 → sockaddr（mmsg 用）
+        self._msgs = (_MMsgHdr * MMSG_MAX)()
+        self._iovs = (_IoVec * MMSG_MAX)()
+        for m, iov in zip(self._msgs, self._iovs):#1 メッセージ = 1 iovec（固定）
+            m.msg_hdr.msg_iov = ctypes.pointer(iov)
+            m.msg_hdr.msg_iovlen = 1
+        self._msgs_name: Optional[Tuple[str, int]] = None
+
+        # 統計
+        self.frames = 0
+        self.packets = 0
+        self.syscalls = 0
+        self.gso_sends = 0
+        self.mmsg_sends = 0
+        self.gso_disabled = False
+
+    def send(self, packets: Sequence[Any], addr: Tuple[str, int], new_frame: bool = True) -> bool:
+        """
+        packets（1フレーム分の memoryview / bytes 列）を addr へ送る。
+        送信エラー時はメッセージを出して残りを捨て、False を返す（従来の sendto ループと同じ扱い）。
+        ペーシングで 1 フレームを分けて送るときは、2 回目以降を new_frame=False にする（frames に数えない）。
+        """
+        if not packets:
+            return True
+        if new_frame:
+            self.frames += 1
+        try:
+            if self.use_gso:
+                self._send_gso(packets, addr)
+            else:
+                self._send_many(packets, addr)
+        except OSError as e:
+            print("[SEND] send error:", e)
+            return False
+        self.packets += len(packets)
+        return True
+
+    # ---------- GSO ----------
+    def _send_gso(self, packets: Sequence[Any], addr) -> None:
+        single: List[Any] = []#GSO にならない単発パケット（順序を保つため次の GSO 送信前に吐き出す）
+        for i, j in _gso_runs(packets):
+            if j - i == 1 or not self.use_gso:
+                single.extend(packets[i:j])
+                continue
+            if single:
+                self._send_loop(single, addr)
+                single = []
+            run = packets[i:j]
+            try:
+                self.sock.sendmsg(run, [(SOL_UDP, UDP_SEGMENT, struct.pack("=H", len(run[0])))], 0, addr)
+            except OSError as e:
+                if e.errno not in _GSO_UNSUPPORTED:
+                    raise
+                print("[SEND] UDP GSO unavailable, falling back:", e)
+                self.use_gso = False
+                self.gso_disabled = True
+                single.extend(run)
+                continue
+            self.syscalls += 1
+            self.gso_sends += 1
+        if single:
+            if self.use_gso:
+                self._send_loop(single, addr)
+            else:#途中で GSO が使えなくなった
+                self._send_many(single, addr)
+
+    # ---------- sendmmsg / sendto ----------
+    def _send_loop(self, packets: Sequence[Any], addr) -> None:
+        for pkt in packets:
+            self.sock.sendto(pkt, addr)
+            self.syscalls += 1
+
+    def _send_many(self, packets: Sequence[Any], addr) -> None:
+        if not self.use_mmsg or len(packets) == 1:
+            self._send_loop(packets, addr)
+            return
+        for i in range(0, len(packets), MMSG_MAX):
+            self._sendmmsg(packets[i:i + MMSG_MAX], addr)
+
+    def _sendmmsg(self, packets: Sequence[Any], addr) -> None:
+        name = self._names.get(addr)
+        if name is None:
+            raw = _sockaddr(self.sock.family, addr)
+            name = self._names[addr] = ctypes.create_string_buffer(raw, len(raw))
+
+        keep = []#送信が終わるまでバッファを生かしておく
+        iovs = self._iovs
+        for n, pkt in enumerate(packets):
+            if isinstance(pkt, memoryview) and not pkt.readonly:
+                cbuf = ctypes.c_char.from_buffer(pkt)#コピーなし（先頭アドレスだけ取る）
+            else:
+                cbuf = ctypes.create_string_buffer(bytes(pkt), len(pkt))
+            keep.append(cbuf)
+            iovs[n].iov_base = ctypes.addressof(cbuf)
+            iovs[n].iov_len = len(pkt)
+        if self._msgs_name != addr:#宛先が変わったときだけ書き換える
+            for m in self._msgs:
+                m.msg_hdr.msg_name = ctypes.addressof(name)
+                m.msg_hdr.msg_namelen = len(name)
+            self._msgs_name = addr
+
+        fd = self.sock.fileno()
+        base = ctypes.addressof(self._msgs)
+        sent = 0
+        while sent < len(packets):#途中までしか送れなかったら残りを送り直す
+            ret = _sendmmsg(fd, base + sent * ctypes.sizeof(_MMsgHdr), len(packets) - sent, 0)
+            self.syscalls += 1
+            if ret < 0:
+                err = ctypes.get_errno()
+                raise OSError(err, "sendmmsg: " + errno.errorcode.get(err, str(err)))
+            sent += ret
+        self.mmsg_sends += 1
+        del keep
+
+    def active_mode(self) -> str:
+        if self.use_gso:
+            return "gso"
+        return "mmsg" if self.use_mmsg else "loop"
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.active_mode(),
+            "frames": self.frames,
+            "packets": self.packets,
+            "syscalls": self.syscalls,
+            "syscalls_per_frame": round(self.syscalls / self.frames, 2) if self.frames else 0.0,
+            "gso_sends": self.gso_sends,
+            "mmsg_sends": self.mmsg_sends,
+            "gso_disabled": self.gso_disabled,
+        }
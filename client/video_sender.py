@@ -18,12 +18,21 @@ import threading
 import queue
 from collections import deque
 from types import SimpleNamespace
-from typing import Optional, Tuple, Deque
+from typing import List, Optional, Sequence, Tuple, Deque, Union
 
 # 既存資産を流用（相対importで統一）
 from .diff.diffproc_fixed import DiffCodec
 from .encode_thread import start_encode_thread
 from .send_thread import start_send_thread
+from .feedback_thread import start_feedback_thread
+from .fec.adaptive import AdaptiveFec
+from .udp_batch import BatchSender
+from .destinations import Destination, parse_destination, setup_multicast
+from .retransmit import DEFAULT_MAX_AGE, DEFAULT_MAX_FRAMES, Retransmitter
+from .pacer import DEFAULT_BURST, Pacer
+from .mtu import resolve_payload
+from .fec.gf256 import check_rs_params
+from .fec.packet_header import MAX_PAYLOAD, check_fec_k
 
 
 class VideoSender:
@@ -56,9 +65,32 @@ class VideoSender:
         scene_change_ratio: float = 0.25,
         jpeg_gate_ratio: float = 0.70,
         zlib_level: int = 6,
+        jpeg_gate_refresh: int = 30,  # サイズ・ゲート用の JPEG を作り直す間隔（P フレーム数。0: 毎回作る）
+        me_range: int = 0,            # 動き探索範囲（画素。0: ゼロモーション差分のみ）
+        chroma: str = "off",          # "on": P フレームで U/V の残差も送る（色が I フレームまで固まらない）
+        dxf_version: int = 1,         # 2: P フレームを int8 量子化残差＋1 本の zlib で送る（スライス分割不可）
+        qstep: int = 2,               # dxf_version=2 の残差の量子化幅
         reset_interval: float = 1.0,
-        fec: str = "none",          # "none" / "low" / "mid" / "high"
+        fec: str = "none",          # "none" / "low" / "mid" / "high" / "rs" / "adaptive"（受信側の損失レポートで切替）
         fec_k: int = 8,
+        fec_r: int = 4,             # fec="rs" のパリティ数
+        interleave: int = 1,        # グループ間インターリーブ深さ（mid/high/rs。1: なし、0: フレーム内全グループ）
+        interleave_frames: int = 1, # フレーム間インターリーブ深さ（1: なし）
+        slices: str = "off",        # "on": 独立復号できる単位境界で分割（受信側で部分フレームを表示できる。v2 ヘッダのみ）
+        jpeg_rst: int = 4,          # slices="on" のときの JPEG リスタート区間（MCU数）
+        send_batch: str = "auto",   # "auto" / "gso"（UDP_SEGMENT）/ "mmsg"（sendmmsg）/ "loop"（1パケット毎に sendto）
+        header_version: int = 2,    # 2: 自己記述ヘッダ / 1: 旧ヘッダ（frame_id, chunk_id, total のみ）/ 3: v2 + stream_id
+        stream_id: int = 0,         # 複数ストリーム受信（MultiStreamReceiver）用の識別子。header_version=3 が必要
+        destinations: Optional[Sequence[Union[str, Sequence]]] = None,  # 複数送信先 "ip[:port][/fec]" / (ip, port[, fec])。None なら server_ip のみ
+        multicast_ttl: int = 1,     # マルチキャスト送信先の TTL（1: 同一セグメントのみ）
+        nack: str = "off",          # "on": 受信側の NACK に応じて失われたチャンクだけ再送（FEC と併用可。header_version>=2）
+        nack_max_age: float = DEFAULT_MAX_AGE,    # 送ってからこの秒数を過ぎたフレームは再送しない
+        nack_cache: int = DEFAULT_MAX_FRAMES,     # 再送用に保持するフレーム数
+        pace_rate: float = 0.0,     # >0: この Mbps で均等に送る（マイクロバースト対策）
+        pace_spread: float = 0.0,   # >0: 1 フレーム分をこのミリ秒に広げて送る
+        pace_auto: float = 0.0,     # >0: 1 フレーム分をフレーム間隔 × この比率に広げて送る（fps から自動）
+        pace_burst: int = DEFAULT_BURST,  # ペーシング時に 1 回で送るパケット数
+        payload: Union[int, str] = MAX_PAYLOAD,  # 1 パケットのバイト数（ヘッダ込み）。"auto": 経路 MTU から決める（最大 9000 バイト）
     ):
         # 既存スレッド関数が args.xxx を参照するので、それに合わせる
         self.args = SimpleNamespace(
@@ -73,12 +105,54 @@ class VideoSender:
             scene_change_ratio=float(scene_change_ratio),
             jpeg_gate_ratio=float(jpeg_gate_ratio),
             zlib_level=int(zlib_level),
+            jpeg_gate_refresh=int(jpeg_gate_refresh),
+            me_range=int(me_range),
+            chroma=str(chroma),
+            dxf_version=int(dxf_version),
+            qstep=int(qstep),
             reset_interval=float(reset_interval),
             fec=str(fec),
             fec_k=int(fec_k),
+            fec_r=int(fec_r),
+            interleave=int(interleave),
+            interleave_frames=int(interleave_frames),
+            slices=str(slices),
+            jpeg_rst=int(jpeg_rst),
+            send_batch=str(send_batch),
+            header_version=int(header_version),
+            stream_id=int(stream_id),
+            multicast_ttl=int(multicast_ttl),
+            nack=str(nack),
+            nack_max_age=float(nack_max_age),
+            nack_cache=int(nack_cache),
+            pace_rate=float(pace_rate),
+            pace_spread=float(pace_spread),
+            pace_auto=float(pace_auto),
+            pace_burst=int(pace_burst),
         )
 
-        self.server_addr: Tuple[str, int] = (server_ip, int(server_port))
+        # 送信先（エンコード・パケット化は 1 回で、同じパケットを全送信先へ送る）
+        if destinations:
+            self.destinations: List[Destination] = [parse_destination(d, int(server_port)) for d in destinations]
+        else:
+            self.destinations = [(server_ip, int(server_port), None)]
+        # 1 パケットの長さ（受信側はパケット長から読むので設定を合わせる必要はない）
+        self.args.payload = resolve_payload(payload, [ip for ip, _port, _fec in self.destinations])
+        use_adaptive = any((fec or self.args.fec) == "adaptive" for _ip, _port, fec in self.destinations)
+
+        if use_adaptive and self.args.header_version < 2:
+            raise ValueError('fec="adaptive" には header_version=2 が必要です（受信側がパケット毎に方式を判別するため）')
+        if self.args.nack == "on" and self.args.header_version < 2:
+            raise ValueError('nack="on" には header_version=2 が必要です（受信側が chunk_id を frame_id 毎に追跡するため）')
+        if self.args.stream_id and self.args.header_version < 3:
+            raise ValueError("stream_id には header_version=3 が必要です")
+        if not 0 <= self.args.stream_id <= 0xFFFF:
+            raise ValueError("stream_id は 0〜65535 です")
+        check_fec_k(self.args.fec_k, self.args.header_version)#v2/v3 ヘッダの k は 1 バイト
+        if any((fec or self.args.fec) == "rs" for _ip, _port, fec in self.destinations):
+            check_rs_params(self.args.fec_k, self.args.fec_r)#送信スレッドの cauchy_matrix で落ちる前に弾く
+
+        self.server_addr: Tuple[str, int] = self.destinations[0][:2]
 
         # スレッド間バッファ（既存設計を踏襲）
         self.frame_buffer: Deque = deque(maxlen=3)             # 外部 → Encode
@@ -87,6 +161,27 @@ class VideoSender:
 
         # UDP socket
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.tx = BatchSender(self.sock, self.args.send_batch)#1フレーム分をまとめて送る（syscall 数は stats() で見る）
+        setup_multicast(self.sock, self.destinations, self.args.multicast_ttl)
+
+        # fec="adaptive" のときだけ受信側の損失レポートを受ける（複数送信先なら全受信側のレポートで 1 つを動かす）
+        self.fec_ctrl: Optional[AdaptiveFec] = None
+        if use_adaptive:
+            self.fec_ctrl = AdaptiveFec()
+
+        # nack="on" のとき送ったパケットを保持し、受信側の NACK で再送する
+        self.retx: Optional[Retransmitter] = None
+        if self.args.nack == "on":
+            self.retx = Retransmitter(self.sock, self.args.nack_cache, self.args.nack_max_age)
+
+        # ペーシング（どれも 0 なら従来どおり 1 フレーム分をまとめて送る）
+        self.pacer: Optional[Pacer] = None
+        if self.args.pace_rate > 0 or self.args.pace_spread > 0 or self.args.pace_auto > 0:
+            self.pacer = Pacer(self.args.pace_rate, self.args.pace_spread, self.args.pace_auto,
+                               self.args.fps, self.args.pace_burst)
+
+        if self.fec_ctrl is not None or self.retx is not None:
+            self.sock.settimeout(0.5)#feedback スレッドが停止フラグを確認できるように
 
         # DiffCodec（diff=on の場合のみ）
         self.diff_codec: Optional[DiffCodec] = None
@@ -98,12 +193,19 @@ class VideoSender:
                 scene_change_ratio=self.args.scene_change_ratio,
                 jpeg_gate_ratio=self.args.jpeg_gate_ratio,
                 zlib_level=self.args.zlib_level,
+                jpeg_rst_interval=self.args.jpeg_rst if self.args.slices == "on" else 0,
+                jpeg_gate_refresh=self.args.jpeg_gate_refresh,
+                me_range=self.args.me_range,
+                chroma=self.args.chroma,
+                dxf_version=self.args.dxf_version,
+                qstep=self.args.qstep,
             )
 
         self._started = False
         self._lock = threading.Lock()
         self._t_encode: Optional[threading.Thread] = None
         self._t_send: Optional[threading.Thread] = None
+        self._t_feedback: Optional[threading.Thread] = None
 
     def start(self) -> None:
         """Encodeスレッド + Sendスレッドを起動する"""
@@ -129,8 +231,21 @@ class VideoSender:
                 args=self.args,
                 server_addr=self.server_addr,
                 sock=self.sock,
+                fec_ctrl=self.fec_ctrl,
+                tx=self.tx,
+                destinations=self.destinations,
+                retx=self.retx,
+                pacer=self.pacer,
             )
 
+            if self.fec_ctrl is not None or self.retx is not None:
+                self._t_feedback = start_feedback_thread(
+                    sock=self.sock,
+                    stop_flag=self.stop_flag,
+                    fec_ctrl=self.fec_ctrl,
+                    retx=self.retx,
+                )
+
             self._started = True
 
     def send_frame(self, frame_bgr) -> None:
@@ -159,6 +274,8 @@ class VideoSender:
                     self._t_encode.join(timeout=0.2)
                 if self._t_send is not None:
                     self._t_send.join(timeout=0.2)
+                if self._t_feedback is not None:
+                    self._t_feedback.join(timeout=0.2)
             except Exception:
                 pass
 
@@ -169,6 +286,21 @@ class VideoSender:
 
             self._started = False
 
+    def status(self) -> dict:
+        """送信統計（syscalls_per_frame など）と適応FECの状態"""
+        return {
+            "running": self._started,
+            "fec": self.args.fec,
+            "payload": self.args.payload,
+            "destinations": [f"{ip}:{port}" + (f"/{fec}" if fec else "") for ip, port, fec in self.destinations],
+            "send": self.tx.stats(),
+            "diff": None if self.diff_codec is None else self.diff_codec.stats(),
+            "adaptive": None if self.fec_ctrl is None else self.fec_ctrl.stats(),
+            # 再送（overhead = 再送パケット数 / 初回送信パケット数）
+            "nack": None if self.retx is None else self.retx.stats(),
+            "pacing": None if self.pacer is None else self.pacer.stats(),
+        }
+
     # 使いやすくするため（with で安全に止められる）
     def __enter__(self) -> "VideoSender":
         self.start()
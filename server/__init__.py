@@ -1,2 +1,2 @@
 from .video_receiver import VideoReceiver
-
+from .async_receiver import AsyncVideoReceiver
@@ -1,20 +1,37 @@
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import cv2
 import time
 
+from .async_receiver import AsyncVideoReceiver
+from .recv_ring import DEFAULT_SLOT_SIZE
 from .video_receiver import VideoReceiver
 
 app = FastAPI()
-_rx: VideoReceiver | None = None
+_rx: VideoReceiver | AsyncVideoReceiver | None = None
 
 
 class StartBody(BaseModel):
+    engine: str = "thread"  # thread（VideoReceiver）/ async（このイベントループ上で受信）
     bind_ip: str = "0.0.0.0"
     port: int = 5000
-    fec: str = "none"  # none/low/mid/high
+    fec: str = "auto"  # auto/none/low/mid/high/rs
     diff: str = "off"  # on/off
+    fec_k: int = 8     # fec=rs（v1 ヘッダ）のみ
+    fec_r: int = 4     # fec=rs（v1 ヘッダ）のみ
+    reasm_timeout: float = 1.0   # 未完成フレームの破棄までの秒数
+    reasm_max_frames: int = 64   # 同時に再構成するフレーム数の上限
+    interleave_frames: int = 1   # 送信側のフレーム間インターリーブ深さ
+    feedback: str = "on"         # 送信元への損失レポート on/off
+    feedback_interval: float = 0.5
+    nack: str = "off"            # 未着チャンクの再送要求 on/off（engine=thread のみ）
+    recv_ring: str = "on"        # リングバッファへバッチ受信 on/off
+    gro: str = "on"              # UDP GRO on/off（recv_ring=on のみ）
+    max_packet: int = DEFAULT_SLOT_SIZE  # 受信できる最大パケット長（送信側の payload 以上）
+    reassemble: str = "thread"   # thread / inline（recv スレッド内で再構成）
+    decode_procs: int = 0        # >0 なら N プロセスで復号（engine=thread のみ）
 
 
 @app.get("/status")
@@ -25,29 +42,62 @@ def status():
 
 
 @app.post("/start")
-def start(body: StartBody):
+async def start(body: StartBody):
     global _rx
     if _rx is not None:
         return {"ok": True, "status": _rx.status(), "note": "already running"}
 
+    if body.engine == "async":
+        _rx = AsyncVideoReceiver(
+            bind_ip=body.bind_ip,
+            port=body.port,
+            fec=body.fec,
+            diff=body.diff,
+            fec_k=body.fec_k,
+            fec_r=body.fec_r,
+            reasm_timeout=body.reasm_timeout,
+            reasm_max_frames=body.reasm_max_frames,
+            interleave_frames=body.interleave_frames,
+            feedback=body.feedback,
+            feedback_interval=body.feedback_interval,
+        )
+        await _rx.start()
+        return {"ok": True, "status": _rx.status()}
+
     _rx = VideoReceiver(
         bind_ip=body.bind_ip,
         port=body.port,
         fec=body.fec,
         diff=body.diff,
+        fec_k=body.fec_k,
+        fec_r=body.fec_r,
+        reasm_timeout=body.reasm_timeout,
+        reasm_max_frames=body.reasm_max_frames,
+        interleave_frames=body.interleave_frames,
+        feedback=body.feedback,
+        feedback_interval=body.feedback_interval,
+        recv_ring=body.recv_ring,
+        gro=body.gro,
+        max_packet=body.max_packet,
+        reassemble=body.reassemble,
+        decode_procs=body.decode_procs,
+        nack=body.nack,
     )
-    _rx.start()
+    await run_in_threadpool(_rx.start)#ソケット準備・復号プロセス起動はブロックするのでイベントループの外で
     return {"ok": True, "status": _rx.status()}
 
 
 @app.post("/stop")
-def stop():
+async def stop():
     global _rx
     rx = _rx
     if rx is None:
         return {"ok": True, "status": {"running": False}}
 
-    rx.stop()
+    if isinstance(rx, AsyncVideoReceiver):
+        await rx.stop()
+    else:
+        await run_in_threadpool(rx.stop)#スレッドの join・復号プロセスの終了待ちでイベントループを止めない
     _rx = None
     return {"ok": True, "status": {"running": False}}
 
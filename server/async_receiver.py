@@ -0,0 +1,218 @@
+# server/async_receiver.py
+"""
+asyncio 版の受信エンジン（VideoReceiver のスレッド構成の代わり）
+
+- asyncio.DatagramProtocol の datagram_received から再構成器（ReassembleSink）へ直接渡す
+- 完成フレームの JPEG / 差分復号は executor で行う（フレーム順を保つためストリーム毎に 1 つずつ）
+- 復号済みフレームは async for で受け取る
+
+ストリーム毎にスレッドを持たないので、1 つのイベントループ（FastAPI 等）で複数ポートを受けられる：
+
+    rx = AsyncVideoReceiver(port=5000)
+    await rx.start()
+    async for frame_id, frame, recovered in rx:
+        ...
+    await rx.stop()
+"""
+from __future__ import annotations
+
+import asyncio
+import queue
+import time
+from concurrent.futures import Executor
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Optional, Tuple
+
+from .decode_thread import decode_frame
+from .diff.diffdecode import DiffDecoder
+from .fec.factory import make_reassembler
+from .fec.frame_window import DEFAULT_TIMEOUT, DEFAULT_MAX_FRAMES
+from .fec.reorder import FrameReorder
+from .feedback import FeedbackReporter
+from .reassemble_thread import ReassembleSink
+
+IDLE_INTERVAL = 0.1  # 受信が途切れたと見なして期限切れ処理をする間隔（秒）
+
+
+class _DecodeQueue:
+    """ReassembleSink の frame_queue の代わり（asyncio.Queue を queue.Queue と同じ例外で包む）"""
+
+    def __init__(self, maxsize: int):
+        self.q: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=maxsize)
+
+    def put_nowait(self, item) -> None:
+        try:
+            self.q.put_nowait(item)
+        except asyncio.QueueFull:
+            raise queue.Full
+
+
+class _Protocol(asyncio.DatagramProtocol):
+    def __init__(self, owner: "AsyncVideoReceiver"):
+        self.owner = owner
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.owner._on_packet(data, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        # ICMP エラー等（UDP なので受信は続ける）
+        pass
+
+
+class AsyncVideoReceiver:
+    def __init__(
+        self,
+        *,
+        bind_ip: str = "0.0.0.0",
+        port: int = 5000,
+        fec: str = "auto",   # VideoReceiver と同じ
+        diff: str = "off",
+        fec_k: int = 8,
+        fec_r: int = 4,
+        reasm_timeout: float = DEFAULT_TIMEOUT,
+        reasm_max_frames: int = DEFAULT_MAX_FRAMES,
+        interleave_frames: int = 1,
+        feedback: str = "on",
+        feedback_interval: float = 0.5,
+        frame_qsize: int = 120,
+        executor: Optional[Executor] = None,  # 復号用（None ならイベントループ既定の executor。複数ストリームで共有できる）
+    ):
+        # VideoReceiver / server.py の args と同じフィールド名
+        self.args = SimpleNamespace(
+            bind_ip=bind_ip,
+            port=port,
+            fec=fec,
+            diff=diff,
+            fec_k=int(fec_k),
+            fec_r=int(fec_r),
+            reasm_timeout=float(reasm_timeout),
+            reasm_max_frames=int(reasm_max_frames),
+            interleave_frames=int(interleave_frames),
+            feedback=feedback,
+            feedback_interval=float(feedback_interval),
+        )
+        self.frame_qsize = int(frame_qsize)
+        self.executor = executor
+
+        self.reassembler = make_reassembler(self.args)
+        self.reorder = FrameReorder(self.args.interleave_frames)
+        self.diff_decoder = DiffDecoder() if self.args.diff == "on" else None
+        self.feedback: Optional[FeedbackReporter] = None
+
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._decode_q: Optional[_DecodeQueue] = None
+        self._out: Optional["asyncio.Queue[Any]"] = None
+        self._sink: Optional[ReassembleSink] = None
+        self._tasks: list = []
+        self._started = False
+        self._last_rx = 0.0
+
+        # 最新フレーム・簡易統計（VideoReceiver と同じ）
+        self._latest: Optional[Tuple[int, Any, int]] = None
+        self._started_ts: Optional[float] = None
+        self._decoded_count = 0
+        self._packets = 0
+
+    async def start(self) -> None:
+        if self._started:
+            return
+        loop = asyncio.get_running_loop()
+        self._decode_q = _DecodeQueue(self.frame_qsize)
+        self._out = asyncio.Queue(maxsize=self.frame_qsize)
+        self._sink = ReassembleSink(self._decode_q, self.reassembler, self.reorder, put_timeout=0)
+
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: _Protocol(self), local_addr=(self.args.bind_ip, self.args.port)
+        )
+        if self.args.feedback == "on":
+            self.feedback = FeedbackReporter(self._transport, self.args.feedback_interval)#transport.sendto で返す
+
+        self._last_rx = loop.time()
+        self._tasks = [loop.create_task(self._decode_loop()), loop.create_task(self._idle_loop())]
+        self._started = True
+        self._started_ts = time.time()
+
+    def _on_packet(self, data: bytes, addr) -> None:
+        self._packets += 1
+        self._last_rx = asyncio.get_running_loop().time()
+        if self.feedback is not None:
+            self.feedback.observe(data, addr)#損失計測（一定間隔で送信元へ返信）
+        self._sink.push(data)#再構成（完成フレームは _decode_q へ）
+
+    async def _idle_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(IDLE_INTERVAL)
+            if loop.time() - self._last_rx >= IDLE_INTERVAL:#受信が途切れたときだけ（reassemble スレッドと同じ）
+                self._sink.idle()
+
+    async def _decode_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            frame_id, frame_bytes, recovered = await self._decode_q.q.get()
+            # 差分復号は前フレームに依存するので 1 フレームずつ順に executor へ
+            frame = await loop.run_in_executor(self.executor, decode_frame, frame_bytes, self.args, self.diff_decoder)
+            if frame is None:
+                continue
+            self._latest = (int(frame_id), frame, int(recovered))
+            self._decoded_count += 1
+            self._put_out(self._latest)
+
+    def _put_out(self, item) -> None:
+        if self._out.full():#最新優先：読まれていない古いフレームから捨てる
+            self._out.get_nowait()
+        self._out.put_nowait(item)
+
+    async def frames(self) -> AsyncIterator[Tuple[int, Any, int]]:
+        """復号済みフレーム (frame_id, frame, recovered) を順に返す（stop() で終わる）"""
+        while self._started:
+            item = await self._out.get()
+            if item is None:
+                break
+            yield item
+
+    def __aiter__(self) -> AsyncIterator[Tuple[int, Any, int]]:
+        return self.frames()
+
+    def get_latest_frame(self) -> Optional[Tuple[int, Any, int]]:
+        return self._latest
+
+    async def stop(self) -> None:
+        if not self._started:
+            return
+        self._started = False
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        self._put_out(None)#frames() を終わらせる
+
+    async def __aenter__(self) -> "AsyncVideoReceiver":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.stop()
+
+    def status(self) -> dict:
+        now = time.time()
+        age = None if self._started_ts is None else round(now - self._started_ts, 3)
+        return {
+            "running": self._started,
+            "engine": "async",
+            "bind_ip": self.args.bind_ip,
+            "port": self.args.port,
+            "fec": self.args.fec,
+            "diff": self.args.diff,
+            "has_latest": self._latest is not None,
+            "latest_frame_id": None if self._latest is None else self._latest[0],
+            "decoded_count": self._decoded_count,
+            "packets": self._packets,
+            "age_since_start": age,
+            "reassembler": self.reassembler.stats() if hasattr(self.reassembler, "stats") else None,
+            "reorder": self.reorder.stats(),
+            "feedback": None if self.feedback is None else self.feedback.stats(),
+        }
@@ -0,0 +1,299 @@
+# server/decode_pool.py
+"""
+複数プロセスでの復号（decode_thread の代わり）
+
+- 完成フレームをワーカープロセスへ振り分けて復号し、BGR 画像を共有メモリのスロットへ書かせる
+  （画像そのものはプロセス間のパイプを通らない）
+- 復号結果は frame_id 順に並べ直してから decoded_queue へ流す
+  （frame_queue は完成順なので、FEC 復元や NACK 再送で完成が遅れたフレームも待つ。
+    待つのは reorder_wait 秒・reorder_depth フレームまでで、届かない frame_id は飛ばす）
+- diff=on は P フレームが前フレームに依存するので、ストリーム毎に 1 つのワーカーへ固定する
+  （diff=off の JPEG は空いているワーカーへ）
+
+ワーカーは spawn で起動するので、利用側のスクリプトは if __name__ == "__main__": で守ること。
+"""
+from __future__ import annotations
+
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from .decode_thread import decode_frame
+from .diff.diffdecode import DiffDecoder
+
+DEFAULT_MAX_WIDTH = 1920
+DEFAULT_MAX_HEIGHT = 1080
+DEFAULT_REORDER_WAIT = 0.05   # 欠けている frame_id を待つ最大秒数
+DEFAULT_REORDER_DEPTH = 8     # 並べ替えのために保持する最大フレーム数
+FRAME_ID_MASK = 0xFFFFFFFF    # frame_id は 32bit で一周する
+
+
+def _worker_main(shm_name: str, slot_bytes: int, diff: str, inq, outq) -> None:
+    shm = shared_memory.SharedMemory(name=shm_name)
+    args = SimpleNamespace(diff=diff)
+    decoders: Dict[Any, DiffDecoder] = {}#ストリーム → DiffDecoder（このワーカーに固定されたもの）
+    try:
+        while True:
+            task = inq.get()
+            if task is None:
+                break
+            seq, slot, stream, frame_bytes = task
+            dec = None
+            if diff == "on":
+                dec = decoders.get(stream)
+                if dec is None:
+                    dec = decoders[stream] = DiffDecoder()
+            try:
+                frame = decode_frame(frame_bytes, args, dec)
+            except Exception:
+                frame = None
+            if frame is None or frame.nbytes > slot_bytes:
+                outq.put((seq, slot, None))
+                continue
+            dst = np.ndarray(frame.shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+            dst[...] = frame#共有メモリへ書く
+            del dst
+            outq.put((seq, slot, frame.shape))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shm.close()
+
+
+class DecodePool:
+    def __init__(
+        self,
+        workers: int = 2,
+        diff: str = "off",
+        slots: int = 0,                       # 共有メモリのスロット数（0 なら workers * 3）
+        max_width: int = DEFAULT_MAX_WIDTH,   # 1 スロットに入る最大画像サイズ
+        max_height: int = DEFAULT_MAX_HEIGHT,
+    ):
+        self.workers = max(1, int(workers))
+        self.diff = diff
+        self.slot_bytes = int(max_width) * int(max_height) * 3
+        self.nslots = int(slots) if slots > 0 else self.workers * 3
+        self.shm = shared_memory.SharedMemory(create=True, size=self.nslots * self.slot_bytes)
+
+        self._free: "deque[int]" = deque(range(self.nslots))
+        self._free_cv = threading.Condition()
+
+        ctx = multiprocessing.get_context("spawn")
+        self.inqs = [ctx.Queue() for _ in range(self.workers)]
+        self.outq = ctx.Queue()
+        self.procs = [
+            ctx.Process(target=_worker_main, args=(self.shm.name, self.slot_bytes, diff, q, self.outq), daemon=True)
+            for q in self.inqs
+        ]
+        for p in self.procs:
+            p.start()
+
+        self._seq = 0
+        self._pin: Dict[Any, int] = {}#ストリーム → ワーカー（diff=on）
+        self._lock = threading.Lock()#_seq / _pin / _inflight / _owner は投入・回収の 2 スレッドから触る
+        self._inflight = [0] * self.workers
+        self._owner: Dict[int, Tuple[int, Any]] = {}#seq → (ワーカー, tag)
+
+        # 統計
+        self.submitted = 0
+        self.decoded = 0
+        self.failed = 0
+        self.slot_waits = 0#空きスロット待ちで timeout した回数（復号が追いついていない目安）
+        self._closed = False
+        self.order: Optional[_FrameIdOrder] = None#start_decode_pool_threads が設定する
+
+    def _pick(self, stream: Any) -> int:
+        if self.diff != "on":
+            return self._inflight.index(min(self._inflight))#空いているワーカー
+        w = self._pin.get(stream)
+        if w is None:#新しいストリームは担当の少ないワーカーへ
+            load = [0] * self.workers
+            for v in self._pin.values():
+                load[v] += 1
+            w = self._pin[stream] = load.index(min(load))
+        return w
+
+    def submit(self, frame_bytes: bytes, stream: Any = 0, tag: Any = None, timeout: float = 0.1) -> Optional[int]:
+        """
+        フレームを投入して通し番号を返す。空きスロットが timeout 秒で得られなければ None。
+        tag は結果と一緒に返す（frame_id など）。
+        """
+        with self._free_cv:
+            if not self._free and not self._free_cv.wait_for(lambda: self._free, timeout):
+                self.slot_waits += 1
+                return None
+            slot = self._free.popleft()
+        with self._lock:
+            seq = self._seq
+            self._seq += 1
+            w = self._pick(stream)
+            self._inflight[w] += 1
+            self._owner[seq] = (w, tag)
+        self.inqs[w].put((seq, slot, stream, bytes(frame_bytes)))
+        self.submitted += 1
+        return seq
+
+    def get_result(self, timeout: float = 0.1) -> Optional[Tuple[int, int, Optional[tuple], Any]]:
+        """復号結果 (seq, slot, shape, tag) を 1 つ受け取る（完了順）。shape が None なら復号失敗"""
+        try:
+            seq, slot, shape = self.outq.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            w, tag = self._owner.pop(seq)
+            self._inflight[w] -= 1
+        if shape is None:
+            self.failed += 1
+        else:
+            self.decoded += 1
+        return seq, slot, shape, tag
+
+    def take(self, slot: int, shape: Optional[tuple]) -> Optional[np.ndarray]:
+        """スロットの画像をコピーして取り出し、スロットを返す（shape None なら返すだけ）"""
+        frame = None
+        if shape is not None:
+            view = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+            frame = view.copy()
+            del view
+        with self._free_cv:
+            self._free.append(slot)
+            self._free_cv.notify()
+        return frame
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        for q in self.inqs:
+            try:
+                q.put(None)
+            except Exception:
+                pass
+        for p in self.procs:
+            p.join(timeout=1.0)
+            if p.is_alive():
+                p.terminate()
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "submitted": self.submitted,
+            "decoded": self.decoded,
+            "failed": self.failed,
+            "slot_waits": self.slot_waits,
+            "inflight": len(self._owner),
+            "slots": self.nslots,
+            **({"order": self.order.stats()} if self.order is not None else {}),
+        }
+
+
+class _FrameIdOrder:
+    """
+    復号済みフレームを frame_id 順に出す（32bit の一周を考慮）。
+    欠けている frame_id は wait 秒、または depth フレームたまるまで待ち、届かなければ飛ばす。
+    復号に失敗したフレームは frame=None で入れる（その frame_id を待たずに済む）。
+    """
+
+    def __init__(self, wait: float = DEFAULT_REORDER_WAIT, depth: int = DEFAULT_REORDER_DEPTH):
+        self.wait = float(wait)
+        self.depth = max(1, int(depth))
+        self.held: Dict[int, tuple] = {}#frame_id → (frame, recovered)
+        self.next_id: Optional[int] = None
+        self._since = 0.0#next_id を待ち始めた時刻
+
+        self.skipped = 0#届かず飛ばした frame_id 数
+        self.late_dropped = 0#飛ばした後に届いたフレーム数
+
+    def _ahead(self, fid: int) -> int:#next_id から見た距離（負なら追い越し済み）
+        d = (fid - self.next_id) & FRAME_ID_MASK
+        return d - (FRAME_ID_MASK + 1) if d > FRAME_ID_MASK >> 1 else d
+
+    def push(self, fid: int, frame: Any, recovered: int) -> None:
+        if self.next_id is None:
+            self.next_id = fid
+        if self._ahead(fid) < 0:
+            self.late_dropped += 1
+            return
+        if not self.held:#ここから欠けている frame_id を待つ
+            self._since = time.monotonic()
+        self.held[fid] = (frame, recovered)
+
+    def release(self, now: float) -> list:
+        """出せるフレーム [(frame_id, frame, recovered)]（frame None は復号失敗）"""
+        out = []
+        while self.held:
+            if self.next_id not in self.held:
+                if len(self.held) < self.depth and now - self._since < self.wait:#欠けているフレームをまだ待つ
+                    break
+                nxt = min(self.held, key=self._ahead)
+                self.skipped += self._ahead(nxt)
+                self.next_id = nxt
+            frame, recovered = self.held.pop(self.next_id)
+            out.append((self.next_id, frame, recovered))
+            self.next_id = (self.next_id + 1) & FRAME_ID_MASK
+            self._since = now
+        return out
+
+    def stats(self) -> dict:
+        return {"held": len(self.held), "skipped": self.skipped, "late_dropped": self.late_dropped}
+
+
+def start_decode_pool_threads(
+    frame_queue: "queue.Queue[tuple[int, bytes, int]]",
+    decoded_queue: "queue.Queue[tuple[int, Any, int]]",
+    stop_flag: threading.Event,
+    pool: DecodePool,
+    stream: Any = 0,
+    reorder_wait: float = DEFAULT_REORDER_WAIT,
+    reorder_depth: int = DEFAULT_REORDER_DEPTH,
+) -> Tuple[threading.Thread, threading.Thread]:
+    """
+    start_decode_thread の代わり。
+    投入スレッド: frame_queue から (frame_id, frame_bytes, recovered) を取り出して pool へ
+    回収スレッド: 完了順の結果を frame_id 順に並べ直し、decoded_queue に (frame_id, frame, recovered) を流す
+    """
+    def submit_loop():
+        while not stop_flag.is_set():
+            try:
+                frame_id, frame_bytes, recovered = frame_queue.get(timeout=0.1)#フレームキューから取り出す
+            except queue.Empty:
+                continue
+            seq = None
+            while seq is None and not stop_flag.is_set():#空きスロットを待つ（その間は frame_queue 側で溢れる）
+                seq = pool.submit(frame_bytes, stream, (frame_id, recovered))
+
+    def collect_loop():
+        order = _FrameIdOrder(reorder_wait, reorder_depth)
+        pool.order = order#stats() で見えるように
+        while not stop_flag.is_set():
+            res = pool.get_result(timeout=min(0.1, order.wait) if order.held else 0.1)
+            if res is not None:
+                seq, slot, shape, (frame_id, recovered) = res
+                order.push(frame_id, pool.take(slot, shape), recovered)#スロットはすぐ返す
+            for frame_id, frame, recovered in order.release(time.monotonic()):#frame_id 順に出す
+                if frame is None:
+                    # 参照不足やヘッダ破損など → このフレームはスキップ
+                    continue
+                try:
+                    decoded_queue.put((frame_id, frame, recovered), timeout=0.1)
+                except queue.Full:
+                    # 満杯なら捨てる
+                    pass
+
+    t_submit = threading.Thread(target=submit_loop, daemon=True)
+    t_collect = threading.Thread(target=collect_loop, daemon=True)
+    t_submit.start()
+    t_collect.start()
+    return t_submit, t_collect
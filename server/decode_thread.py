@@ -8,6 +8,21 @@ import numpy as np
 from .diff.diffdecode import DiffDecoder
 
 
+def decode_frame(frame_bytes: bytes, args, diff_decoder: Optional[DiffDecoder]) -> Optional[np.ndarray]:
+    """
+    1フレーム分を復号して BGR 画像を返す（失敗なら None）。
+      - diff=on: DiffDecoder でDXF0復号（参照不足やヘッダ破損なら None）
+      - diff=off: JPEG復号
+    decode スレッドと asyncio 受信（async_receiver.py の executor）で共通。
+    """
+    if args.diff == "on" and diff_decoder is not None:#差分が有効な場合
+        return diff_decoder.decode(frame_bytes)#差分処理を行う
+
+    # 通常JPEG
+    np_data = np.frombuffer(frame_bytes, dtype=np.uint8)#バイトデータをnumpy配列に変換
+    return cv2.imdecode(np_data, cv2.IMREAD_COLOR)#JPEG復号
+
+
 def start_decode_thread(
     frame_queue: "queue.Queue[tuple[int, bytes, int]]",
     decoded_queue: "queue.Queue[tuple[int, any, int]]",
@@ -30,18 +45,12 @@ def start_decode_thread(
                 continue
 
             # diff=on → DXF0デコード、diff=off → JPEGデコード
-            if args.diff == "on" and diff_decoder is not None:#差分が有効な場合
-                frame = diff_decoder.decode(frame_bytes)#差分処理を行う
-                if frame is None:
-                    # 参照不足やヘッダ破損など → このフレームはスキップ
-                    continue
-            else:
-                # 通常JPEG
-                np_data = np.frombuffer(frame_bytes, dtype=np.uint8)#バイトデータをnumpy配列に変換
-                frame = cv2.imdecode(np_data, cv2.IMREAD_COLOR)#JPEG復号
-                if frame is None:
+            frame = decode_frame(frame_bytes, args, diff_decoder)
+            if frame is None:
+                if diff_decoder is None or args.diff != "on":
                     print(f"[DECODE] JPEG decode failed for frame_id={frame_id}")
-                    continue
+                # 参照不足やヘッダ破損など → このフレームはスキップ
+                continue
 
             try:
                 decoded_queue.put((frame_id, frame, recovered), timeout=0.1)
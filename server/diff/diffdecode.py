@@ -2,14 +2,55 @@ import struct
 import zlib
 import numpy as np
 import cv2
+from numpy.lib.stride_tricks import sliding_window_view
 from typing import Optional, Tuple
 
 # 送出側(diffproc)と合わせたヘッダ仕様
-HDR_FMT = "!4sBBHHHBBH"   # magic, ver, frame_type, reserved, w, h, block, T, nblocks
+HDR_FMT = "!4sBBHHHBBH"   # magic, ver, frame_type, flags(旧 reserved), w, h, block, T, nblocks
 BLK_FMT = "!HHbbH"        # bx, by, dx, dy, datalen
 MAGIC   = b"DXF0"
+VER     = 1
+VER_Q   = 2               # P フレームが量子化残差＋1 本の zlib ストリーム
+P2_HDR_FMT = "!BB"        # qstep, reserved（VER_Q の P フレームのみ）
 FRAME_I = 0
 FRAME_P = 1
+FLAG_CHROMA = 0x0001      # 残差ブロックが Y に続けて U, V（各 block/2 × block/2）の残差を持つ
+
+
+# ===== ブロック単位の配列演算（diffproc_fixed.py と同一仕様） =====
+def _pad_to_blocks(a: np.ndarray, blk: int) -> np.ndarray:
+    """H, W が blk の倍数でなければ右端・下端を 0 で埋める（倍数ならそのまま返す）"""
+    H, W = a.shape
+    nby, nbx = -(-H // blk), -(-W // blk)#切り上げ
+    if (nby * blk, nbx * blk) == (H, W):
+        return a
+    padded = np.zeros((nby * blk, nbx * blk), dtype=a.dtype)
+    padded[:H, :W] = a
+    return padded
+
+
+def _to_blocks(a: np.ndarray, blk: int) -> np.ndarray:
+    """2D 配列を (nby, nbx, blk, blk) のビューにする（端は 0 詰め）"""
+    a = _pad_to_blocks(a, blk)
+    return a.reshape(a.shape[0] // blk, blk, a.shape[1] // blk, blk).swapaxes(1, 2)
+
+
+def _recon_blocks(ref: np.ndarray, blk: int, bys: np.ndarray, bxs: np.ndarray, pred: np.ndarray, res: np.ndarray) -> np.ndarray:
+    """参照のブロック (bys, bxs) を 予測＋残差 で置き換えた面を返す"""
+    recon = _pad_to_blocks(ref, blk).copy()
+    _to_blocks(recon, blk)[bys, bxs] = np.clip(pred.astype(np.int16) + res, 0, 255)
+    return recon[:ref.shape[0], :ref.shape[1]]
+
+
+def _chroma_pred_blocks(ref_c: np.ndarray, cb: int, bys: np.ndarray, bxs: np.ndarray, dy: np.ndarray, dx: np.ndarray) -> np.ndarray:
+    """色差ブロック (bys, bxs) の予測（輝度の動きの 1/2、半画素は 2 画素の平均。DiffDecoder._chroma_pred と同じ計算）"""
+    refp = np.pad(_pad_to_blocks(ref_c, cb), ((0, 1), (0, 1)), mode="edge")
+    g = sliding_window_view(refp, (cb + 1, cb + 1))[bys * cb + (dy >> 1), bxs * cb + (dx >> 1)].astype(np.uint16)
+    hy = (dy & 1).astype(bool)[:, None, None]
+    hx = (dx & 1).astype(bool)[:, None, None]
+    g = np.where(hy, (g[:, :-1] + g[:, 1:] + 1) >> 1, g[:, :-1])
+    return np.where(hx, (g[:, :, :-1] + g[:, :, 1:] + 1) >> 1, g[:, :, :-1])
+# ==========================================================
 
 
 class DiffDecoder:
@@ -17,6 +58,11 @@ class DiffDecoder:
     I/P差分フレームを復号するデコーダ。
     - I: JPEGを復号 → 参照更新 → BGRを返す
     - P: 残差ブロックを参照Yに適用 → YUV420 → BGRへ変換 → 参照更新 → BGRを返す
+         ブロックヘッダの (dx, dy) が 0 でなければ参照の (bx+dx, by+dy) から予測する（動き補償）。
+         U/V も同じブロックを (dx/2, dy/2) ずらして動かす（奇数は隣の 2 画素の平均）。datalen=0 は残差なし（動きだけ）。
+         flags に FLAG_CHROMA があれば U/V の残差も加える（無ければ U/V は I フレーム（と動き補償）のまま）。
+    - ver=2（VER_Q）の P: 1 本の zlib ストリーム（ブロックのビットマップ・動きベクトル・int8 残差 × qstep）を
+         まとめて展開し、全ブロックを配列演算で復元する。途中で切れていれば届いた残差の分だけ使う。
 
     ★ パケットロスやブロック破損に強くするため、
       ・zlib 展開に失敗したブロック
@@ -59,6 +105,23 @@ class DiffDecoder:
         bgr = cv2.cvtColor(yuv_2d, cv2.COLOR_YUV2BGR_I420)#BGRに変換
         return bgr
 
+    @staticmethod
+    def _chroma_pred(plane: np.ndarray, y0: int, x0: int, y1: int, x1: int, dy: int, dx: int) -> Optional[np.ndarray]:
+        """
+        色差面の [y0:y1, x0:x1] を輝度の動き (dx, dy) の 1/2 だけずらした予測（半画素は 2 画素の平均）。
+        参照の外を指すなら None
+        """
+        sy, sx = y0 + (dy >> 1), x0 + (dx >> 1)#整数部（切り捨て）
+        hy, hx = dy & 1, dx & 1#半画素か
+        if sy < 0 or sx < 0 or sy + (y1 - y0) + hy > plane.shape[0] or sx + (x1 - x0) + hx > plane.shape[1]:
+            return None
+        p = plane[sy:sy + (y1 - y0) + hy, sx:sx + (x1 - x0) + hx].astype(np.uint16)
+        if hy:
+            p = (p[:-1] + p[1:] + 1) >> 1
+        if hx:
+            p = (p[:, :-1] + p[:, 1:] + 1) >> 1
+        return p.astype(np.uint8)
+
     def reset(self):
         self.ref_bgr = None
         self.ref_y = self.ref_u = self.ref_v = None
@@ -71,13 +134,13 @@ class DiffDecoder:
             return None
 
         try:
-            (magic, ver, ftype, _reserved,w, h, block, T, nblocks) = struct.unpack(HDR_FMT, frame_bytes[:need])#ヘッダの確認
+            (magic, ver, ftype, flags, w, h, block, T, nblocks) = struct.unpack(HDR_FMT, frame_bytes[:need])#ヘッダの確認
         except struct.error:
             # ヘッダ自体がおかしい → このフレームは破棄
             return None
 
         # マジック/バージョンチェック
-        if magic != MAGIC or ver != 1:
+        if magic != MAGIC or ver not in (VER, VER_Q):
             return None
 
         payload = frame_bytes[need:]
@@ -106,7 +169,17 @@ class DiffDecoder:
             self.reset()
             return None
 
+        if ver == VER_Q:
+            planes = self._decode_p_q(payload, h, w, block, flags, nblocks)
+            if planes is None:
+                return None
+            return self._finish_p(*planes)
+
         new_y = self.ref_y.copy()#Y面の新規配列を作成
+        new_u = new_v = None#動き補償・色差残差のブロックがあるときだけ U/V を作り直す
+        chroma = bool(flags & FLAG_CHROMA)
+        cb = block // 2#色差ブロックの大きさ
+        ru = rv = None
         off = 0
         blk_hdr_size = struct.calcsize(BLK_FMT)#ブロックヘッダサイズを計算
 
@@ -135,43 +208,138 @@ class DiffDecoder:
             comp = payload[off:off + datalen]#圧縮データを抽出
             off += datalen#どこまで読んだかを更新
 
-            # --- 安全にデコードする ---
-            try:
-                raw = zlib.decompress(comp)#圧縮データを展開
-            except zlib.error:
-                # 壊れたブロック → このブロックは無視して次へ
-                continue
+            if datalen == 0:
+                # 残差なし（動きベクトルだけのブロック）
+                rblk = np.zeros((block, block), dtype=np.int16)
+                ru = rv = None
+            else:
+                # --- 安全にデコードする ---
+                try:
+                    raw = zlib.decompress(comp)#圧縮データを展開
+                except zlib.error:
+                    # 壊れたブロック → このブロックは無視して次へ
+                    continue
 
-            # int16 の数が block*block と合わない場合もスキップ
-            if len(raw) % 2 != 0:#2バイト単位でない → おかしいので破棄
-                continue
+                # int16 の数が block*block と合わない場合もスキップ
+                if len(raw) % 2 != 0:#2バイト単位でない → おかしいので破棄
+                    continue
 
-            expected_bytes = block * block * 2  # int16 = 2バイト
-            if len(raw) != expected_bytes:#想定外のサイズ → このブロックは捨てる
-                continue
+                expected_bytes = (block * block + (2 * cb * cb if chroma else 0)) * 2  # int16 = 2バイト
+                if len(raw) != expected_bytes:#想定外のサイズ → このブロックは捨てる
+                    continue
 
-            try:
-                rblk = np.frombuffer(raw, dtype=np.int16).reshape((block, block))#残差ブロックを生成
-            except ValueError:
-                # reshape に失敗 → 破棄
-                continue
+                try:
+                    res = np.frombuffer(raw, dtype=np.int16)
+                    rblk = res[:block * block].reshape((block, block))#残差ブロックを生成
+                    if chroma:
+                        ru = res[block * block:block * block + cb * cb].reshape((cb, cb))#U 残差
+                        rv = res[block * block + cb * cb:].reshape((cb, cb))#V 残差
+                except ValueError:
+                    # reshape に失敗 → 破棄
+                    continue
 
             y0, x0 = by, bx
-            y1, x1 = by + block, bx + block
-            if y1 > new_y.shape[0] or x1 > new_y.shape[1]:
+            if y0 >= new_y.shape[0] or x0 >= new_y.shape[1]:
                 # 範囲外 → 無視
                 continue
+            y1, x1 = min(by + block, new_y.shape[0]), min(bx + block, new_y.shape[1])
+            rblk = rblk[:y1 - y0, :x1 - x0]#解像度がブロックの倍数でない端のブロックは画像内だけ使う
 
-            # いまはゼロモーション（dx,dyは将来拡張用）
-            pred = self.ref_y[y0:y1, x0:x1].astype(np.int16)#参照Y面から予測ブロックを取得
+            # 予測ブロック（dx, dy = 0 ならゼロモーション）
+            py0, px0 = y0 + dy, x0 + dx
+            if py0 < 0 or px0 < 0 or py0 + (y1 - y0) > h or px0 + (x1 - x0) > w:
+                # 参照の外を指す動きベクトル → 壊れているので無視
+                continue
+            pred = self.ref_y[py0:py0 + (y1 - y0), px0:px0 + (x1 - x0)].astype(np.int16)#参照Y面から予測ブロックを取得
             cur = pred + rblk#残差を加算して現在ブロックを復元
             new_y[y0:y1, x0:x1] = np.clip(cur, 0, 255).astype(np.uint8)#画素値をクリップして保存
 
+            if dx or dy or ru is not None:
+                # U/V は 1/2 解像度なので (dx/2, dy/2) ずらして予測し、残差があれば加える
+                if new_u is None:
+                    new_u, new_v = self.ref_u.copy(), self.ref_v.copy()
+                cy0, cx0, cy1, cx1 = y0 // 2, x0 // 2, y1 // 2, x1 // 2
+                pu = self._chroma_pred(self.ref_u, cy0, cx0, cy1, cx1, dy, dx)
+                pv = self._chroma_pred(self.ref_v, cy0, cx0, cy1, cx1, dy, dx)
+                if pu is not None and pv is not None:
+                    if ru is not None:
+                        pu = np.clip(pu + ru[:cy1 - cy0, :cx1 - cx0], 0, 255)
+                        pv = np.clip(pv + rv[:cy1 - cy0, :cx1 - cx0], 0, 255)
+                    new_u[cy0:cy1, cx0:cx1] = pu
+                    new_v[cy0:cy1, cx0:cx1] = pv
+
         # ここまで来たら、たとえ一部ブロックが欠けていても new_y は「とりあえず成立」している
-        bgr = self._yuv420_to_bgr(new_y, self.ref_u, self.ref_v)
+        if new_u is None:
+            new_u, new_v = self.ref_u, self.ref_v
+        return self._finish_p(new_y, new_u, new_v)
+
+    def _finish_p(self, new_y: np.ndarray, new_u: np.ndarray, new_v: np.ndarray) -> np.ndarray:
+        """復元した Y/U/V を BGR にして参照を更新する"""
+        bgr = self._yuv420_to_bgr(new_y, new_u, new_v)
 
         # 参照更新
         self.ref_bgr = bgr.copy()
         self.ref_y = new_y
-        self.last_shape = (h, w)
+        self.ref_u, self.ref_v = new_u, new_v
         return bgr
+
+    def _decode_p_q(self, payload: bytes, h: int, w: int, block: int, flags: int, nblocks: int):
+        """
+        VER_Q の P フレームを (Y, U, V) に復元する。ストリームが壊れている・ビットマップが合わなければ None。
+        ストリームが途中で切れていれば、残差が届かなかったブロックは前フレームのままにする。
+        """
+        p2 = struct.calcsize(P2_HDR_FMT)
+        if len(payload) < p2 or block == 0:
+            return None
+        qstep, _res = struct.unpack_from(P2_HDR_FMT, payload)
+        try:
+            stream = zlib.decompressobj().decompress(payload[p2:])#途中までしか無くても展開できた分を返す
+        except zlib.error:
+            return None
+
+        chroma = bool(flags & FLAG_CHROMA) and block % 2 == 0
+        cb = block // 2
+        L = block * block + (2 * cb * cb if chroma else 0)#1 ブロックの残差の要素数
+        nby, nbx = -(-h // block), -(-w // block)
+        nmap = (nby * nbx + 7) // 8
+        off_mv = nmap
+        off_has = off_mv + 2 * nblocks
+        off_q = off_has + (nblocks + 7) // 8
+        if len(stream) < off_q:#ビットマップ・動きベクトルが揃っていない
+            return None
+
+        sent = np.unpackbits(np.frombuffer(stream, dtype=np.uint8, count=nmap))[:nby * nbx].reshape(nby, nbx)
+        bys, bxs = np.nonzero(sent)#送られたブロック（行優先）
+        if len(bys) != nblocks:
+            return None
+        mv = np.frombuffer(stream, dtype=np.int8, count=2 * nblocks, offset=off_mv).reshape(nblocks, 2).astype(np.int32)
+        dxs, dys = mv[:, 0], mv[:, 1]
+        has = np.unpackbits(np.frombuffer(stream, dtype=np.uint8, count=(nblocks + 7) // 8, offset=off_has))[:nblocks].astype(bool)
+
+        # 残差（届いた分だけ）
+        res = np.zeros((nblocks, L), dtype=np.int16)
+        got = np.nonzero(has)[0][:(len(stream) - off_q) // L]
+        res[got] = np.frombuffer(stream, dtype=np.int8, count=len(got) * L, offset=off_q).reshape(-1, L).astype(np.int16) * qstep
+        ok = ~has
+        ok[got] = True#残差が届かなかったブロックは使わない
+
+        # 動きベクトルは画像内に収まるブロックが参照の内側を指すときだけ有効
+        moved = (dys != 0) | (dxs != 0)
+        py, px = bys * block + dys, bxs * block + dxs
+        inside = (py >= 0) & (px >= 0) & (py + block <= h) & (px + block <= w) & ((bys + 1) * block <= h) & ((bxs + 1) * block <= w)
+        ok &= ~moved | inside
+        bys, bxs, dys, dxs, res, moved = bys[ok], bxs[ok], dys[ok], dxs[ok], res[ok], moved[ok]
+        n = len(bys)
+
+        pred = sliding_window_view(_pad_to_blocks(self.ref_y, block), (block, block))[bys * block + dys, bxs * block + dxs]
+        new_y = _recon_blocks(self.ref_y, block, bys, bxs, pred, res[:, :block * block].reshape(n, block, block))
+        new_u, new_v = self.ref_u, self.ref_v
+        if chroma or (moved.any() and block % 2 == 0):
+            if chroma:
+                res_u = res[:, block * block:block * block + cb * cb].reshape(n, cb, cb)
+                res_v = res[:, block * block + cb * cb:].reshape(n, cb, cb)
+            else:
+                res_u = res_v = np.zeros((n, cb, cb), dtype=np.int16)
+            new_u = _recon_blocks(self.ref_u, cb, bys, bxs, _chroma_pred_blocks(self.ref_u, cb, bys, bxs, dys, dxs), res_u)
+            new_v = _recon_blocks(self.ref_v, cb, bys, bxs, _chroma_pred_blocks(self.ref_v, cb, bys, bxs, dys, dxs), res_v)
+        return new_y, new_u, new_v
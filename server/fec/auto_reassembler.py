@@ -0,0 +1,60 @@
+# auto_reassembler.py --- v2 ヘッダの FEC方式を見て再構成器を振り分ける（fec="auto"）
+from typing import Any, Callable, Dict, Optional
+
+from .packet_header import PacketHeader, SCHEME_NAMES, parse_header
+
+
+class AutoReassembler:
+    """
+    パケット毎にヘッダを 1 回だけ解析し、scheme に対応する再構成器へ hdr ごと渡す。
+    再構成器は最初にその方式のパケットが来た時に make(name) で作る。
+    方式が載っていない v1 パケットは fallback（既定 "none"）として扱う。
+    """
+
+    def __init__(self, make: Callable[[str], Any], fallback: str = "none"):
+        self.make = make
+        self.fallback = fallback
+        self.reassemblers: Dict[str, Any] = {}
+        self.unknown_scheme = 0
+
+    def _get(self, name: str):
+        r = self.reassemblers.get(name)
+        if r is None:
+            r = self.reassemblers[name] = self.make(name)
+        return r
+
+    def add_packet(self, pkt: bytes, hdr: Optional[PacketHeader] = None):#チャンクを追加し、フレーム完成時にデータを返す
+        if hdr is None:
+            hdr = parse_header(pkt)
+            if hdr is None:
+                return None
+        if hdr.version < 2:
+            name = self.fallback
+        else:
+            name = SCHEME_NAMES.get(hdr.scheme)
+            if name is None:#未知の方式
+                self.unknown_scheme += 1
+                return None
+        return self._get(name).add_packet(pkt, hdr)
+
+    def take_partial(self):
+        """各方式の再構成器が期限切れ時に組み立てた部分フレーム"""
+        out = []
+        for r in self.reassemblers.values():
+            out.extend(r.take_partial())
+        return out
+
+    def expire(self):
+        for r in self.reassemblers.values():
+            r.expire()
+
+    def flush_before(self, fid: int):
+        for r in self.reassemblers.values():
+            r.flush_before(fid)
+
+    def stats(self) -> dict:
+        """方式毎の再構成器の統計"""
+        out: Dict[str, Any] = {"unknown_scheme": self.unknown_scheme}
+        for name, r in self.reassemblers.items():
+            out[name] = r.stats() if hasattr(r, "stats") else {}
+        return out
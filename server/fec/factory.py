@@ -0,0 +1,37 @@
+# factory.py --- FECモードに応じた Reassembler の生成（server.py / VideoReceiver 共通）
+from typing import Any
+
+from .auto_reassembler import AutoReassembler
+from .fec_reassembler_low import FECLowReassembler
+from .fec_reassembler_mid import FECMediumReassembler
+from .fec_reassembler_high import FECHighReassembler
+from .fec_reassembler_rs import FECRSReassembler
+from .simple_reassembler import SimpleFrameReassembler
+
+
+def make_reassembler(args) -> Any:
+    """
+    args.fec（auto/none/low/mid/high/rs）に応じた Reassembler を返す。
+    auto は v2 ヘッダの方式で振り分ける（v1 パケットは none 扱い）。
+    args.reasm_timeout / args.reasm_max_frames は全モード共通の保持窓設定。
+    """
+    if args.fec == "auto":
+        return AutoReassembler(lambda name: _make(name, args))
+    return _make(args.fec, args)
+
+
+def _make(fec: str, args) -> Any:
+    window = dict(timeout=args.reasm_timeout, max_frames=args.reasm_max_frames)
+
+    if fec == "none":
+        return SimpleFrameReassembler(**window)
+    elif fec == "low":
+        return FECLowReassembler(**window)
+    elif fec == "mid":
+        return FECMediumReassembler(**window)
+    elif fec == "high":
+        return FECHighReassembler(**window)
+    elif fec == "rs":
+        return FECRSReassembler(k=args.fec_k, r=args.fec_r, **window)
+    else:
+        return SimpleFrameReassembler(**window)
@@ -1,22 +1,21 @@
 # fec_reassembler_high.py  --- packet.py を使わない完全単独版
-import struct
+import time
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 
-# === packet.py の依存を排除 ===
-HEADER_FMT = "!IHH"
-HEADER_SIZE = struct.calcsize(HEADER_FMT)
-# ===============================
+import numpy as np
 
-K = 8
+from .frame_window import FrameWindow, DEFAULT_TIMEOUT, DEFAULT_MAX_FRAMES
+from .layout import GroupLayout
+from .packet_header import FLAG_SLICED, PacketHeader, SCHEME_HIGH, parse_header
+from .slices import PartialFrames, build_frame
+
+K = 8  # v1 ヘッダ用（v2 はヘッダの k を使う）
 R = 4
 MASKS = [1,2,3,4,5,6,7,8]
 
-def _xor_bytes(a: bytes, b: bytes) -> bytes:#バイト列のXORを取る
-    if len(a) < len(b):
-        a += b"\x00" * (len(b) - len(a))
-    elif len(b) < len(a):
-        b += b"\x00" * (len(a) - len(b))
-    return bytes(x^y for x,y in zip(a,b))
+# _COEF[b, j] = MASKS[j] の bit b（パリティ b にデータ j が含まれるか）
+_COEF = np.array([[(m >> b) & 1 for m in MASKS] for b in range(R)], dtype=bool)
 
 def _solve_groups(total: int, k=K, r=R):#チャンク総数からデータチャンク数とグループ数を推定
     T = total
@@ -31,141 +30,131 @@ def _solve_groups(total: int, k=K, r=R):#チャンク総数からデータチャ
             return (D, G)
     return (T, 0)
 
+@lru_cache(maxsize=256)
+def _layout(total: int) -> GroupLayout:#total_chunks 毎の配置表（フレーム間で共有）
+    D, G = _solve_groups(total)
+    return GroupLayout(D, G, K, R)
+
+@lru_cache(maxsize=256)
+def _layout_v2(D: int, k: int) -> GroupLayout:#v2: データ数と k から配置表
+    return GroupLayout(D, (D + k - 1) // k, k, R)
+
 class _FrameState:
-    def __init__(self, fid: int, total: int):
+    def __init__(self, fid: int, layout: GroupLayout, frame_len: int = 0, flags: int = 0):
         self.frame_id = fid
-        self.total_chunks = total
-        self.D, self.G = _solve_groups(total)
-
-        self.di = []
-        rem = self.D
-        for _ in range(self.G):
-            t = K if rem >= K else rem
-            self.di.append(t)
-            rem -= t
-
-        self.group_start = []
-        cur = 0
-        for g in range(self.G):
-            self.group_start.append(cur)
-            cur += self.di[g] + R
+        self.frame_len = frame_len#0 は不明（v1）
+        self.flags = flags
+        self.layout = layout
+        self.D, self.G = self.layout.D, self.layout.G
+        self.di = self.layout.di
+        self._locate = self.layout.locate
 
         self.data = [[None]*d for d in self.di]
         self.par = [[None]*R for _ in range(self.G)]
 
+        self.data_count = [0]*self.G#グループ毎の受信データ数
+        self.par_count = [0]*self.G#グループ毎の受信パリティ数
+
         self.data_received = 0
         self.recovered = 0
+        self.recover_time = 0.0#復元処理に要した時間（秒）
+        self.recover_calls = 0
+        self.groups_recovered = 0
+
+    def data_chunks(self) -> List[Optional[bytes]]:#データ順のチャンク列（欠損は None）
+        return [c for g in self.data for c in g]
 
-    def _locate(self, cid):#チャンクIDからグループ番号、ローカルID、冗長パケットかどうかを取得
-        for g in range(self.G):
-            st = self.group_start[g]
-            size = self.di[g] + R
-            if st <= cid < st+size:
-                local = cid - st
-                if local < self.di[g]:
-                    return g, local, False
-                else:
-                    return g, local-self.di[g], True
-        return None, None, False
-
-    def _recover_group_gauss(self, g: int):#fec復元をガウスの消去法で試みる
+    def _recover_group_gauss(self, g: int):#fec復元をガウスの消去法で試みる（GF(2) 上、NumPy 行列で一括）
         d = self.di[g]
         missing = [i for i in range(d) if self.data[g][i] is None]
-        if not missing:
+        if not missing:#復元済み（後から届いたパリティ）
             return
-
         eq_rows = [b for b in range(R) if self.par[g][b] is not None]
-        if not eq_rows:
-            return
-
         m = len(missing)
-        if len(eq_rows) < m or m > R:
-            return
-
-        rhs = [self.par[g][b] for b in eq_rows]
-        for row_i,b in enumerate(eq_rows):
-            acc = rhs[row_i]
-            for j in range(d):
-                if self.data[g][j] is not None:
-                    mj = MASKS[j % len(MASKS)]
-                    if (mj>>b)&1:
-                        acc = _xor_bytes(acc, self.data[g][j])
-            rhs[row_i] = acc
-
-        A = [[0]*m for _ in range(len(eq_rows))]
-        for rr,b in enumerate(eq_rows):
-            for cc,miss_j in enumerate(missing):
-                mj = MASKS[miss_j % len(MASKS)]
-                A[rr][cc] = 1 if ((mj>>b)&1) else 0
-
-        rows = len(eq_rows)
-        cols = m
-        pivot_row_for_col = [-1]*cols
 
+        t0 = time.perf_counter()
+        known = [j for j in range(d) if self.data[g][j] is not None]
+        W = max(len(x) for x in [self.par[g][b] for b in eq_rows] + [self.data[g][j] for j in known])
+
+        # 右辺: パリティ行（長さを W に揃えて (rows, W) の行列に）
+        rhs = np.zeros((len(eq_rows), W), dtype=np.uint8)
+        for rr, b in enumerate(eq_rows):
+            pb = self.par[g][b]
+            rhs[rr, :len(pb)] = np.frombuffer(pb, dtype=np.uint8)
+
+        # 既知データの寄与を消す: rhs[rr] ^= XOR_{j: mask_j の bit b が 1} data[j]
+        if known:
+            kd = np.zeros((len(known), W), dtype=np.uint8)
+            for kk, j in enumerate(known):
+                dj = self.data[g][j]
+                kd[kk, :len(dj)] = np.frombuffer(dj, dtype=np.uint8)
+            sel = _COEF[np.ix_(eq_rows, [j % len(MASKS) for j in known])]#(rows, known)
+            for rr in range(len(eq_rows)):
+                if sel[rr].any():
+                    rhs[rr] ^= np.bitwise_xor.reduce(kd[sel[rr]], axis=0)
+
+        # 係数行列 A (rows, m)
+        A = _COEF[np.ix_(eq_rows, [j % len(MASKS) for j in missing])].astype(np.uint8)
+
+        rows, cols = A.shape
         r = 0
+        pivot_row_for_col = [-1]*cols
         for c in range(cols):
-            piv = -1
-            for rr in range(r, rows):
-                if A[rr][c] == 1:
-                    piv = rr
-                    break
-            if piv == -1:
+            nz = np.flatnonzero(A[r:, c])
+            if nz.size == 0:
                 continue
+            piv = r + int(nz[0])
             if piv != r:
-                A[r], A[piv] = A[piv], A[r]
-                rhs[r], rhs[piv] = rhs[piv], rhs[r]
-
+                A[[r, piv]] = A[[piv, r]]
+                rhs[[r, piv]] = rhs[[piv, r]]
             pivot_row_for_col[c] = r
 
-            for rr in range(rows):
-                if rr != r and A[rr][c] == 1:
-                    for cc in range(c, cols):
-                        A[rr][cc] ^= A[r][cc]
-                    rhs[rr] = _xor_bytes(rhs[rr], rhs[r])
+            elim = np.flatnonzero(A[:, c])#ピボット以外で列 c が 1 の行を一括消去
+            elim = elim[elim != r]
+            if elim.size:
+                A[elim] ^= A[r]
+                rhs[elim] ^= rhs[r]
 
             r += 1
             if r == rows:
                 break
 
-        rank = sum(1 for pr in pivot_row_for_col if pr != -1)
-        if rank < m:
-            return
+        self.recover_time += time.perf_counter() - t0
+        self.recover_calls += 1
 
-        sol = [b"\x00"]*m
-        for c in range(cols-1, -1, -1):
-            pr = pivot_row_for_col[c]
-            if pr == -1:
-                continue
-            acc = rhs[pr]
-            sol[c] = acc
+        if any(pr == -1 for pr in pivot_row_for_col):#ランク不足
+            return
 
-        for idx,data_i in enumerate(missing):
-            if self.data[g][data_i] is None:
-                self.data[g][data_i] = sol[idx]
-                self.data_received += 1
-                self.recovered += 1
+        for c, data_i in enumerate(missing):
+            self.data[g][data_i] = rhs[pivot_row_for_col[c]].tobytes()
+            self.data_received += 1
+            self.data_count[g] += 1
+            self.recovered += 1
+        self.groups_recovered += 1
 
     def _try_recover(self, g:int):
+        # 欠損が無い・パリティ数が欠損数に満たない間は解けないので何もしない
+        missing = self.di[g] - self.data_count[g]
+        if missing <= 0 or missing > self.par_count[g]:
+            return
         self._recover_group_gauss(g)
 
-    def add_packet(self, pkt: bytes):#フレームを作成、作成できたらデータを返す
-        if len(pkt) < HEADER_SIZE:
-            return None
-
-        fid, cid, total = struct.unpack(HEADER_FMT, pkt[:HEADER_SIZE])
-        payload = pkt[HEADER_SIZE:]
-
+    def add_packet(self, cid: int, payload: bytes):#フレームを作成、作成できたらデータを返す
         g, li, is_par = self._locate(cid)
         if g is None:
             return None
 
         if not is_par:
-            if self.data[g][li] is None:
-                self.data[g][li] = payload
-                self.data_received += 1
+            if self.data[g][li] is not None:#重複は状態が変わらないので復元も試さない
+                return None
+            self.data[g][li] = payload
+            self.data_received += 1
+            self.data_count[g] += 1
         else:
-            if 0 <= li < R:
-                self.par[g][li] = payload
+            if not (0 <= li < R) or self.par[g][li] is not None:
+                return None
+            self.par[g][li] = payload
+            self.par_count[g] += 1
 
         self._try_recover(g)
 
@@ -176,27 +165,73 @@ class _FrameState:
                     if self.data[gg][i] is None:
                         return None
                     out.append(self.data[gg][i])
-            return (self.frame_id, b"".join(out), self.recovered)
+            frame_bytes = build_frame(out, self.flags, self.frame_len)
+            return (self.frame_id, frame_bytes, self.recovered)
 
         return None
 
 class FECHighReassembler:
-    def __init__(self):
-        self.frames: Dict[int, _FrameState] = {}
-
-    def add_packet(self, pkt: bytes):#チャンクを追加し、フレーム完成時にデータを返す
-        if len(pkt) < HEADER_SIZE:
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, max_frames: int = DEFAULT_MAX_FRAMES):
+        self.window = FrameWindow(timeout, max_frames, on_evict=self._on_evict)#期限切れフレームは自動で破棄
+        self.frames: Dict[int, _FrameState] = self.window.frames
+        self.partial = PartialFrames()#破棄時にスライス分割フレームを部分的に渡す
+        # グループ復元の統計（完了・破棄したフレーム分も累積）
+        self.recover_time = 0.0
+        self.recover_calls = 0
+        self.groups_recovered = 0
+
+    def _on_evict(self, fid: int, st: _FrameState):
+        self._account(st)
+        self.partial.add(fid, st.data_chunks(), st.flags, st.recovered)
+
+    def take_partial(self):
+        return self.partial.take()
+
+    def expire(self):
+        self.window.expire()
+
+    def flush_before(self, fid: int):#新しいフレームが完成した → 古いスライス分割フレームは部分フレームとして出す
+        self.window.evict_before(fid, lambda st: st.flags & FLAG_SLICED)
+
+    def _account(self, st: _FrameState):
+        self.recover_time += st.recover_time
+        self.recover_calls += st.recover_calls
+        self.groups_recovered += st.groups_recovered
+
+    def stats(self) -> dict:
+        """グループ復元の統計（per_group_ms は復元試行1回あたりの平均時間）"""
+        calls = self.recover_calls + sum(st.recover_calls for st in self.frames.values())
+        t = self.recover_time + sum(st.recover_time for st in self.frames.values())
+        return {
+            **self.window.stats(),
+            **self.partial.stats(),
+            "recover_calls": calls,
+            "groups_recovered": self.groups_recovered + sum(st.groups_recovered for st in self.frames.values()),
+            "recover_ms": round(t * 1000.0, 3),
+            "per_group_ms": round(t * 1000.0 / calls, 4) if calls else 0.0,
+        }
+
+    def _new_state(self, hdr: PacketHeader) -> _FrameState:
+        if hdr.version >= 2:#v2 はヘッダのデータ数・k から配置が決まる
+            return _FrameState(hdr.frame_id, _layout_v2(hdr.data_total, hdr.k or K), hdr.frame_len, hdr.flags)
+        return _FrameState(hdr.frame_id, _layout(hdr.total_chunks))
+
+    def add_packet(self, pkt: bytes, hdr: Optional[PacketHeader] = None):#チャンクを追加し、フレーム完成時にデータを返す
+        if hdr is None:
+            hdr = parse_header(pkt)
+            if hdr is None:
+                return None
+        if hdr.version >= 2 and hdr.scheme != SCHEME_HIGH:#別方式のパケット
             return None
+        fid = hdr.frame_id
 
-        fid, cid, total = struct.unpack(HEADER_FMT, pkt[:HEADER_SIZE])
-
-        st = self.frames.get(fid)
-        if st is None:
-            st = _FrameState(fid, total)
-            self.frames[fid] = st
+        st = self.window.get(fid, lambda: self._new_state(hdr))
+        if st is None:#完成・破棄済みフレームの遅延パケット
+            return None
 
-        res = st.add_packet(pkt)
+        res = st.add_packet(hdr.chunk_id, bytes(pkt[hdr.size:]))#受信リング上の memoryview でも保持できるようコピー
         if res is not None:
-            del self.frames[fid]
+            self._account(st)
+            self.window.finish(fid)
             return res
         return None
@@ -1,13 +1,11 @@
 # fec_reassembler_low.py  --- packet.py を使わない単独版
-import struct
 from typing import Dict, List, Optional, Tuple
 
-# ===== packet.py の依存を完全に排除 =====
-HEADER_FMT = "!IHH"# !;ネットワーク送信　I;４バイトframe_id H;2バイトchunk_id H;2バイトtotal_chunks
-HEADER_SIZE = struct.calcsize(HEADER_FMT)#ヘッダサイズ計算
-# ==========================================
+from .frame_window import FrameWindow, DEFAULT_TIMEOUT, DEFAULT_MAX_FRAMES
+from .packet_header import FLAG_SLICED, PacketHeader, SCHEME_LOW, parse_header
+from .slices import PartialFrames, build_frame
 
-K = 8
+K = 8  # v1 ヘッダ用（v2 はヘッダの k を使う）
 R = 1
 
 def _xor_bytes(a: bytes, b: bytes) -> bytes:
@@ -18,16 +16,19 @@ def _xor_bytes(a: bytes, b: bytes) -> bytes:
     return bytes(x ^ y for x, y in zip(a, b))#aとbのXOR演算
 
 class _FrameStateLow:
-    def __init__(self, frame_id: int, data_total: int):
+    def __init__(self, frame_id: int, data_total: int, k: int = K, frame_len: int = 0, flags: int = 0):
         self.frame_id = frame_id
         self.data_total = data_total
+        self.k = k
+        self.frame_len = frame_len#0 は不明（v1）
+        self.flags = flags
 
-        self.G = (data_total + K - 1) // K if data_total > 0 else 0#グループ数
+        self.G = (data_total + k - 1) // k if data_total > 0 else 0#グループ数
 
         self.di: List[int] = []
         r = data_total
         for _ in range(self.G):#各グループのデータチャンク数を計算
-            t = K if r >= K else r
+            t = k if r >= k else r
             self.di.append(t)
             r -= t
 
@@ -39,6 +40,9 @@ class _FrameStateLow:
         self.data_received = 0
         self.recovered = 0
 
+    def data_chunks(self) -> List[Optional[bytes]]:#データ順のチャンク列（欠損は None）
+        return [c for g in self.data for c in g]
+
     def _try_recover_group(self, g: int):
         if g < 0 or g >= self.G:
             return
@@ -59,13 +63,7 @@ class _FrameStateLow:
         self.data_received += 1#受信済みチャンク数をインクリメント
         self.recovered += 1#復元チャンク数をインクリメント
 
-    def add_packet(self, packet: bytes):
-        if len(packet) < HEADER_SIZE:#パケットサイズ確認
-            return None
-
-        frame_id, chunk_id, data_total_hdr = struct.unpack(HEADER_FMT, packet[:HEADER_SIZE])#ヘッダ解析
-        payload = packet[HEADER_SIZE:]#ヘッダの後ろの映像データを取得
-
+    def add_packet(self, chunk_id: int, payload: bytes):
         if chunk_id & 0x8000:#最上位ビットが1なら冗長チャンク　先に冗長パケットが来た場合
             g = chunk_id & 0x7FFF#グループID取得
             if 0 <= g < self.G:#グループ範囲確認
@@ -74,8 +72,8 @@ class _FrameStateLow:
         else:#先に映像データチャンクが来た場合
             cid = int(chunk_id)#データチャンクID取得
             if 0 <= cid < self.data_total:#データチャンク範囲確認
-                g = cid // K#どのグループか
-                li = cid % K#何チャンク目か
+                g = cid // self.k#どのグループか
+                li = cid % self.k#何チャンク目か
                 if li < self.di[g] and self.data[g][li] is None:#チャンク範囲確認と未受信確認
                     self.data[g][li] = payload#データチャンク保存
                     self.data_received += 1#受信済みチャンク数インクリメント
@@ -88,27 +86,53 @@ class _FrameStateLow:
                     if self.data[g][i] is None:
                         return None
                     out.append(self.data[g][i])#チャンク結合
-            return (self.frame_id, b"".join(out), self.recovered)#フレーム復元完了
+            frame_bytes = build_frame(out, self.flags, self.frame_len)
+            return (self.frame_id, frame_bytes, self.recovered)#フレーム復元完了
 
         return None
 
 class FECLowReassembler:
-    def __init__(self):
-        self.frames: Dict[int, _FrameStateLow] = {}
-
-    def add_packet(self, packet: bytes):
-        if len(packet) < HEADER_SIZE:
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, max_frames: int = DEFAULT_MAX_FRAMES):
+        self.window = FrameWindow(timeout, max_frames, on_evict=self._on_evict)#期限切れフレームは自動で破棄
+        self.frames: Dict[int, _FrameStateLow] = self.window.frames
+        self.partial = PartialFrames()#破棄時にスライス分割フレームを部分的に渡す
+
+    def _on_evict(self, fid: int, st: _FrameStateLow):
+        self.partial.add(fid, st.data_chunks(), st.flags, st.recovered)
+
+    def take_partial(self):
+        return self.partial.take()
+
+    def expire(self):
+        self.window.expire()
+
+    def flush_before(self, fid: int):#新しいフレームが完成した → 古いスライス分割フレームは部分フレームとして出す
+        self.window.evict_before(fid, lambda st: st.flags & FLAG_SLICED)
+
+    def stats(self) -> dict:
+        return {**self.window.stats(), **self.partial.stats()}
+
+    def add_packet(self, packet: bytes, hdr: Optional[PacketHeader] = None):
+        if hdr is None:
+            hdr = parse_header(packet)#ヘッダ解析
+            if hdr is None:
+                return None
+
+        frame_id = hdr.frame_id
+        if hdr.version >= 2:
+            if hdr.scheme != SCHEME_LOW:#別方式のパケット
+                return None
+            factory = lambda: _FrameStateLow(frame_id, hdr.data_total, hdr.k or K, hdr.frame_len, hdr.flags)
+        else:
+            factory = lambda: _FrameStateLow(frame_id, hdr.total_chunks)#v1 は total_chunks 欄がデータ数
+
+        # フレーム状態取得。無ければ新しく作成して登録し、後から来るチャンクもすべてここに蓄積できるようにする
+        st = self.window.get(frame_id, factory)
+        if st is None:#完成・破棄済みフレームの遅延パケット
             return None
 
-        frame_id, chunk_id, data_total = struct.unpack(HEADER_FMT, packet[:HEADER_SIZE])#ヘッダ解析
-
-        st = self.frames.get(frame_id)#フレーム状態取得
-        if st is None:
-            st = _FrameStateLow(frame_id, data_total)#新しいフレーム状態を作成
-            self.frames[frame_id] = st#このフレームを復元するための状態を辞書に登録し、後から来るチャンクもすべてここに蓄積できるようにする
-
-        res = st.add_packet(packet)#チャンク追加と復元試行
+        res = st.add_packet(hdr.chunk_id, bytes(packet[hdr.size:]))#チャンク追加と復元試行（受信リング上の memoryview でも保持できるようコピー）
         if res is not None:#フレーム完成
-            del self.frames[frame_id]#メモリ解放
+            self.window.finish(frame_id)#メモリ解放
             return res
         return None
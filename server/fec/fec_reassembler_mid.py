@@ -1,13 +1,13 @@
 # fec_reassembler_mid.py  --- packet.py 依存なし
-import struct
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 
-# === packet.py の依存を削除 ===
-HEADER_FMT = "!IHH"
-HEADER_SIZE = struct.calcsize(HEADER_FMT)
-# ==============================
+from .frame_window import FrameWindow, DEFAULT_TIMEOUT, DEFAULT_MAX_FRAMES
+from .layout import GroupLayout
+from .packet_header import FLAG_SLICED, PacketHeader, SCHEME_MID, parse_header
+from .slices import PartialFrames, build_frame
 
-K = 8
+K = 8  # v1 ヘッダ用（v2 はヘッダの k を使う）
 R = 2  # p0: all XOR, p1: even XOR
 
 def _xor_bytes(a: bytes, b: bytes) -> bytes:
@@ -20,10 +20,10 @@ def _xor_bytes(a: bytes, b: bytes) -> bytes:
 def _ceil_div(a, b):
     return (a + b - 1) // b#グループ数を計算
 
-def _groups_from_data_total(D: int):#グループの総チャンク数を計算
+def _groups_from_data_total(D: int, k: int = K):#グループの総チャンク数を計算
     if D <= 0:
         return (0, 0)
-    G = _ceil_div(D, K)
+    G = _ceil_div(D, k)
     T_full = D + G*R
     return (G, T_full)
 
@@ -37,24 +37,27 @@ def _solve_from_total_full(T_full: int):#グループのデータチャンク数
             return (D, G)
     return (T_full, 0)
 
+@lru_cache(maxsize=256)
+def _layout(D: int, G: int, k: int = K) -> GroupLayout:#配置表（フレーム間で共有）
+    return GroupLayout(D, G, k, R)
+
+@lru_cache(maxsize=256)
+def _layout_from_total(total: int) -> GroupLayout:#total_chunks から配置表を引く（探索はtotal毎に1回だけ）
+    D1, G1 = _solve_from_total_full(total)#総チャンク数から推定
+    if G1 > 0:
+        return _layout(D1, G1)
+    G2, _ = _groups_from_data_total(total)#それでもダメな場合
+    return _layout(total, G2)
+
 class _FrameState:
-    def __init__(self, frame_id: int, D: int, G: int):
+    def __init__(self, frame_id: int, layout: GroupLayout, frame_len: int = 0, flags: int = 0):
         self.frame_id = frame_id
-        self.D = max(0, D)
-        self.G = max(0, G)
-
-        self.di = []
-        remain = self.D
-        for _ in range(self.G):
-            t = K if remain >= K else remain
-            self.di.append(t)
-            remain -= t
-
-        self.group_start = []
-        cur = 0
-        for g in range(self.G):
-            self.group_start.append(cur)
-            cur += self.di[g] + R
+        self.frame_len = frame_len#0 は不明（v1）
+        self.flags = flags
+        self.layout = layout
+        self.D, self.G = layout.D, layout.G
+        self.di = layout.di
+        self._locate = layout.locate
 
         self.data = [[None]*d for d in self.di]
         self.p0 = [None]*self.G
@@ -64,17 +67,8 @@ class _FrameState:
         self.recovered = 0
         self._fec_filled = [set() for _ in range(self.G)]
 
-    def _locate(self, cid: int):#チャンクIDからグループとチャンク番号を特定
-        for g in range(self.G):
-            start = self.group_start[g]
-            size = self.di[g] + R
-            if start <= cid < start+size:
-                local = cid - start
-                if local < self.di[g]:
-                    return (g, local, False)
-                else:
-                    return (g, local - self.di[g], True)
-        return (None, None, False)
+    def data_chunks(self) -> List[Optional[bytes]]:#データ順のチャンク列（欠損は None）
+        return [c for g in self.data for c in g]
 
     def _fill_by_fec(self, g: int, i: int, payload: bytes):#FECで復元したチャンクを格納
         if self.data[g][i] is None:
@@ -129,11 +123,7 @@ class _FrameState:
             self._fill_by_fec(g, a, Da)
             self._fill_by_fec(g, b, Db)
 
-    def add_packet(self, pkt: bytes):#チャンクを追加し、フレーム完成時にデータを返す
-        if len(pkt) < HEADER_SIZE: return None
-        frame_id, cid, total = struct.unpack(HEADER_FMT, pkt[:HEADER_SIZE])
-        payload = pkt[HEADER_SIZE:]
-
+    def add_packet(self, cid: int, payload: bytes):#チャンクを追加し、フレーム完成時にデータを返す
         g, li, is_parity = self._locate(cid)
         if g is None:
             return None
@@ -157,53 +147,55 @@ class _FrameState:
                     if self.data[gg][i] is None:
                         return None
                     out.append(self.data[gg][i])
-            return (self.frame_id, b"".join(out), self.recovered)
+            frame_bytes = build_frame(out, self.flags, self.frame_len)
+            return (self.frame_id, frame_bytes, self.recovered)
         return None
 
 class FECMediumReassembler:
-    def __init__(self):
-        self.frames: Dict[int, _FrameState] = {}
-        self.meta: Dict[int, int] = {}  # frame_id → data_total
-
-    def register_meta(self, fid: int, D: int):#フレームが何個のデータチャンクで構成されるか登録
-        self.meta[fid] = D
-
-    def _ensure_state(self, fid: int, total: int):#フレーム状態を確保
-        st = self.frames.get(fid)
-        if st is not None:
-            return st
-
-        if fid in self.meta:#メタ情報がある場合はそれを優先
-            D = self.meta[fid]
-            G, _ = _groups_from_data_total(D)
-            st = _FrameState(fid, D, G)
-            self.frames[fid] = st
-            return st
-
-        D1, G1 = _solve_from_total_full(total)#MATA情報がない場合は総チャンク数から推定
-        if G1 > 0:
-            st = _FrameState(fid, D1, G1)
-            self.frames[fid] = st
-            return st
-
-        D2 = total
-        G2, _ = _groups_from_data_total(D2)#それでもダメな場合
-        st = _FrameState(fid, D2, G2)
-        self.frames[fid] = st
-        return st
-
-    def add_packet(self, pkt: bytes):#チャンクを追加し、フレーム完成時にデータを返す
-        if len(pkt) < HEADER_SIZE: return None
-        fid, cid, total = struct.unpack(HEADER_FMT, pkt[:HEADER_SIZE])
-
-        st = self.frames.get(fid)
-        if st is None:
-            st = self._ensure_state(fid, total)
-
-        res = st.add_packet(pkt)
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, max_frames: int = DEFAULT_MAX_FRAMES):
+        self.window = FrameWindow(timeout, max_frames, on_evict=self._on_evict)#期限切れフレームは自動で破棄
+        self.frames: Dict[int, _FrameState] = self.window.frames
+        self.partial = PartialFrames()#破棄時にスライス分割フレームを部分的に渡す
+
+    def _on_evict(self, fid: int, st: _FrameState):
+        self.partial.add(fid, st.data_chunks(), st.flags, st.recovered)
+
+    def take_partial(self):
+        return self.partial.take()
+
+    def expire(self):
+        self.window.expire()
+
+    def flush_before(self, fid: int):#新しいフレームが完成した → 古いスライス分割フレームは部分フレームとして出す
+        self.window.evict_before(fid, lambda st: st.flags & FLAG_SLICED)
+
+    def stats(self) -> dict:
+        return {**self.window.stats(), **self.partial.stats()}
+
+    def _new_state(self, hdr: PacketHeader):#フレーム状態を作成
+        if hdr.version >= 2:#v2 はヘッダのデータ数・k をそのまま使う
+            k = hdr.k or K
+            G, _ = _groups_from_data_total(hdr.data_total, k)
+            return _FrameState(hdr.frame_id, _layout(hdr.data_total, G, k), hdr.frame_len, hdr.flags)
+
+        layout = _layout_from_total(hdr.total_chunks)#v1 は総チャンク数から推定（キャッシュ済み）
+        return _FrameState(hdr.frame_id, layout)
+
+    def add_packet(self, pkt: bytes, hdr: Optional[PacketHeader] = None):#チャンクを追加し、フレーム完成時にデータを返す
+        if hdr is None:
+            hdr = parse_header(pkt)
+            if hdr is None:
+                return None
+        if hdr.version >= 2 and hdr.scheme != SCHEME_MID:#別方式のパケット
+            return None
+        fid = hdr.frame_id
+
+        st = self.window.get(fid, lambda: self._new_state(hdr))
+        if st is None:#完成・破棄済みフレームの遅延パケット
+            return None
+
+        res = st.add_packet(hdr.chunk_id, bytes(pkt[hdr.size:]))#受信リング上の memoryview でも保持できるようコピー
         if res is not None:
-            del self.frames[fid]
-            if fid in self.meta:
-                del self.meta[fid]
+            self.window.finish(fid)
             return res
         return None
@@ -0,0 +1,181 @@
+# fec_reassembler_rs.py  --- Reed-Solomon（GF(256) Cauchy 行列）FEC の再構成
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .frame_window import FrameWindow, DEFAULT_TIMEOUT, DEFAULT_MAX_FRAMES
+from .gf256 import cauchy_matrix, check_rs_params, gf_mat_inv, gf_mul_acc
+from .packet_header import FLAG_SLICED, PacketHeader, SCHEME_RS, parse_header
+from .slices import PartialFrames, build_frame
+
+K = 8  # v1 ヘッダ用（v2 はヘッダの k, r を使う）
+R = 4
+
+def _solve_groups(total: int, k: int, r: int):#チャンク総数からデータチャンク数とグループ数を推定
+    maxG = total // (k+r) + 3
+    for G in range(0, maxG+1):
+        D = total - r*G
+        if D < 0:
+            continue
+        if G == 0 and D == 0:
+            return (0, 0)
+        if G == (D + k - 1) // k:
+            return (D, G)
+    return (total, 0)
+
+@lru_cache(maxsize=32)
+def _cauchy(k: int, r: int) -> List[List[int]]:#(k, r) 毎の符号化行列（フレーム間で共有）
+    return cauchy_matrix(k, r)
+
+class _FrameState:
+    def __init__(self, fid: int, D: int, k: int, r: int, frame_len: int = 0, flags: int = 0):
+        self.frame_id = fid
+        self.frame_len = frame_len#0 は不明（v1）
+        self.flags = flags
+        self.k = k
+        self.r = r
+        self.C = _cauchy(k, r)
+        self.D, self.G = D, (D + k - 1) // k
+
+        self.di = [min(k, self.D - g*k) for g in range(self.G)]#各グループのデータチャンク数
+        self.data = [[None]*d for d in self.di]
+        self.par = [[None]*r for _ in range(self.G)]
+        self.have = [0]*self.G#グループ毎の受信数（データ＋パリティ）
+
+        self.data_received = 0
+        self.recovered = 0
+
+    def data_chunks(self) -> List[Optional[bytes]]:#データ順のチャンク列（欠損は None）
+        return [c for g in self.data for c in g]
+
+    def _locate(self, cid: int):#チャンクIDからグループ番号、ローカルID、冗長パケットかどうかを取得
+        size = self.k + self.r
+        g, local = divmod(cid, size)#最終グループ以外は k+r 個ずつ並ぶ
+        if g >= self.G:
+            return None, None, False
+        d = self.di[g]
+        if local < d:
+            return g, local, False
+        if local - d < self.r:
+            return g, local - d, True
+        return None, None, False
+
+    def _recover_group(self, g: int):#受信数がデータ数に達したグループを RS で復元
+        d = self.di[g]
+        missing = [i for i in range(d) if self.data[g][i] is None]
+        if not missing or self.have[g] < d:
+            return
+        rows = [j for j in range(self.r) if self.par[g][j] is not None][:len(missing)]
+
+        W = max(len(self.par[g][j]) for j in rows)
+        def as_arr(b: bytes) -> np.ndarray:
+            a = np.zeros(W, dtype=np.uint8)
+            a[:len(b)] = np.frombuffer(b, dtype=np.uint8)[:W]
+            return a
+
+        # 既知データの寄与を引いたシンドローム s_j = p_j + Σ C[j][i] d_i
+        known = [(i, as_arr(self.data[g][i])) for i in range(d) if self.data[g][i] is not None]
+        synd = []
+        for j in rows:
+            s = as_arr(self.par[g][j])
+            for i, di in known:
+                gf_mul_acc(s, self.C[j][i], di)
+            synd.append(s)
+
+        # 欠損列の部分 Cauchy 行列を解く（常に正則）
+        inv = gf_mat_inv([[self.C[j][i] for i in missing] for j in rows])
+        for mi, i in enumerate(missing):
+            out = np.zeros(W, dtype=np.uint8)
+            for m, s in enumerate(synd):
+                gf_mul_acc(out, inv[mi][m], s)
+            self.data[g][i] = out.tobytes()
+            self.data_received += 1
+            self.recovered += 1
+
+    def add_packet(self, cid: int, payload: bytes):#フレームを作成、作成できたらデータを返す
+        g, li, is_par = self._locate(cid)
+        if g is None:
+            return None
+
+        if not is_par:
+            if self.data[g][li] is not None:
+                return None
+            self.data[g][li] = payload
+            self.data_received += 1
+        else:
+            if self.par[g][li] is not None:
+                return None
+            self.par[g][li] = payload
+        self.have[g] += 1
+
+        self._recover_group(g)
+
+        if self.data_received == self.D:
+            out = []
+            for gg in range(self.G):
+                out.extend(self.data[gg])
+            frame_bytes = build_frame(out, self.flags, self.frame_len)
+            return (self.frame_id, frame_bytes, self.recovered)
+
+        return None
+
+class FECRSReassembler:
+    def __init__(self, k: int = K, r: int = R, timeout: float = DEFAULT_TIMEOUT, max_frames: int = DEFAULT_MAX_FRAMES):
+        self.k = int(k)#v1 パケット用の既定値
+        self.r = int(r)
+        check_rs_params(self.k, self.r)#不正な既定値は受信スレッドで落ちる前にここで弾く
+        self.window = FrameWindow(timeout, max_frames, on_evict=self._on_evict)#期限切れフレームは自動で破棄
+        self.frames: Dict[int, _FrameState] = self.window.frames
+        self.partial = PartialFrames()#破棄時にスライス分割フレームを部分的に渡す
+        self.bad_header = 0#k / r / データ数が矛盾するので捨てた v2 パケット
+
+    def _on_evict(self, fid: int, st: _FrameState):
+        self.partial.add(fid, st.data_chunks(), st.flags, st.recovered)
+
+    def take_partial(self):
+        return self.partial.take()
+
+    def expire(self):
+        self.window.expire()
+
+    def flush_before(self, fid: int):#新しいフレームが完成した → 古いスライス分割フレームは部分フレームとして出す
+        self.window.evict_before(fid, lambda st: st.flags & FLAG_SLICED)
+
+    def stats(self) -> dict:
+        return {**self.window.stats(), **self.partial.stats(), "bad_header": self.bad_header}
+
+    def _valid_header(self, hdr: PacketHeader) -> bool:#v2 ヘッダの k, r, データ数が RS のフレームとして成り立つか
+        k, r = hdr.k or self.k, hdr.r or self.r
+        if k + r > 256:
+            return False
+        G = (hdr.data_total + k - 1) // k
+        return hdr.data_total + r * G == hdr.total_chunks
+
+    def _new_state(self, hdr: PacketHeader) -> _FrameState:
+        if hdr.version >= 2:#v2 はヘッダの k, r, データ数をそのまま使う
+            return _FrameState(hdr.frame_id, hdr.data_total, hdr.k or self.k, hdr.r or self.r, hdr.frame_len, hdr.flags)
+        D, _ = _solve_groups(hdr.total_chunks, self.k, self.r)
+        return _FrameState(hdr.frame_id, D, self.k, self.r)
+
+    def add_packet(self, pkt: bytes, hdr: Optional[PacketHeader] = None) -> Optional[tuple]:#チャンクを追加し、フレーム完成時にデータを返す
+        if hdr is None:
+            hdr = parse_header(pkt)
+            if hdr is None:
+                return None
+        if hdr.version >= 2 and hdr.scheme != SCHEME_RS:#別方式のパケット
+            return None
+        if hdr.version >= 2 and not self._valid_header(hdr):#不正なパケット 1 つで受信・再構成スレッドを落とさない
+            self.bad_header += 1
+            return None
+        fid = hdr.frame_id
+
+        st = self.window.get(fid, lambda: self._new_state(hdr))
+        if st is None:#完成・破棄済みフレームの遅延パケット
+            return None
+
+        res = st.add_packet(hdr.chunk_id, bytes(pkt[hdr.size:]))#受信リング上の memoryview でも保持できるようコピー
+        if res is not None:
+            self.window.finish(fid)
+            return res
+        return None
@@ -0,0 +1,117 @@
+# frame_window.py --- 再構成中フレームの保持窓（期限切れ破棄・完了済みIDの記録）
+"""
+各 Reassembler 共通の frame_id → 状態 の入れ物。
+
+- 最初のパケット到着から timeout 秒たっても完成しないフレームは破棄する
+- 同時に保持するフレーム数は max_frames まで（溢れたら最も古いものを破棄）
+- 完成・破棄したフレームの frame_id を直近 tombstones 件だけ覚えておき、
+  遅れて届いたパケット（余ったパリティ等）で状態が作り直されないようにする
+"""
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Optional
+
+DEFAULT_TIMEOUT = 1.0     # 秒
+DEFAULT_MAX_FRAMES = 64
+DEFAULT_TOMBSTONES = 256
+
+
+class FrameWindow:
+    def __init__(
+        self,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_frames: int = DEFAULT_MAX_FRAMES,
+        tombstones: int = DEFAULT_TOMBSTONES,
+        on_evict: Optional[Callable[[int, Any], None]] = None,
+    ):
+        self.timeout = float(timeout)
+        self.max_frames = max(1, int(max_frames))
+        self.on_evict = on_evict#破棄時に (frame_id, state) で呼ばれる
+
+        # frame_id -> state（作成順 = 最初のパケット到着順）
+        self.frames: "OrderedDict[int, Any]" = OrderedDict()
+        self._deadline: "dict[int, float]" = {}
+
+        # 完成・破棄済み frame_id（リングバッファ + 集合）
+        self._done_ring: "deque[int]" = deque()
+        self._done_set: "set[int]" = set()
+        self._done_max = max(1, int(tombstones))
+
+        self.completed = 0
+        self.evicted_timeout = 0
+        self.evicted_overflow = 0
+        self.evicted_superseded = 0
+        self.late_dropped = 0
+
+    def _tombstone(self, fid: int) -> None:
+        if fid in self._done_set:
+            return
+        if len(self._done_ring) >= self._done_max:
+            self._done_set.discard(self._done_ring.popleft())
+        self._done_ring.append(fid)
+        self._done_set.add(fid)
+
+    def _evict(self, fid: int) -> None:
+        st = self.frames.pop(fid)
+        del self._deadline[fid]
+        self._tombstone(fid)
+        if self.on_evict is not None:
+            self.on_evict(fid, st)
+
+    def expire(self, now: Optional[float] = None) -> None:
+        """期限切れフレームを古い順に破棄する（先頭だけ見るので通常 O(1)）"""
+        if now is None:
+            now = time.monotonic()
+        while self.frames:
+            fid = next(iter(self.frames))
+            if self._deadline[fid] > now:
+                break
+            self._evict(fid)
+            self.evicted_timeout += 1
+
+    def get(self, fid: int, factory: Callable[[], Any]) -> Optional[Any]:
+        """
+        frame_id の状態を返す。無ければ factory() で作って登録する。
+        完成・破棄済みの frame_id なら None（呼び出し側はパケットを捨てる）。
+        """
+        now = time.monotonic()
+        self.expire(now)
+
+        st = self.frames.get(fid)
+        if st is not None:
+            return st
+        if fid in self._done_set:
+            self.late_dropped += 1
+            return None
+
+        while len(self.frames) >= self.max_frames:#溢れたら最も古いフレームを破棄
+            self._evict(next(iter(self.frames)))
+            self.evicted_overflow += 1
+
+        st = factory()
+        self.frames[fid] = st
+        self._deadline[fid] = now + self.timeout
+        return st
+
+    def evict_before(self, fid: int, pred: Callable[[Any], bool]) -> None:
+        """fid より古い未完成フレームのうち pred(state) が真のものを破棄する（新しいフレームが先に完成した時）"""
+        for old in [f for f, st in self.frames.items() if f < fid and pred(st)]:
+            self._evict(old)
+            self.evicted_superseded += 1
+
+    def finish(self, fid: int) -> None:
+        """フレーム完成時に呼ぶ（状態を解放して完了済みとして記録）"""
+        if self.frames.pop(fid, None) is not None:
+            del self._deadline[fid]
+            self.completed += 1
+        self._tombstone(fid)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self.frames),
+            "completed": self.completed,
+            "evicted_timeout": self.evicted_timeout,
+            "evicted_overflow": self.evicted_overflow,
+            "evicted_superseded": self.evicted_superseded,
+            "late_dropped": self.late_dropped,
+        }
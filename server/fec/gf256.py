@@ -0,0 +1,81 @@
+# gf256.py --- Reed-Solomon 用 GF(2^8) 演算（client/fec/gf256.py と同一仕様）
+import numpy as np
+from typing import List
+
+POLY = 0x11D # x^8 + x^4 + x^3 + x^2 + 1（生成元 2）
+
+# ===== 対数・指数テーブル =====
+EXP = [0] * 512
+LOG = [0] * 256
+_x = 1
+for _i in range(255):
+    EXP[_i] = _x
+    LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= POLY
+for _i in range(255, 512):
+    EXP[_i] = EXP[_i - 255]#剰余計算を省くため2周分持つ
+
+# MUL[a] は「a 倍」のルックアップ表。MUL[a][arr] で uint8 配列をまとめて乗算できる
+_log = np.array(LOG, dtype=np.int32)
+_exp = np.array(EXP, dtype=np.uint8)
+MUL = _exp[(_log[:, None] + _log[None, :])]
+MUL[0, :] = 0
+MUL[:, 0] = 0
+# ==============================
+
+
+def gf_mul(a: int, b: int) -> int:
+    if a == 0 or b == 0:
+        return 0
+    return EXP[LOG[a] + LOG[b]]
+
+
+def gf_inv(a: int) -> int:
+    if a == 0:
+        raise ZeroDivisionError("gf_inv(0)")
+    return EXP[255 - LOG[a]]
+
+
+def check_rs_params(k: int, r: int) -> None:
+    """x_j, y_i を GF(256) の相異なる元に取るので k + r <= 256（引数・コンストラクタの事前チェックにも使う）"""
+    if k <= 0 or r <= 0 or k + r > 256:
+        raise ValueError(f"invalid RS parameters: k={k}, r={r} (1 <= k, 1 <= r, k + r <= 256)")
+
+
+def cauchy_matrix(k: int, r: int) -> List[List[int]]:
+    """
+    パリティ生成行列（r 行 × k 列）。C[j][i] = 1 / (x_j + y_i), x_j = k + j, y_i = i。
+    Cauchy 行列は任意の正方部分行列が正則なので、[I; C] は任意の r 個の欠損を復元できる。
+    """
+    check_rs_params(k, r)
+    return [[gf_inv((k + j) ^ i) for i in range(k)] for j in range(r)]
+
+
+def gf_mat_inv(A: List[List[int]]) -> List[List[int]]:
+    """GF(256) 上の正方行列の逆行列（Gauss-Jordan）。特異なら ValueError"""
+    n = len(A)
+    M = [list(row) + [1 if i == j else 0 for j in range(n)] for i, row in enumerate(A)]
+    for c in range(n):
+        piv = next((rr for rr in range(c, n) if M[rr][c] != 0), -1)
+        if piv == -1:
+            raise ValueError("singular matrix")
+        M[c], M[piv] = M[piv], M[c]
+        inv = gf_inv(M[c][c])
+        M[c] = [gf_mul(inv, v) for v in M[c]]
+        for rr in range(n):
+            f = M[rr][c]
+            if rr != c and f != 0:
+                M[rr] = [v ^ gf_mul(f, pv) for v, pv in zip(M[rr], M[c])]
+    return [row[n:] for row in M]
+
+
+def gf_mul_acc(acc: np.ndarray, coef: int, data: np.ndarray) -> None:
+    """acc ^= coef * data（uint8 配列を一括で）"""
+    if coef == 0:
+        return
+    if coef == 1:
+        np.bitwise_xor(acc, data, out=acc)
+    else:
+        np.bitwise_xor(acc, MUL[coef][data], out=acc)
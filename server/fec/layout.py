@@ -0,0 +1,42 @@
+# layout.py --- グループ型FEC（mid/high）のチャンク配置表
+"""
+[data×d0][parity×R][data×d1][parity×R]... と並ぶチャンク列について、
+chunk_id → (グループ番号, グループ内番号, パリティか) を O(1) で引ける表を作る。
+
+表はフレーム毎ではなく「配置（D, G）」毎に 1 回だけ作り、
+各再構成器の lru_cache で total_chunks をキーに共有する。
+"""
+from typing import List, Optional, Tuple
+
+_NOWHERE: Tuple[Optional[int], Optional[int], bool] = (None, None, False)
+
+
+class GroupLayout:
+    __slots__ = ("D", "G", "di", "group_start", "loc")
+
+    def __init__(self, D: int, G: int, k: int, r: int):
+        self.D = max(0, D)
+        self.G = max(0, G)
+
+        di: List[int] = []
+        remain = self.D
+        for _ in range(self.G):#各グループのデータチャンク数
+            t = k if remain >= k else remain
+            di.append(t)
+            remain -= t
+        self.di = tuple(di)
+
+        starts: List[int] = []
+        loc: List[Tuple[int, int, bool]] = []
+        for g, d in enumerate(self.di):
+            starts.append(len(loc))
+            loc.extend((g, i, False) for i in range(d))#データ
+            loc.extend((g, b, True) for b in range(r))#パリティ
+        self.group_start = tuple(starts)
+        self.loc = tuple(loc)
+
+    def locate(self, cid: int) -> Tuple[Optional[int], Optional[int], bool]:
+        """チャンクIDからグループ番号、ローカルID、冗長パケットかどうかを取得"""
+        if 0 <= cid < len(self.loc):
+            return self.loc[cid]
+        return _NOWHERE
@@ -0,0 +1,83 @@
+# packet_header.py --- パケットヘッダの解析（client/fec/packet_header.py と同一仕様）
+"""
+v1: "!IHH"  frame_id, chunk_id, total_chunks
+    FEC方式・k・データ数は載っていないので、受信側の設定と total_chunks から推定する。
+
+v2: "!2sBBBBBBIHHHI"
+    magic(2)='UV', ver(1)=2, scheme(1), k(1), r(1), flags(1), seq(1),
+    frame_id(4), chunk_id(2), total_chunks(2), data_total(2), frame_len(4)
+    受信側は推定なしでフレーム状態を作れる。frame_len で復元チャンクの末尾パディングも落とせる。
+    seq は送信順の 8bit 通し番号（feedback.py が損失・バースト長の計測に使う）。
+
+v3: "!2sBBBBBBIHHHIH"
+    v2 の後ろに stream_id(2) を足したもの（ver=3）。受信側は (送信元アドレス, stream_id) でストリームを分ける
+    （streams.py）。v1 / v2 は stream_id=0。
+
+v1 との判別は先頭 2 バイトの magic で行う（v1 の frame_id が 0x5556xxxx の場合のみ衝突）。
+"""
+import struct
+from typing import NamedTuple, Optional
+
+V1_FMT = "!IHH"
+V1_SIZE = struct.calcsize(V1_FMT)
+V2_FMT = "!2sBBBBBBIHHHI"
+V2_SIZE = struct.calcsize(V2_FMT)
+MAGIC = b"UV"
+VER2 = 2
+SEQ_OFFSET = 7  # v2 ヘッダ内の seq の位置
+V3_FMT = V2_FMT + "H"
+V3_SIZE = struct.calcsize(V3_FMT)
+VER3 = 3
+
+# flags
+FLAG_SLICED = 0x01      # データチャンクが独立復号できる単位で区切られている（slicer.py）
+FLAG_SLICE_JPEG = 0x02  # 単位が JPEG のリスタート区間（欠損は空の区間で埋める）
+FLAG_RESEND = 0x04      # NACK に応じた再送（seq は初回送信時のまま。受信側の損失計測から外す）
+FLAGS_OFFSET = 6        # v2/v3 ヘッダ内の flags の位置
+
+# FEC方式ID
+SCHEME_NONE = 0
+SCHEME_LOW = 1
+SCHEME_MID = 2
+SCHEME_HIGH = 3
+SCHEME_RS = 4
+SCHEME_IDS = {"none": SCHEME_NONE, "low": SCHEME_LOW, "mid": SCHEME_MID, "high": SCHEME_HIGH, "rs": SCHEME_RS}
+SCHEME_NAMES = {v: k for k, v in SCHEME_IDS.items()}
+
+_V1 = struct.Struct(V1_FMT)
+_V2 = struct.Struct(V2_FMT)
+_V3 = struct.Struct(V3_FMT)
+
+
+class PacketHeader(NamedTuple):
+    version: int
+    scheme: int        # v1 では -1（不明）
+    k: int             # v1 では 0（不明）
+    r: int
+    flags: int
+    seq: int           # v1 では 0
+    frame_id: int
+    chunk_id: int
+    total_chunks: int
+    data_total: int    # v1 では 0（不明）
+    frame_len: int     # v1 では 0（不明）
+    size: int          # ヘッダ長（ペイロードは pkt[size:]）
+    stream: int = 0    # v3 の stream_id（v1 / v2 では 0）
+
+
+def parse_header(pkt: bytes) -> Optional[PacketHeader]:
+    """パケット先頭のヘッダを解析する。短すぎる・未知のバージョンなら None"""
+    if len(pkt) >= V2_SIZE and pkt[:2] == MAGIC:
+        ver = pkt[2]
+        if ver == VER2:
+            magic, ver, scheme, k, r, flags, seq, fid, cid, total, data_total, frame_len = _V2.unpack_from(pkt)
+            return PacketHeader(ver, scheme, k, r, flags, seq, fid, cid, total, data_total, frame_len, V2_SIZE)
+        if ver == VER3 and len(pkt) >= V3_SIZE:
+            magic, ver, scheme, k, r, flags, seq, fid, cid, total, data_total, frame_len, stream = _V3.unpack_from(pkt)
+            return PacketHeader(ver, scheme, k, r, flags, seq, fid, cid, total, data_total, frame_len, V3_SIZE, stream)
+        return None
+
+    if len(pkt) < V1_SIZE:
+        return None
+    fid, cid, total = _V1.unpack_from(pkt)
+    return PacketHeader(1, -1, 0, 0, 0, 0, fid, cid, total, 0, 0, V1_SIZE)
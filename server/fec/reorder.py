@@ -0,0 +1,57 @@
+# reorder.py --- 完成フレームを frame_id 順に並べ直す（フレーム間インターリーブ受信用）
+"""
+送信側がフレーム間インターリーブ（--interleave-frames N）を使うと、
+パリティ復元の有無でフレームの完成順が入れ替わることがある。
+差分復号（Pフレーム）は参照順が崩れると壊れるので、完成フレームを最大 depth 個まで保持し
+frame_id 順に出す。depth 個たまっても欠けている frame_id は諦めて飛ばす。
+"""
+from typing import Dict, List, Optional, Tuple
+
+Frame = Tuple[int, bytes, int]  # (frame_id, frame_bytes, recovered)
+
+
+class FrameReorder:
+    def __init__(self, depth: int = 1):
+        self.depth = max(1, int(depth))#1 は並べ替えなし（そのまま通す）
+        self.held: Dict[int, Frame] = {}
+        self.next_id: Optional[int] = None
+
+        self.skipped = 0#届かず飛ばした frame_id 数
+        self.late_dropped = 0#飛ばした後に完成したフレーム数
+
+    def _release(self, force: bool = False) -> List[Frame]:
+        out: List[Frame] = []
+        while self.held:
+            if self.next_id not in self.held:
+                if not force and len(self.held) < self.depth:#欠けているフレームをまだ待つ
+                    break
+                nxt = min(self.held)
+                if self.next_id is not None:
+                    self.skipped += nxt - self.next_id
+                self.next_id = nxt
+            out.append(self.held.pop(self.next_id))
+            self.next_id += 1
+        return out
+
+    def push(self, res: Frame) -> List[Frame]:
+        """完成フレームを入れ、frame_id 順に出せるものを返す"""
+        if self.depth == 1:
+            return [res]
+        fid = res[0]
+        if self.next_id is not None and fid < self.next_id:#既に追い越したフレーム
+            self.late_dropped += 1
+            return []
+        self.held[fid] = res
+        return self._release()
+
+    def flush(self) -> List[Frame]:
+        """保持中のフレームを全て frame_id 順に返す（パケットが途切れた時に呼ぶ）"""
+        return self._release(force=True)
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "held": len(self.held),
+            "skipped": self.skipped,
+            "late_dropped": self.late_dropped,
+        }
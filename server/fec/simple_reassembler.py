@@ -2,45 +2,66 @@
 """
 FECなし用のシンプルなフレーム再構成クラス
 
-クライアント側の FEC=none 用パケット
-  HEADER_FMT = "!IHH"  # frame_id, chunk_id, total_chunks
+クライアント側の FEC=none 用パケット（ヘッダ v1 / v2、packet_header.py 参照）
 に対応して、frame_id ごとにチャンクを集めて 1フレームに復元する。
 """
 
-import struct
 from typing import Dict, Any, Optional, Tuple
 
-# クライアントの FEC なしヘッダと合わせる
-HEADER_FMT = "!IHH"   # frame_id, chunk_id, total_chunks
-HEADER_SIZE = struct.calcsize(HEADER_FMT)#ヘッダサイズ計算
+from .frame_window import FrameWindow, DEFAULT_TIMEOUT, DEFAULT_MAX_FRAMES
+from .packet_header import FLAG_SLICED, PacketHeader, SCHEME_NONE, parse_header
+from .slices import PartialFrames, build_frame
 
 
 class SimpleFrameReassembler:
-    def __init__(self):
-        # frame_id -> {"total": int, "chunks": list[bytes], "received": int}
-        self.frames: Dict[int, Dict[str, Any]] = {}#udpなのでチャンクが順不同で到着する可能性があるため、フレームごとにチャンクを保存
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, max_frames: int = DEFAULT_MAX_FRAMES):
+        # frame_id -> {"total": int, "chunks": list[bytes], "received": int, "flags": int, "frame_len": int}
+        self.window = FrameWindow(timeout, max_frames, on_evict=self._on_evict)#期限切れフレームは自動で破棄
+        self.frames: Dict[int, Dict[str, Any]] = self.window.frames#udpなのでチャンクが順不同で到着する可能性があるため、フレームごとにチャンクを保存
+        self.partial = PartialFrames()#破棄時にスライス分割フレームを部分的に渡す
 
-    def add_packet(self, packet: bytes) -> Optional[Tuple[int, bytes, int]]:
+    def _on_evict(self, fid: int, st: Dict[str, Any]):
+        self.partial.add(fid, st["chunks"], st["flags"], 0)
+
+    def take_partial(self):
+        return self.partial.take()
+
+    def expire(self):
+        self.window.expire()
+
+    def flush_before(self, fid: int):#新しいフレームが完成した → 古いスライス分割フレームは部分フレームとして出す
+        self.window.evict_before(fid, lambda st: st["flags"] & FLAG_SLICED)
+
+    def stats(self) -> dict:
+        return {**self.window.stats(), **self.partial.stats()}
+
+    def add_packet(self, packet: bytes, hdr: Optional[PacketHeader] = None) -> Optional[Tuple[int, bytes, int]]:
         """
         1つのUDPパケットを追加し、フレームが完成したら
         (frame_id, frame_bytes, recovered) を返す。
         まだ未完成なら None を返す。
         recovered は FECなしなので常に 0。
+        hdr は解析済みヘッダ（AutoReassembler から渡される場合）。
         """
-        if len(packet) < HEADER_SIZE:
+        if hdr is None:
+            hdr = parse_header(packet)#ヘッダ解析
+            if hdr is None:
+                return None
+        if hdr.version >= 2 and hdr.scheme != SCHEME_NONE:#別方式のパケット
             return None
 
-        frame_id, chunk_id, total_chunks = struct.unpack(HEADER_FMT, packet[:HEADER_SIZE])#ヘッダ解析
-        payload = packet[HEADER_SIZE:]#ヘッダの後ろの映像データを取得
+        frame_id, chunk_id, total_chunks = hdr.frame_id, hdr.chunk_id, hdr.total_chunks
+        payload = bytes(packet[hdr.size:])#ヘッダの後ろの映像データを取得（受信リング上の memoryview でもコピーして保持）
 
-        st = self.frames.get(frame_id)
-        if st is None:
-            st = {
-                "total": total_chunks,
-                "chunks": [None] * total_chunks,
-                "received": 0,
-            }
-            self.frames[frame_id] = st
+        st = self.window.get(frame_id, lambda: {
+            "total": total_chunks,
+            "chunks": [None] * total_chunks,
+            "received": 0,
+            "flags": hdr.flags,
+            "frame_len": hdr.frame_len,
+        })
+        if st is None:#完成・破棄済みフレームの遅延パケット
+            return None
 
         # total_chunks が途中で増えるケースへの追従
         if total_chunks > st["total"]:
@@ -55,8 +76,8 @@ class SimpleFrameReassembler:
 
         # すべて揃ったら復元
         if st["received"] == st["total"]:#すべてのチャンクを受信済み
-            frame_bytes = b"".join(ch for ch in st["chunks"] if ch is not None)#チャンクを結合してフレームデータを復元
-            del self.frames[frame_id]#メモリ解放
+            frame_bytes = build_frame(st["chunks"], st["flags"], st["frame_len"])#チャンクを結合してフレームデータを復元
+            self.window.finish(frame_id)#メモリ解放
             # FECなしなので recovered=0
             return (frame_id, frame_bytes, 0)
 
@@ -0,0 +1,113 @@
+# slices.py --- スライス分割フレームの組み立て（client/fec/slicer.py と同一仕様）
+"""
+ヘッダの flags に FLAG_SLICED が立ったフレームは、各データチャンクが
+SLICE_FMT（first_unit, n_units, length）＋丸ごとの単位 で構成されている。
+チャンク0（first_unit = HEAD_UNIT）はフレームヘッダ部で、n_units は全単位数。
+
+チャンク0 があれば、欠けたチャンクの単位を埋めて部分フレームを組み立てられる:
+  - FLAG_SLICE_JPEG: 空のリスタート区間（RSTn マーカーのみ）→ その MCU は灰色で復号される
+  - それ以外（DXF Pフレームのブロック）: 省略 → その領域は参照フレームのまま
+"""
+import struct
+from collections import deque
+from typing import Deque, List, Optional, Sequence, Tuple
+
+from .packet_header import FLAG_SLICED, FLAG_SLICE_JPEG
+
+SLICE_FMT = "!HHH"
+SLICE_SIZE = struct.calcsize(SLICE_FMT)
+HEAD_UNIT = 0xFFFF
+_SLICE = struct.Struct(SLICE_FMT)
+
+_RST = [bytes((0xFF, 0xD0 + i)) for i in range(8)]
+_EOI = b"\xff\xd9"
+
+Frame = Tuple[int, bytes, int]  # (frame_id, frame_bytes, recovered)
+
+
+def _fill(a: int, b: int, total: int, jpeg: bool) -> bytes:
+    """単位 a..b-1 の代わり（JPEG は空のリスタート区間、最後の単位なら EOI）"""
+    if not jpeg:
+        return b""
+    return b"".join(_RST[i & 7] if i < total - 1 else _EOI for i in range(a, b))
+
+
+def join_slices(chunks: Sequence[Optional[bytes]], jpeg: bool) -> Optional[Tuple[bytes, int]]:
+    """
+    データチャンク列（欠損は None、データ順）からフレームを組み立てる。
+    戻り値は (frame_bytes, 欠けた単位数)。チャンク0 が無い・壊れていれば None。
+    復元チャンク末尾のゼロ埋めは length で落とす。
+    """
+    head = None
+    parts: List[Tuple[int, int, bytes]] = []
+    for c in chunks:
+        if c is None or len(c) < SLICE_SIZE:
+            continue
+        first, n, length = _SLICE.unpack_from(c)
+        body = c[SLICE_SIZE:SLICE_SIZE + length]
+        if first == HEAD_UNIT:
+            head = (n, body)
+        else:
+            parts.append((first, n, body))
+    if head is None:
+        return None
+
+    total, prefix = head
+    out = [prefix]
+    next_unit = 0
+    missing = 0
+    for first, n, body in parts:#データ順 = 単位の昇順
+        if first < next_unit or first + n > total:#壊れたチャンク
+            continue
+        if first > next_unit:
+            out.append(_fill(next_unit, first, total, jpeg))
+            missing += first - next_unit
+        out.append(body)
+        next_unit = first + n
+    if next_unit < total:
+        out.append(_fill(next_unit, total, total, jpeg))
+        missing += total - next_unit
+    return b"".join(out), missing
+
+
+def build_frame(chunks: Sequence[bytes], flags: int, frame_len: int) -> bytes:
+    """全データチャンクが揃ったフレームを組み立てる（frame_len は 0 なら不明＝切り詰めない）"""
+    if flags & FLAG_SLICED:
+        res = join_slices(chunks, bool(flags & FLAG_SLICE_JPEG))
+        if res is not None:
+            return res[0]
+    frame_bytes = b"".join(chunks)
+    if frame_len:#復元チャンクの末尾パディングを落とす
+        frame_bytes = frame_bytes[:frame_len]
+    return frame_bytes
+
+
+class PartialFrames:
+    """
+    期限切れ・溢れで破棄されるスライス分割フレームを、届いた単位だけで組み立てて溜めておく。
+    各 Reassembler が FrameWindow の on_evict から add() し、reassemble_thread が take() で取り出す。
+    """
+
+    def __init__(self):
+        self.ready: Deque[Frame] = deque()
+        self.delivered = 0
+        self.missing_units = 0
+
+    def add(self, fid: int, chunks: Sequence[Optional[bytes]], flags: int, recovered: int) -> None:
+        if not flags & FLAG_SLICED:#通常分割のフレームは部分復号できない
+            return
+        res = join_slices(chunks, bool(flags & FLAG_SLICE_JPEG))
+        if res is None:#ヘッダ部（チャンク0）が無い
+            return
+        frame_bytes, missing = res
+        self.ready.append((fid, frame_bytes, recovered))
+        self.delivered += 1
+        self.missing_units += missing
+
+    def take(self) -> List[Frame]:
+        out = list(self.ready)
+        self.ready.clear()
+        return out
+
+    def stats(self) -> dict:
+        return {"partial_delivered": self.delivered, "partial_missing_units": self.missing_units}
@@ -0,0 +1,105 @@
+# feedback.py --- 受信側 → 送信側の損失レポート（client/feedback_thread.py と同一仕様）
+"""
+v2 ヘッダの seq（送信側が 1 パケット毎に +1 する 8bit 通し番号）の飛びから
+送信元アドレス毎に損失数とバースト長を数え、interval 秒毎にその送信元へ UDP で返す。
+NACK による再送（FLAG_RESEND）は初回の seq のままなので数えない。
+送信側（fec="adaptive"）はこれを見てフレーム毎に FEC方式・k・r を切り替える。
+
+レポート: "!2sBBIIIHH"
+    magic(2)='UF', ver(1)=1, reserved(1),
+    window(4)=レポート通し番号, received(4), lost(4), max_burst(2), bursts(2)=損失の塊の数
+"""
+import socket
+import struct
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .fec.packet_header import FLAG_RESEND, FLAGS_OFFSET, MAGIC, SEQ_OFFSET, V2_SIZE
+
+FB_FMT = "!2sBBIIIHH"
+FB_MAGIC = b"UF"
+FB_VER = 1
+_FB = struct.Struct(FB_FMT)
+
+DEFAULT_INTERVAL = 0.5  # 秒
+REORDER_GAP = 128       # これ以上の seq の飛びは遅着（並べ替え）とみなす
+
+
+class _Window:
+    __slots__ = ("last_seq", "started", "window", "received", "lost", "max_burst", "bursts")
+
+    def __init__(self, now: float):
+        self.last_seq: Optional[int] = None
+        self.started = now
+        self.window = 0
+        self.reset(now)
+
+    def reset(self, now: float) -> None:
+        self.started = now
+        self.received = 0
+        self.lost = 0
+        self.max_burst = 0
+        self.bursts = 0
+
+
+class FeedbackReporter:
+    def __init__(self, sock: socket.socket, interval: float = DEFAULT_INTERVAL):
+        self.sock = sock
+        self.interval = float(interval)
+        self.windows: Dict[Tuple[str, int], _Window] = {}#送信元アドレス → 計測窓
+        self.reports_sent = 0
+        self.last_report: Dict[str, Any] = {}
+
+    def observe(self, packet: bytes, addr: Tuple[str, int]) -> None:
+        """受信パケット毎に呼ぶ（recv スレッドから）"""
+        if len(packet) < V2_SIZE or packet[:2] != MAGIC:#v1 には seq が無い
+            return
+        if packet[FLAGS_OFFSET] & FLAG_RESEND:#元のパケットは損失として数え済み
+            return
+        now = time.monotonic()
+        w = self.windows.get(addr)
+        if w is None:
+            w = self.windows[addr] = _Window(now)
+
+        seq = packet[SEQ_OFFSET]
+        if w.last_seq is not None:
+            gap = (seq - w.last_seq - 1) & 0xFF
+            if gap >= REORDER_GAP:#遅れて届いた → 損失として数えた分を戻す
+                if w.lost > 0:
+                    w.lost -= 1
+                w.received += 1
+                return
+            if gap:
+                w.lost += gap
+                w.bursts += 1
+                if gap > w.max_burst:
+                    w.max_burst = gap
+        w.last_seq = seq
+        w.received += 1
+
+        if now - w.started >= self.interval:
+            self._report(addr, w, now)
+
+    def _report(self, addr: Tuple[str, int], w: _Window, now: float) -> None:
+        msg = _FB.pack(FB_MAGIC, FB_VER, 0, w.window & 0xFFFFFFFF, w.received, w.lost,
+                       min(w.max_burst, 0xFFFF), min(w.bursts, 0xFFFF))
+        try:
+            self.sock.sendto(msg, addr)
+            self.reports_sent += 1
+        except OSError:
+            pass
+
+        total = w.received + w.lost
+        self.last_report = {
+            "addr": f"{addr[0]}:{addr[1]}",
+            "received": w.received,
+            "lost": w.lost,
+            "loss": round(w.lost / total, 4) if total else 0.0,
+            "max_burst": w.max_burst,
+            "bursts": w.bursts,
+        }
+        w.window += 1
+        w.reset(now)
+
+    def stats(self) -> dict:
+        return {"reports_sent": self.reports_sent, "last": self.last_report}
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+多カメラ受信（1 ポート・複数送信元）。表示は行わず、ストリーム毎の fps を定期的に表示する。
+
+    python -m server.multi_server --port 5000 --workers 4 --diff on
+
+--workers > 1 なら SO_REUSEPORT で同じポートを複数プロセスで受ける（送信元毎に振り分け）。
+"""
+import argparse
+import time
+
+from .recv_ring import DEFAULT_SLOT_SIZE
+from .streams import DEFAULT_MAX_STREAMS, DEFAULT_STREAM_TIMEOUT, MultiStreamReceiver, run_sharded
+
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Multi-stream UDP video server (one port, many senders, optional SO_REUSEPORT workers)"
+    )
+    p.add_argument("--bind-ip", type=str, default="0.0.0.0",
+                   help="Bind IP address")
+    p.add_argument("--port", type=int, default=5000,
+                   help="UDP port")
+    p.add_argument("--fec", choices=["auto", "none", "low", "mid", "high", "rs"], default="auto",
+                   help="FEC mode (auto: follow the v2/v3 packet header)")
+    p.add_argument("--diff", choices=["on", "off"], default="off",
+                   help="Diff decode mode")
+    p.add_argument("--reasm-timeout", type=float, default=1.0,
+                   help="Drop incomplete frames after this many seconds")
+    p.add_argument("--interleave-frames", type=int, default=1,
+                   help="Sender's cross-frame interleave depth (1: off)")
+    p.add_argument("--feedback", choices=["on", "off"], default="on",
+                   help="Send loss reports back to each sender")
+    p.add_argument("--max-packet", type=int, default=DEFAULT_SLOT_SIZE,
+                   help="Largest packet accepted in bytes (at least the senders' --payload)")
+    p.add_argument("--decode-workers", type=int, default=2,
+                   help="Decode threads per process (independent of the number of streams)")
+    p.add_argument("--max-streams", type=int, default=DEFAULT_MAX_STREAMS,
+                   help="Max concurrent streams per process")
+    p.add_argument("--stream-timeout", type=float, default=DEFAULT_STREAM_TIMEOUT,
+                   help="Forget a stream after this many seconds without packets")
+    p.add_argument("--workers", type=int, default=1,
+                   help="Processes sharing the port via SO_REUSEPORT (1: single process)")
+    p.add_argument("--report-interval", type=float, default=5.0,
+                   help="Print per-stream stats every N seconds")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    kwargs = dict(
+        bind_ip=args.bind_ip,
+        port=args.port,
+        fec=args.fec,
+        diff=args.diff,
+        reasm_timeout=args.reasm_timeout,
+        interleave_frames=args.interleave_frames,
+        feedback=args.feedback,
+        max_packet=args.max_packet,
+        decode_workers=args.decode_workers,
+        max_streams=args.max_streams,
+        stream_timeout=args.stream_timeout,
+    )
+
+    print("[MULTI] start")
+    print(f"  bind    = {args.bind_ip}:{args.port}")
+    print(f"  fec     = {args.fec}, diff = {args.diff}")
+    print(f"  workers = {args.workers} process(es) x {args.decode_workers} decode thread(s)")
+
+    if args.workers > 1:
+        run_sharded(args.workers, args.report_interval, **kwargs)
+        return
+
+    rx = MultiStreamReceiver(**kwargs)
+    rx.start()
+    try:
+        while True:
+            time.sleep(args.report_interval)
+            st = rx.status()
+            streams = ", ".join(f"{k} {v['fps']}fps" for k, v in st["streams"].items()) or "-"
+            print(f"[MULTI] {st['demux']['streams']} streams: {streams}", flush=True)
+    except KeyboardInterrupt:
+        print("\n[MULTI] KeyboardInterrupt -> stopping...")
+    rx.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# nack.py --- 受信側 → 送信側の再送要求（client/retransmit.py と同一仕様）
+"""
+v2/v3 ヘッダの frame_id / chunk_id / data_total から送信元毎・フレーム毎に届いたデータチャンクを記録し、
+そのフレームのパケットが delay 秒途切れた時点で未着のデータチャンクがあれば送信元へ NACK を返す。
+パリティは要求しない（届けば途切れの判定にだけ使う）。データチャンクの chunk_id は方式毎の並びで求める:
+    none / low : 0..data_total-1（low のパリティは 0x8000|g）
+    mid / high / rs : グループ毎に [データ×k][パリティ×r] の通し番号
+届かなければ retry 秒毎に最大 retries 回まで繰り返す。
+再構成済み（FEC で復元できた・部分フレームとして流した）フレームは frame_done() で対象から外す。
+
+NACK: "!2sBBIH" + "H" × count
+    magic(2)='UN', ver(1)=1, reserved(1), frame_id(4), count(2), chunk_id(2) × count
+"""
+import socket
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .fec.packet_header import MAGIC, PacketHeader, SCHEME_HIGH, SCHEME_LOW, SCHEME_MID, SCHEME_NONE, SCHEME_RS, parse_header
+
+NK_FMT = "!2sBBIH"
+NK_MAGIC = b"UN"
+NK_VER = 1
+_NK = struct.Struct(NK_FMT)
+NK_MAX_CHUNKS = 256  # 1 メッセージに載せるチャンク数の上限
+
+DEFAULT_DELAY = 0.01     # フレームのパケットがこれだけ途切れたら未着分を要求する（秒）
+DEFAULT_RETRY = 0.03     # 再要求の間隔（秒）
+DEFAULT_RETRIES = 2      # 再要求の回数
+DEFAULT_MAX_FRAMES = 64  # 追跡するフレーム数の上限（送信元あたり）
+
+
+def pack_nack(frame_id: int, chunk_ids: List[int]) -> bytes:
+    chunk_ids = chunk_ids[:NK_MAX_CHUNKS]
+    return _NK.pack(NK_MAGIC, NK_VER, 0, frame_id & 0xFFFFFFFF, len(chunk_ids)) + struct.pack(
+        f"!{len(chunk_ids)}H", *chunk_ids
+    )
+
+
+_GROUPED = (SCHEME_MID, SCHEME_HIGH, SCHEME_RS)#[データ×k][パリティ×r] の並び（grouped_items）
+
+
+def _data_index(hdr: PacketHeader) -> Optional[int]:
+    """chunk_id → データチャンクの通し番号（0..data_total-1）。パリティ・範囲外は None"""
+    cid, total = hdr.chunk_id, hdr.data_total
+    if hdr.scheme in (SCHEME_NONE, SCHEME_LOW):
+        return cid if cid < total else None
+    if hdr.scheme in _GROUPED and hdr.k:
+        g, local = divmod(cid, hdr.k + hdr.r)
+        i = g * hdr.k + local
+        return i if local < hdr.k and i < total else None
+    return None
+
+
+def _chunk_id(f: "_Frame", i: int) -> int:
+    """データチャンクの通し番号 → chunk_id（_data_index の逆）"""
+    if f.scheme in _GROUPED:
+        g, local = divmod(i, f.k)
+        return g * (f.k + f.r) + local
+    return i
+
+
+class _Frame:
+    __slots__ = ("scheme", "k", "r", "total", "got", "count", "due", "nacks", "nacked")
+
+    def __init__(self, hdr: PacketHeader, now: float, delay: float):
+        self.scheme, self.k, self.r = hdr.scheme, hdr.k, hdr.r
+        self.total = hdr.data_total#データチャンク数
+        self.got = bytearray(self.total)#データチャンク毎の受信済みフラグ
+        self.count = 0
+        self.due = now + delay#この時刻までにパケットが来なければ要求する
+        self.nacks = 0
+        self.nacked: set = set()#要求したデータチャンク（後から届いたら recovered に数える）
+
+
+class NackTracker:
+    def __init__(
+        self,
+        sock: socket.socket,
+        delay: float = DEFAULT_DELAY,
+        retry: float = DEFAULT_RETRY,
+        retries: int = DEFAULT_RETRIES,
+        max_frames: int = DEFAULT_MAX_FRAMES,
+    ):
+        self.sock = sock
+        self.delay = float(delay)
+        self.retry = float(retry)
+        self.retries = max(1, int(retries))
+        self.max_frames = max(1, int(max_frames))
+        self.frames: Dict[Tuple[Tuple[str, int], int], _Frame] = {}#(送信元, frame_id) → 受信状況
+        self._done: Dict[int, None] = {}#再構成済みの frame_id（挿入順、max_frames 個まで）
+        self._next_tick = 0.0
+
+        # 統計
+        self.nacks_sent = 0
+        self.chunks_nacked = 0
+        self.recovered = 0#要求したチャンクが届いた数
+        self.given_up = 0#要求しても揃わずに諦めたフレーム数
+
+    def observe(self, packet: bytes, addr: Tuple[str, int]) -> None:
+        """受信パケット毎に呼ぶ（recv スレッドから）"""
+        if packet[:2] != MAGIC:#v1 は対象外（送信側の再送も v2 以降）
+            return
+        hdr = parse_header(packet)
+        if hdr is None or not hdr.data_total:
+            return
+        now = time.monotonic()
+        key = (addr, hdr.frame_id)
+        f = self.frames.get(key)
+        if f is None:
+            if hdr.frame_id in self._done:
+                return
+            f = self.frames[key] = _Frame(hdr, now, self.delay)
+            if len(self.frames) > self.max_frames:#古いものから諦める
+                old = next(iter(self.frames))
+                if self.frames.pop(old).nacks:
+                    self.given_up += 1
+        i = _data_index(hdr)
+        if i is not None and i < f.total and not f.got[i]:
+            f.got[i] = 1
+            f.count += 1
+            if i in f.nacked:
+                self.recovered += 1
+        if f.nacks == 0:
+            f.due = now + self.delay
+        if f.count >= f.total:
+            del self.frames[key]
+        if now >= self._next_tick:
+            self.tick(now)
+
+    def frame_done(self, frame_id: int) -> None:
+        """再構成が済んだフレーム（reassemble スレッド / inline では recv スレッドから）"""
+        self._done[frame_id] = None
+        if len(self._done) > self.max_frames:
+            self._done.pop(next(iter(self._done)), None)
+
+    def tick(self, now: Optional[float] = None) -> None:
+        """期限の来たフレームの未着チャンクを要求する"""
+        if now is None:
+            now = time.monotonic()
+        self._next_tick = now + self.delay / 2
+        for key in list(self.frames):
+            f = self.frames[key]
+            if key[1] in self._done:
+                del self.frames[key]
+                continue
+            if now < f.due:
+                continue
+            if f.nacks >= self.retries:
+                del self.frames[key]
+                self.given_up += 1
+                continue
+            missing = [i for i in range(f.total) if not f.got[i]]
+            self._send(key[0], key[1], [_chunk_id(f, i) for i in missing])
+            f.nacked.update(missing)
+            f.nacks += 1
+            f.due = now + self.retry
+
+    def _send(self, addr: Tuple[str, int], frame_id: int, missing: List[int]) -> None:
+        for i in range(0, len(missing), NK_MAX_CHUNKS):
+            part = missing[i:i + NK_MAX_CHUNKS]
+            try:
+                self.sock.sendto(pack_nack(frame_id, part), addr)
+            except OSError:
+                return
+            self.nacks_sent += 1
+            self.chunks_nacked += len(part)
+
+    def stats(self) -> dict:
+        return {
+            "nacks_sent": self.nacks_sent,
+            "chunks_nacked": self.chunks_nacked,
+            "recovered": self.recovered,
+            # 要求したチャンクのうち再送で届いた割合
+            "efficiency": round(self.recovered / self.chunks_nacked, 4) if self.chunks_nacked else None,
+            "given_up": self.given_up,
+            "tracking": len(self.frames),
+        }
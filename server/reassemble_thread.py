@@ -1,37 +1,121 @@
 # reassemble_thread.py
 import threading
 import queue
-from typing import Any
+from typing import Any, Optional
+
+from .fec.reorder import FrameReorder
+from .nack import NackTracker
+from .recv_ring import PacketRing
+from .spsc import SpscQueue
+
+
+class ReassembleSink:
+    """
+    packet_queue の要素 1 つ（パケット、ring 有りなら (slot, length) のリスト）を受け取り、
+    reassembler.add_packet() を呼んでフレーム完成時に frame_queue へ (frame_id, frame_bytes, recovered) を流す。
+    reorder があれば完成フレームを frame_id 順に並べ直してから流す。
+
+    期限切れになったスライス分割フレームは reassembler.take_partial() で部分フレームとして受け取り、
+    既に流したフレームより新しいものだけ同じ経路で流す（古い Pフレームを後から適用しないため）。
+    フレーム間インターリーブ無し（reorder 無し）なら、新しいフレームが完成した時点で
+    それより古い未完成のスライス分割フレームを部分フレームとして先に流す。
+
+    ring があれば ring 上のパケットを処理してからスロットを返す。
+    nack があれば再構成できたフレーム（FEC 復元・部分フレームを含む）を再送要求の対象から外す。
+    push() / idle() は reassemble スレッドから呼ぶか、inline モードでは recv スレッドから直接呼ぶ
+    （SpscQueue.push と同じ形なので recv スレッドはどちらにも流せる）。
+    """
+
+    def __init__(
+        self,
+        frame_queue: "queue.Queue[tuple[int, bytes, int]]",
+        reassembler: Any,
+        reorder: Optional[FrameReorder] = None,
+        ring: Optional[PacketRing] = None,
+        put_timeout: float = 0.1,
+        nack: Optional[NackTracker] = None,
+    ):
+        self.frame_queue = frame_queue
+        self.reassembler = reassembler
+        self.reorder = reorder
+        self.ring = ring
+        self.put_timeout = put_timeout#0 なら frame_queue が満杯のとき待たずに捨てる（inline 用）
+        self.nack = nack
+        self.last_fid = -1
+
+    def _put_frames(self, frames):
+        for frame_id, frame_bytes, recovered in frames:#ヘッダ情報を展開
+            self.last_fid = frame_id
+            try:
+                if self.put_timeout > 0:
+                    self.frame_queue.put((frame_id, frame_bytes, recovered), timeout=self.put_timeout)#フレームキューに流す
+                else:
+                    self.frame_queue.put_nowait((frame_id, frame_bytes, recovered))
+            except queue.Full:
+                # 満杯なら捨てる
+                pass
+
+    def _put_result(self, res):
+        if self.nack is not None:
+            self.nack.frame_done(res[0])
+        self._put_frames(self.reorder.push(res) if self.reorder is not None else (res,))
+
+    def _put_partial(self):
+        for res in self.reassembler.take_partial():
+            if res[0] > self.last_fid:#既に新しいフレームを流していれば捨てる
+                self._put_result(res)
+
+    def _handle(self, packet):
+        res = self.reassembler.add_packet(packet)#パケットを再構成器に渡す
+        if res is not None and self.reorder is None:
+            self.reassembler.flush_before(res[0])#追い越された古いフレームは待たない
+        self._put_partial()#期限切れ・追い越しで破棄されたフレーム
+        if res is None:
+            return
+
+        self._put_result(res)
+
+    def push(self, item) -> bool:
+        if self.ring is None:
+            self._handle(item)
+            return True
+
+        for slot, length in item:
+            self._handle(self.ring.view(slot, length))
+        self.ring.release(len(item))#再構成器はペイロードをコピー済みなのでスロットを返す
+        return True
+
+    def idle(self):
+        """パケットが途切れたときに呼ぶ"""
+        self.reassembler.expire()#パケットが途切れても期限切れを処理する
+        self._put_partial()
+        if self.reorder is not None:#パケットが途切れたら保持中のフレームを出し切る
+            self._put_frames(self.reorder.flush())
 
 
 def start_reassemble_thread(
-    packet_queue: "queue.Queue[bytes]",
+    packet_queue: SpscQueue,
     frame_queue: "queue.Queue[tuple[int, bytes, int]]",
     stop_flag: threading.Event,
     reassembler: Any,
+    reorder: Optional[FrameReorder] = None,
+    ring: Optional[PacketRing] = None,
+    nack: Optional[NackTracker] = None,
 ) -> threading.Thread:
     """
-    packet_queue からパケットを取り出し、reassembler.add_packet() を呼んで
-    フレーム完成時に frame_queue へ (frame_id, frame_bytes, recovered) を流すスレッド。
+    packet_queue（recv スレッドからの SpscQueue）から溜まっている分をまとめて取り出し、
+    ReassembleSink で再構成して frame_queue へ流すスレッド。
     """
+    sink = ReassembleSink(frame_queue, reassembler, reorder, ring, nack=nack)
+
     def reassemble_loop():
         while not stop_flag.is_set():#停止フラグが立つまでループ
-            try:
-                packet = packet_queue.get(timeout=0.1)#パケットをキューから取り出す
-            except queue.Empty:
+            items = packet_queue.pop_batch(timeout=0.1)#パケット（ring 有りならレコード列）をまとめて取り出す
+            if not items:
+                sink.idle()
                 continue
-
-            res = reassembler.add_packet(packet)#パケットを再構成器に渡す
-            if res is None:
-                continue
-
-            frame_id, frame_bytes, recovered = res#ヘッダ情報を展開
-
-            try:
-                frame_queue.put((frame_id, frame_bytes, recovered), timeout=0.1)#フレームキューに流す
-            except queue.Full:
-                # 満杯なら捨てる
-                pass
+            for item in items:
+                sink.push(item)
 
     t = threading.Thread(target=reassemble_loop, daemon=True)
     t.start()
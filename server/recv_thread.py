@@ -1,32 +1,196 @@
 # recv_thread.py
 import threading
-import queue
+import select
 import socket
+import struct
+import time
+from typing import Callable, Optional
+
+from .feedback import FeedbackReporter
+from .nack import NackTracker
+from .spsc import SpscQueue
+from .recv_ring import (
+    DEFAULT_BATCH, DEFAULT_SLOT_SIZE, GRO_BUF_SIZE, GRO_MAX_SEGS, SO_RXQ_OVFL, SOL_UDP, UDP_GRO,
+    PacketRing, enable_rx_options,
+)
+
+
+def _warn_truncated(max_packet: int) -> None:
+    print(f"[RECV] dropped a packet longer than {max_packet} bytes "
+          f"(sender payload is larger; raise max_packet / --max-packet)")
 
 
 def start_recv_thread(
     sock: socket.socket,
-    packet_queue: "queue.Queue[bytes]",
+    packet_queue: SpscQueue,
     stop_flag: threading.Event,
+    feedback: Optional[FeedbackReporter] = None,
+    on_idle: Optional[Callable[[], None]] = None,
+    with_addr: bool = False,
+    nack: Optional[NackTracker] = None,
+    max_packet: int = DEFAULT_SLOT_SIZE,
 ) -> threading.Thread:
     """
     UDPソケットからパケットを受信し、packet_queue に流すスレッド。
+    max_packet より長いパケット（送信側の payload が大きい）は捨てる。
+    feedback があれば送信元毎の損失を計測し、定期的に送信元へレポートを返す。
+    nack があれば未着チャンクを追跡し、送信元へ再送を要求する。
+    packet_queue は SpscQueue か、inline モードでは ReassembleSink（push で直接再構成する）。
+    on_idle は受信が途切れたときに呼ぶ（inline モードの期限切れ処理）。
+    with_addr なら (packet, addr) を流す（streams.py の StreamDemux 用）。
     """
     def recv_loop():
+        warned = False
         while not stop_flag.is_set():#停止フラグが立つまでループ
             try:
-                packet, addr = sock.recvfrom(2000)#パケットを受信 少し多めにとっている
+                packet, addr = sock.recvfrom(max_packet + 1)#パケットを受信 1 バイト多めにとって切り詰めを検出
             except socket.timeout:
+                if on_idle is not None:
+                    on_idle()
                 continue
             except OSError:
                 # ソケットクローズ時など
                 break
 
+            if len(packet) > max_packet:#切り詰められている
+                if not warned:
+                    _warn_truncated(max_packet)
+                    warned = True
+                continue
+
+            if feedback is not None:
+                feedback.observe(packet, addr)#損失計測（一定間隔で送信元へ返信）
+            if nack is not None:
+                nack.observe(packet, addr)#未着チャンクの再送要求
+
+            packet_queue.push((packet, addr) if with_addr else packet)#パケットをキューに入れる（満杯なら捨てる）
+
+    t = threading.Thread(target=recv_loop, daemon=True)
+    t.start()
+    return t
+
+
+def start_ring_recv_thread(
+    sock: socket.socket,
+    ring: PacketRing,
+    packet_queue: SpscQueue,
+    stop_flag: threading.Event,
+    feedback: Optional[FeedbackReporter] = None,
+    gro: bool = True,
+    batch: int = DEFAULT_BATCH,
+    on_idle: Optional[Callable[[], None]] = None,
+    with_addr: bool = False,
+    nack: Optional[NackTracker] = None,
+) -> threading.Thread:
+    """
+    start_recv_thread のリングバッファ版。
+    ring のスロットへ recvmsg_into で直接受信し、packet_queue には (slot, length) のリストを
+    バッチ単位で流す（消費側は処理後に ring.release(len(batch)) する）。
+
+    - ソケットを非ブロッキングにし、select で 1 回起きたら溜まっている分を最大 batch 個まで読む
+    - gro なら UDP_GRO を有効にし、まとめて届いたパケットを gso_size ごとにスロットへ分ける
+    - ring.slot_size より長いパケットは捨てて ring.truncated に数える（最初の 1 回だけ警告）
+    - SO_RXQ_OVFL のカーネル側ドロップ数を ring.kernel_drops に反映する
+    - on_idle があれば（inline モード）受信が 0.1 秒途切れる毎に呼ぶ
+    - with_addr なら (slot, length, addr) のリストを流す（streams.py の StreamDemux 用）
+    """
+    gro = enable_rx_options(sock, gro)
+    sock.setblocking(False)#待ちは select で行う（timeout 付きソケットは recv 毎に poll するため）
+    ancbufsize = socket.CMSG_SPACE(4) * 2
+    scratch = memoryview(bytearray(GRO_BUF_SIZE)) if gro else None#GRO は 1 回で最大 64KB 届く
+    need = GRO_MAX_SEGS if gro else 1#1 回の受信に必要な空きスロット数
+    wait = 0.5 if on_idle is None else 0.1
+
+    def recv_one(records, addrs):
+        """1 回受信して records / addrs に追加する（読むものが無ければ BlockingIOError）"""
+        slot = ring.head % ring.slots
+        target = scratch if gro else ring.views[slot]
+        n, ancdata, flags, addr = sock.recvmsg_into([target], ancbufsize)
+
+        seg = 0
+        for level, ctype, data in ancdata:
+            if level == socket.SOL_SOCKET and ctype == SO_RXQ_OVFL and len(data) >= 4:
+                ring.kernel_drops = struct.unpack_from("=I", data)[0]
+            elif level == SOL_UDP and ctype == UDP_GRO and len(data) >= 2:
+                seg = struct.unpack_from("=i" if len(data) >= 4 else "=H", data)[0]
+
+        if flags & socket.MSG_TRUNC:
+            ring.truncated += 1
+            return
+
+        if not gro:
+            records.append((slot, n))
+            addrs.append(addr)
+            ring.head += 1
+            return
+
+        if seg <= 0:#まとめられていない
+            seg = n
+        elif n > seg:
+            ring.gro_packets += (n + seg - 1) // seg
+        for off in range(0, n, seg):
+            length = min(seg, n - off)
+            if length > ring.slot_size:
+                ring.truncated += 1
+                continue
+            slot = ring.head % ring.slots
+            ring.views[slot][:length] = scratch[off:off + length]#スロットへ移す
+            records.append((slot, length))
+            addrs.append(addr)
+            ring.head += 1
+
+    def recv_loop():
+        truncated = 0
+        while not stop_flag.is_set():#停止フラグが立つまでループ
             try:
-                packet_queue.put(packet, timeout=0.1)#パケットをキューに入れる
-            except queue.Full:
-                # キュー満杯なら捨てる
-                pass
+                readable, _, _ = select.select([sock], [], [], wait)
+            except (OSError, ValueError):
+                # ソケットクローズ時など
+                break
+            if not readable:
+                if on_idle is not None:
+                    on_idle()
+                continue
+
+            start = ring.head
+            records: list = []
+            addrs: list = []
+            closed = False
+            while len(records) < batch:
+                if ring.free() < need:#下流が追いつくまでカーネルに残す
+                    ring.ring_full += 1
+                    break
+                try:
+                    recv_one(records, addrs)
+                except BlockingIOError:
+                    break
+                except OSError:
+                    closed = True
+                    break
+
+            if ring.truncated and not truncated:
+                _warn_truncated(ring.slot_size)
+            truncated = ring.truncated
+
+            if records:
+                if feedback is not None:
+                    for (slot, length), addr in zip(records, addrs):
+                        feedback.observe(ring.view(slot, length), addr)#損失計測（一定間隔で送信元へ返信）
+                if nack is not None:
+                    for (slot, length), addr in zip(records, addrs):
+                        nack.observe(ring.view(slot, length), addr)#未着チャンクの再送要求
+                ring.packets += len(records)
+                ring.batches += 1
+                if with_addr:
+                    records = [(slot, length, addr) for (slot, length), addr in zip(records, addrs)]
+                if not packet_queue.push(records):#レコード列をキューに入れる
+                    # キュー満杯なら捨てる（渡していないスロットはそのまま再利用）
+                    ring.head = start
+                    ring.queue_dropped += len(records)
+            elif ring.free() < need:
+                time.sleep(0.001)
+            if closed:
+                break
 
     t = threading.Thread(target=recv_loop, daemon=True)
     t.start()
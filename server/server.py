@@ -9,18 +9,22 @@ import time
 import cv2
 import numpy as np
 
-from .fec.fec_reassembler_low import FECLowReassembler
-from .fec.fec_reassembler_mid import FECMediumReassembler
-from .fec.fec_reassembler_high import FECHighReassembler
-from .fec.simple_reassembler import SimpleFrameReassembler
+from .fec.factory import make_reassembler
+from .fec.gf256 import check_rs_params
+from .fec.reorder import FrameReorder
+from .feedback import FeedbackReporter
+from .nack import DEFAULT_DELAY as NACK_DELAY, NackTracker
 
 
 from .diff.diffdecode import DiffDecoder
 
 # ★ 追加：スレッド外部モジュール
-from .recv_thread import start_recv_thread
-from .reassemble_thread import start_reassemble_thread
+from .recv_thread import start_recv_thread, start_ring_recv_thread
+from .recv_ring import DEFAULT_SLOT_SIZE, PacketRing, join_multicast
+from .reassemble_thread import ReassembleSink, start_reassemble_thread
+from .spsc import SpscQueue
 from .decode_thread import start_decode_thread
+from .decode_pool import DecodePool, start_decode_pool_threads
 from .display_thread import start_display_thread
 
 # ============================================================
@@ -35,17 +39,55 @@ def parse_args():
                    help="Bind IP address")
     p.add_argument("--port", type=int, default=5000,
                    help="UDP port")
-
-    p.add_argument("--fec", choices=["none", "low", "mid", "high"], default="none",
-                   help="FEC mode")
+    p.add_argument("--multicast-group", type=str, default=None,
+                   help="Join this multicast group (sender uses --dest <group>:<port>)")
+
+    p.add_argument("--fec", choices=["auto", "none", "low", "mid", "high", "rs"], default="auto",
+                   help="FEC mode (auto: follow the v2 packet header, v1 packets as none)")
+    p.add_argument("--fec-k", type=int, default=8,
+                   help="FEC data packet count k (fec=rs with v1 headers only)")
+    p.add_argument("--fec-r", type=int, default=4,
+                   help="FEC parity packet count r (fec=rs with v1 headers only)")
+    p.add_argument("--reasm-timeout", type=float, default=1.0,
+                   help="Drop incomplete frames after this many seconds")
+    p.add_argument("--reasm-max-frames", type=int, default=64,
+                   help="Max frames kept in reassembly at once")
+    p.add_argument("--interleave-frames", type=int, default=1,
+                   help="Sender's cross-frame interleave depth; completed frames are reordered by frame_id (1: off)")
+    p.add_argument("--feedback", choices=["on", "off"], default="on",
+                   help="Send loss reports back to the sender (used by fec=adaptive)")
+    p.add_argument("--feedback-interval", type=float, default=0.5,
+                   help="Loss report interval (sec)")
+    p.add_argument("--nack", choices=["on", "off"], default="off",
+                   help="Ask the sender to resend missing chunks (sender needs --nack on)")
+    p.add_argument("--nack-delay", type=float, default=NACK_DELAY,
+                   help="Request missing chunks after a frame's packets stop for this many seconds")
+    p.add_argument("--recv-ring", choices=["on", "off"], default="on",
+                   help="Receive into a preallocated ring in batches (off: one recvfrom per packet)")
+    p.add_argument("--ring-slots", type=int, default=4096,
+                   help="Receive ring size in packets (--recv-ring on)")
+    p.add_argument("--max-packet", type=int, default=DEFAULT_SLOT_SIZE,
+                   help="Largest packet accepted in bytes (at least the sender's --payload; the default fits jumbo frames)")
+    p.add_argument("--gro", choices=["on", "off"], default="on",
+                   help="Enable UDP GRO on the receive socket (--recv-ring on, Linux)")
+    p.add_argument("--reassemble", choices=["thread", "inline"], default="thread",
+                   help="Run reassembly in its own thread, or inline in the receive thread (one less hop)")
     p.add_argument("--diff", choices=["on", "off"], default="off",
                    help="Diff decode mode")
+    p.add_argument("--decode-procs", type=int, default=0,
+                   help="Decode in N worker processes via shared memory (0: one decode thread)")
     p.add_argument("--buffer", choices=["on", "off"], default="off",
                    help="Future: frame buffer")
     p.add_argument("--record", choices=["on", "off"], default="off",
                    help="Future: record received frames")
 
-    return p.parse_args()
+    args = p.parse_args()
+    if args.fec == "rs":
+        try:
+            check_rs_params(args.fec_k, args.fec_r)
+        except ValueError as e:
+            p.error(f"--fec-k/--fec-r: {e}")
+    return args
 
 
 # ============================================================
@@ -56,32 +98,30 @@ def main():
 
     # 起動時の設定だけ表示（ループ内のログは削除）
     print("[SERVER] Step8 start (4-thread, FEC none/low/mid/high, diff on/off)")
-    print(f"  bind   = {args.bind_ip}:{args.port}")
-    print(f"  fec    = {args.fec}")
+    print(f"  bind   = {args.bind_ip}:{args.port}" + (f" (group {args.multicast_group})" if args.multicast_group else ""))
+    print(f"  fec    = {args.fec} (k={args.fec_k}, r={args.fec_r})")
     print(f"  diff   = {args.diff}")
+    print(f"  decode = {'thread' if args.decode_procs <= 0 else f'{args.decode_procs} process(es)'}")
+    print(f"  reasm  = timeout {args.reasm_timeout}s, max {args.reasm_max_frames} frames, "
+          f"reorder {args.interleave_frames} frames")
     print(f"  buffer = {args.buffer}, record={args.record}")
+    print(f"  feedback = {args.feedback} ({args.feedback_interval}s), nack = {args.nack} ({args.nack_delay}s)")
+    print(f"  recv   = ring {args.recv_ring} ({args.ring_slots} slots, gro {args.gro}), max packet {args.max_packet}, reassemble {args.reassemble}")
 
     # ソケット
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.bind((args.bind_ip, args.port))
     sock.settimeout(0.5)
+    if args.multicast_group:
+        join_multicast(sock, args.multicast_group)
 
     # スレッド間キュー
-    packet_queue = queue.Queue(maxsize=1000)
+    packet_queue = SpscQueue(1000)#recv → reassemble（単一生産者・単一消費者）
     frame_queue = queue.Queue(maxsize=120)
     decoded_queue = queue.Queue(maxsize=120)
 
     # FECモードに応じて Reassembler を選択
-    if args.fec == "none":
-        reassembler = SimpleFrameReassembler()
-    elif args.fec == "low":
-        reassembler = FECLowReassembler()
-    elif args.fec == "mid":
-        reassembler = FECMediumReassembler()
-    elif args.fec == "high":
-        reassembler = FECHighReassembler()
-    else:
-        reassembler = SimpleFrameReassembler()
+    reassembler = make_reassembler(args)
 
     # DiffDecoder 準備（diff=on のときのみ使用）
     diff_decoder = None
@@ -93,26 +133,69 @@ def main():
     # =================================================
     # スレッド開始（外部モジュール呼び出し）
     # =================================================
-    t_recv = start_recv_thread(
-        sock=sock,
-        packet_queue=packet_queue,
-        stop_flag=stop_flag,
-    )
-
-    t_reasm = start_reassemble_thread(
-        packet_queue=packet_queue,
-        frame_queue=frame_queue,
-        stop_flag=stop_flag,
-        reassembler=reassembler,
-    )
-
-    t_dec = start_decode_thread(
-        frame_queue=frame_queue,
-        decoded_queue=decoded_queue,
-        stop_flag=stop_flag,
-        args=args,
-        diff_decoder=diff_decoder,
-    )
+    feedback = FeedbackReporter(sock, args.feedback_interval) if args.feedback == "on" else None
+    nack = NackTracker(sock, args.nack_delay) if args.nack == "on" else None
+    ring = PacketRing(args.ring_slots, args.max_packet) if args.recv_ring == "on" else None#受信スロットを事前確保（(slot, length) のバッチで流す）
+    reorder = FrameReorder(args.interleave_frames)
+
+    # inline: recv スレッドが直接再構成する（packet_queue を使わない）
+    rx_target = packet_queue
+    on_idle = None
+    if args.reassemble == "inline":
+        rx_target = ReassembleSink(frame_queue, reassembler, reorder, ring, put_timeout=0, nack=nack)
+        on_idle = rx_target.idle
+
+    if ring is not None:
+        t_recv = start_ring_recv_thread(
+            sock=sock,
+            ring=ring,
+            packet_queue=rx_target,
+            stop_flag=stop_flag,
+            feedback=feedback,
+            gro=args.gro == "on",
+            on_idle=on_idle,
+            nack=nack,
+        )
+    else:
+        t_recv = start_recv_thread(
+            sock=sock,
+            packet_queue=rx_target,
+            stop_flag=stop_flag,
+            feedback=feedback,
+            on_idle=on_idle,
+            nack=nack,
+            max_packet=args.max_packet,
+        )
+
+    if args.reassemble == "thread":
+        t_reasm = start_reassemble_thread(
+            packet_queue=packet_queue,
+            frame_queue=frame_queue,
+            stop_flag=stop_flag,
+            reassembler=reassembler,
+            reorder=reorder,
+            ring=ring,
+            nack=nack,
+        )
+
+    pool = None
+    if args.decode_procs > 0:
+        # 複数プロセスで復号（共有メモリ経由、frame_id 順に decoded_queue へ）
+        pool = DecodePool(args.decode_procs, args.diff)
+        start_decode_pool_threads(
+            frame_queue=frame_queue,
+            decoded_queue=decoded_queue,
+            stop_flag=stop_flag,
+            pool=pool,
+        )
+    else:
+        t_dec = start_decode_thread(
+            frame_queue=frame_queue,
+            decoded_queue=decoded_queue,
+            stop_flag=stop_flag,
+            args=args,
+            diff_decoder=diff_decoder,
+        )
 
     t_disp = start_display_thread(
         decoded_queue=decoded_queue,
@@ -129,8 +212,18 @@ def main():
         print("\n[SERVER] KeyboardInterrupt -> stopping...")
         stop_flag.set()
 
+    if ring is not None:
+        print("[SERVER] recv stats:", ring.stats())
+    if args.reassemble == "thread":
+        print("[SERVER] packet queue:", packet_queue.stats())
+    if pool is not None:
+        print("[SERVER] decode pool:", pool.stats())
+    if nack is not None:
+        print("[SERVER] nack:", nack.stats())
     sock.close()
     time.sleep(0.5)
+    if pool is not None:
+        pool.close()
     # display_thread 側で destroyAllWindows 済み
     print("[SERVER] clean exit.")
 
@@ -0,0 +1,75 @@
+# spsc.py --- recv → reassemble 間の単一生産者・単一消費者リング
+"""
+queue.Queue はパケット毎にロック取得・条件変数の通知が入るので、
+recv スレッド（生産者 1）と reassemble スレッド（消費者 1）の間はこのリングで受け渡す。
+
+- head は生産者だけ、tail は消費者だけが更新する（GIL 下で int の代入は不可分なのでロック不要）
+- 満杯なら push() は待たずに False を返す（呼び出し側で捨てる。従来の put(timeout=0.1) の代わり）
+- 消費者は pop_batch() で溜まっている分をまとめて取り出す。空のときだけ Event で待つ
+  （生産者は消費者が待っているときだけ set() するので、通常はパケット毎の通知が無い）
+"""
+import threading
+from typing import Any, List
+
+DEFAULT_CAPACITY = 1024
+DEFAULT_BATCH = 256
+
+
+class SpscQueue:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = max(1, int(capacity))
+        self.items: List[Any] = [None] * self.capacity
+        self.head = 0
+        self.tail = 0
+        self._waiting = False
+        self._wake = threading.Event()
+
+        # 統計
+        self.pushed = 0
+        self.dropped = 0
+        self.high_water = 0  # キュー深さの最大値
+
+    def __len__(self) -> int:
+        return self.head - self.tail
+
+    def push(self, item: Any) -> bool:
+        """生産者: 1 要素入れる。満杯なら False"""
+        depth = self.head - self.tail
+        if depth >= self.capacity:
+            self.dropped += 1
+            return False
+        self.items[self.head % self.capacity] = item
+        self.head += 1#要素を書いてから公開する
+        self.pushed += 1
+        if depth >= self.high_water:
+            self.high_water = depth + 1
+        if self._waiting:
+            self._wake.set()
+        return True
+
+    def pop_batch(self, max_items: int = DEFAULT_BATCH, timeout: float = 0.1) -> List[Any]:
+        """消費者: 溜まっている要素を最大 max_items 個取り出す。空なら timeout 秒まで待ち、それでも空なら []"""
+        if self.head == self.tail:
+            self._waiting = True
+            if self.head == self.tail:#待つと宣言した後に再確認（直前の push を取りこぼさない）
+                self._wake.wait(timeout)
+            self._waiting = False
+            self._wake.clear()
+
+        n = min(self.head - self.tail, max_items)
+        out = []
+        for _ in range(n):
+            i = self.tail % self.capacity
+            out.append(self.items[i])
+            self.items[i] = None#参照を切る
+            self.tail += 1
+        return out
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.head - self.tail,
+            "high_water": self.high_water,
+            "capacity": self.capacity,
+            "pushed": self.pushed,
+            "dropped": self.dropped,
+        }
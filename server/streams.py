@@ -0,0 +1,388 @@
+# server/streams.py
+"""
+1 つの UDP ポートで複数の送信元・複数ストリームを受ける（多カメラ用）
+
+- パケットは (送信元IP, 送信元ポート, stream_id) 毎に振り分け、ストリーム毎に
+  再構成器・並べ替え・DiffDecoder を持つ（stream_id は v3 ヘッダ。v1 / v2 は 0）
+- 再構成は recv スレッド内で行い（inline）、復号は decode_workers 個のスレッドで分担する
+  （1 ストリームは常に同じワーカーで順に復号する）。スレッド数はストリーム数によらない
+- reuse_port=True なら SO_REUSEPORT で同じポートを複数プロセスで開ける。
+  カーネルは送信元アドレスのハッシュでソケットを選ぶので、1 ストリームは常に同じプロセスに届く
+  （run_sharded() / multi_server.py）
+
+    rx = MultiStreamReceiver(port=5000, diff="on")
+    rx.start()
+    for key in rx.streams():
+        item = rx.get_latest_frame(key)  # (frame_id, frame, recovered)
+"""
+from __future__ import annotations
+
+import multiprocessing
+import queue
+import socket
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .decode_thread import decode_frame
+from .diff.diffdecode import DiffDecoder
+from .fec.factory import make_reassembler
+from .fec.frame_window import DEFAULT_TIMEOUT, DEFAULT_MAX_FRAMES
+from .fec.gf256 import check_rs_params
+from .fec.packet_header import parse_header
+from .fec.reorder import FrameReorder
+from .feedback import FeedbackReporter
+from .reassemble_thread import ReassembleSink
+from .recv_ring import DEFAULT_SLOT_SIZE, DEFAULT_SLOTS, PacketRing
+from .recv_thread import start_recv_thread, start_ring_recv_thread
+from .spsc import SpscQueue
+
+StreamKey = Tuple[str, int, int]  # (送信元IP, 送信元ポート, stream_id)
+
+IDLE_INTERVAL = 0.1          # この秒数パケットが来ないストリームは期限切れ処理をする
+DEFAULT_STREAM_TIMEOUT = 10.0  # この秒数パケットが来ないストリームは状態ごと捨てる
+DEFAULT_MAX_STREAMS = 256
+
+
+def key_str(key: StreamKey) -> str:
+    return f"{key[0]}:{key[1]}/{key[2]}"
+
+
+class _StreamOut:
+    """ReassembleSink の frame_queue の代わり: 完成フレームにストリームを付けて復号ワーカーへ"""
+
+    def __init__(self, key: StreamKey, q: SpscQueue):
+        self.key = key
+        self.q = q
+
+    def put_nowait(self, item) -> None:
+        if not self.q.push((self.key,) + tuple(item)):
+            raise queue.Full
+
+
+class _Stream:
+    def __init__(self, key: StreamKey, args, worker: int, out: SpscQueue, now: float):
+        self.key = key
+        self.worker = worker
+        self.reassembler = make_reassembler(args)
+        self.reorder = FrameReorder(args.interleave_frames)
+        self.sink = ReassembleSink(_StreamOut(key, out), self.reassembler, self.reorder, put_timeout=0)
+        self.diff_decoder = DiffDecoder() if args.diff == "on" else None
+        self.started = now
+        self.last_rx = now
+        self.packets = 0
+        self.decoded = 0
+        self.latest: Optional[Tuple[int, Any, int]] = None
+
+    def stats(self, now: float) -> dict:
+        return {
+            "worker": self.worker,
+            "packets": self.packets,
+            "decoded": self.decoded,
+            "fps": round(self.decoded / max(1e-3, now - self.started), 2),
+            "latest_frame_id": None if self.latest is None else self.latest[0],
+            "idle": round(now - self.last_rx, 3),
+            "reassembler": self.reassembler.stats(),
+        }
+
+
+class StreamDemux:
+    """
+    recv スレッドから push() される (packet, addr)（ring 有りなら (slot, length, addr) のリスト）を
+    ストリーム毎の ReassembleSink へ振り分ける（SpscQueue.push と同じ形）。
+    """
+
+    def __init__(
+        self,
+        args,
+        outs: List[SpscQueue],
+        ring: Optional[PacketRing] = None,
+        max_streams: int = DEFAULT_MAX_STREAMS,
+        stream_timeout: float = DEFAULT_STREAM_TIMEOUT,
+    ):
+        self.args = args
+        self.outs = outs#復号ワーカー毎のキュー
+        self.ring = ring
+        self.max_streams = int(max_streams)
+        self.stream_timeout = float(stream_timeout)
+        self.streams: Dict[StreamKey, _Stream] = {}
+        self._load = [0] * len(outs)#ワーカー毎のストリーム数
+        self._next_tick = 0.0
+
+        self.bad_header = 0
+        self.rejected = 0        # max_streams を超えて捨てたパケット数
+        self.streams_opened = 0
+        self.streams_closed = 0
+
+    def push(self, item) -> bool:
+        now = time.monotonic()
+        if self.ring is None:
+            packet, addr = item
+            self._route(packet, addr, now)
+        else:
+            for slot, length, addr in item:
+                self._route(self.ring.view(slot, length), addr, now)
+            self.ring.release(len(item))#再構成器はペイロードをコピー済み
+        if now >= self._next_tick:
+            self.tick(now)
+        return True
+
+    def _route(self, packet, addr, now: float) -> None:
+        hdr = parse_header(packet)
+        if hdr is None:
+            self.bad_header += 1
+            return
+        key = (addr[0], addr[1], hdr.stream)
+        st = self.streams.get(key)
+        if st is None:
+            if len(self.streams) >= self.max_streams:
+                self.rejected += 1
+                return
+            worker = self._load.index(min(self._load))#ストリーム数の少ないワーカーへ
+            self._load[worker] += 1
+            st = self.streams[key] = _Stream(key, self.args, worker, self.outs[worker], now)
+            self.streams_opened += 1
+        st.last_rx = now
+        st.packets += 1
+        st.sink.push(packet)
+
+    def tick(self, now: Optional[float] = None) -> None:
+        """途切れたストリームの期限切れ処理・長く途切れたストリームの破棄（recv スレッドから呼ぶ）"""
+        if now is None:
+            now = time.monotonic()
+        self._next_tick = now + IDLE_INTERVAL
+        for key, st in list(self.streams.items()):
+            idle = now - st.last_rx
+            if idle >= self.stream_timeout:
+                del self.streams[key]
+                self._load[st.worker] -= 1
+                self.streams_closed += 1
+            elif idle >= IDLE_INTERVAL:
+                st.sink.idle()
+
+    def stats(self) -> dict:
+        return {
+            "streams": len(self.streams),
+            "streams_opened": self.streams_opened,
+            "streams_closed": self.streams_closed,
+            "rejected": self.rejected,
+            "bad_header": self.bad_header,
+        }
+
+
+def start_stream_decode_thread(
+    demux: StreamDemux,
+    frames: SpscQueue,
+    stop_flag: threading.Event,
+    on_frame: Optional[Callable[[StreamKey, int, Any, int], None]] = None,
+) -> threading.Thread:
+    """
+    frames から (key, frame_id, frame_bytes, recovered) を取り出し、そのストリームの DiffDecoder で復号して
+    ストリームの latest に入れるスレッド。on_frame があれば (key, frame_id, frame, recovered) で呼ぶ。
+    """
+
+    def decode_loop():
+        while not stop_flag.is_set():
+            for key, frame_id, frame_bytes, recovered in frames.pop_batch(timeout=0.1):
+                st = demux.streams.get(key)
+                if st is None:#破棄済みのストリーム
+                    continue
+                frame = decode_frame(frame_bytes, demux.args, st.diff_decoder)
+                if frame is None:
+                    continue
+                st.latest = (int(frame_id), frame, int(recovered))
+                st.decoded += 1
+                if on_frame is not None:
+                    on_frame(key, int(frame_id), frame, int(recovered))
+
+    t = threading.Thread(target=decode_loop, daemon=True)
+    t.start()
+    return t
+
+
+class MultiStreamReceiver:
+    def __init__(
+        self,
+        *,
+        bind_ip: str = "0.0.0.0",
+        port: int = 5000,
+        fec: str = "auto",
+        diff: str = "off",
+        fec_k: int = 8,
+        fec_r: int = 4,
+        reasm_timeout: float = DEFAULT_TIMEOUT,
+        reasm_max_frames: int = DEFAULT_MAX_FRAMES,
+        interleave_frames: int = 1,
+        feedback: str = "on",
+        feedback_interval: float = 0.5,
+        recv_ring: str = "on",
+        ring_slots: int = DEFAULT_SLOTS,
+        gro: str = "on",
+        max_packet: int = DEFAULT_SLOT_SIZE,  # 受信できる最大パケット長（送信側の payload 以上にする）
+        decode_workers: int = 2,     # 復号スレッド数（ストリーム数によらない）
+        max_streams: int = DEFAULT_MAX_STREAMS,
+        stream_timeout: float = DEFAULT_STREAM_TIMEOUT,
+        reuse_port: bool = False,    # SO_REUSEPORT（複数プロセスで同じポートを分担）
+        frame_qsize: int = 256,
+        on_frame: Optional[Callable[[StreamKey, int, Any, int], None]] = None,  # 復号スレッドから呼ばれる
+    ):
+        # VideoReceiver / server.py の args と同じフィールド名
+        self.args = SimpleNamespace(
+            bind_ip=bind_ip,
+            port=port,
+            fec=fec,
+            diff=diff,
+            fec_k=int(fec_k),
+            fec_r=int(fec_r),
+            reasm_timeout=float(reasm_timeout),
+            reasm_max_frames=int(reasm_max_frames),
+            interleave_frames=int(interleave_frames),
+            feedback=feedback,
+            feedback_interval=float(feedback_interval),
+            recv_ring=recv_ring,
+            ring_slots=int(ring_slots),
+            gro=gro,
+            max_packet=int(max_packet),
+        )
+        if self.args.fec == "rs":#Reassembler はストリーム毎に後から作るので、ここで先に弾く
+            check_rs_params(self.args.fec_k, self.args.fec_r)
+        self.reuse_port = bool(reuse_port)
+        self.on_frame = on_frame
+
+        self.stop_flag = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+        self.sock: Optional[socket.socket] = None
+        self.feedback: Optional[FeedbackReporter] = None
+
+        self.frames = [SpscQueue(frame_qsize) for _ in range(max(1, int(decode_workers)))]
+        self.ring = PacketRing(self.args.ring_slots, self.args.max_packet) if self.args.recv_ring == "on" else None
+        self.demux = StreamDemux(self.args, self.frames, self.ring, max_streams, stream_timeout)
+        self._threads: list[threading.Thread] = []
+        self._started_ts: Optional[float] = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            if self.stop_flag.is_set():
+                raise RuntimeError("この MultiStreamReceiver は stop() 済みです。新しく作り直してください。")
+
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            if self.reuse_port:
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.sock.bind((self.args.bind_ip, self.args.port))
+            self.sock.settimeout(0.5)
+            if self.args.feedback == "on":
+                self.feedback = FeedbackReporter(self.sock, self.args.feedback_interval)
+
+            # 再構成は recv スレッド内（demux.push）、途切れたら demux.tick
+            if self.ring is not None:
+                t_recv = start_ring_recv_thread(
+                    sock=self.sock,
+                    ring=self.ring,
+                    packet_queue=self.demux,
+                    stop_flag=self.stop_flag,
+                    feedback=self.feedback,
+                    gro=self.args.gro == "on",
+                    on_idle=self.demux.tick,
+                    with_addr=True,
+                )
+            else:
+                t_recv = start_recv_thread(
+                    sock=self.sock,
+                    packet_queue=self.demux,
+                    stop_flag=self.stop_flag,
+                    feedback=self.feedback,
+                    on_idle=self.demux.tick,
+                    with_addr=True,
+                    max_packet=self.args.max_packet,
+                )
+            self._threads = [t_recv] + [
+                start_stream_decode_thread(self.demux, q, self.stop_flag, self.on_frame) for q in self.frames
+            ]
+            self._started = True
+            self._started_ts = time.time()
+
+    def streams(self) -> List[StreamKey]:
+        return list(self.demux.streams)
+
+    def get_latest_frame(self, key: StreamKey) -> Optional[Tuple[int, Any, int]]:
+        st = self.demux.streams.get(key)
+        return None if st is None else st.latest
+
+    def stop(self) -> None:
+        with self._lock:
+            if not self._started:
+                return
+            self.stop_flag.set()
+            try:
+                if self.sock is not None:
+                    self.sock.close()
+            except Exception:
+                pass
+            self.sock = None
+            self._started = False
+
+    def __enter__(self) -> "MultiStreamReceiver":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        age = None if self._started_ts is None else round(time.time() - self._started_ts, 3)
+        return {
+            "running": self._started,
+            "bind_ip": self.args.bind_ip,
+            "port": self.args.port,
+            "reuse_port": self.reuse_port,
+            "age_since_start": age,
+            "demux": self.demux.stats(),
+            "streams": {key_str(k): st.stats(now) for k, st in list(self.demux.streams.items())},
+            "decode_queues": [q.stats() for q in self.frames],
+            "recv": None if self.ring is None else self.ring.stats(),
+            "feedback": None if self.feedback is None else self.feedback.stats(),
+        }
+
+
+# ==========================
+# SO_REUSEPORT で複数プロセスに分担
+# ==========================
+def _worker_main(index: int, kwargs: dict, report_interval: float, stop_event) -> None:
+    rx = MultiStreamReceiver(reuse_port=True, **kwargs)
+    rx.start()
+    try:
+        while not stop_event.wait(report_interval):
+            st = rx.status()
+            streams = ", ".join(f"{k} {v['fps']}fps" for k, v in st["streams"].items()) or "-"
+            print(f"[WORKER {index}] {st['demux']['streams']} streams: {streams}", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        rx.stop()
+
+
+def run_sharded(workers: int, report_interval: float = 5.0, **kwargs) -> None:
+    """
+    MultiStreamReceiver を workers 個のプロセスで SO_REUSEPORT 起動し、Ctrl+C まで待つ。
+    各プロセスは report_interval 秒毎にストリーム毎の fps を表示する（表示・録画は on_frame を使う独自プロセスで）。
+    """
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = ctx.Event()
+    procs = [
+        ctx.Process(target=_worker_main, args=(i, kwargs, report_interval, stop_event), daemon=True)
+        for i in range(int(workers))
+    ]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        stop_event.set()
+        for p in procs:
+            p.join(timeout=2.0)
@@ -8,16 +8,20 @@ import time
 from types import SimpleNamespace
 from typing import Optional, Any, Tuple
 
-from .fec.fec_reassembler_low import FECLowReassembler
-from .fec.fec_reassembler_mid import FECMediumReassembler
-from .fec.fec_reassembler_high import FECHighReassembler
-from .fec.simple_reassembler import SimpleFrameReassembler
+from .fec.factory import make_reassembler
+from .fec.frame_window import DEFAULT_TIMEOUT, DEFAULT_MAX_FRAMES
+from .fec.reorder import FrameReorder
+from .feedback import FeedbackReporter
+from .nack import DEFAULT_DELAY as NACK_DELAY, NackTracker
 
 from .diff.diffdecode import DiffDecoder
 
-from .recv_thread import start_recv_thread
-from .reassemble_thread import start_reassemble_thread
+from .recv_ring import DEFAULT_SLOT_SIZE, DEFAULT_SLOTS, PacketRing, join_multicast
+from .recv_thread import start_recv_thread, start_ring_recv_thread
+from .reassemble_thread import ReassembleSink, start_reassemble_thread
+from .spsc import SpscQueue
 from .decode_thread import start_decode_thread
+from .decode_pool import DecodePool, start_decode_pool_threads
 
 
 class VideoReceiver:
@@ -36,8 +40,24 @@ class VideoReceiver:
         *,
         bind_ip: str = "0.0.0.0",
         port: int = 5000,
-        fec: str = "none",   # "none" / "low" / "mid" / "high"
+        multicast_group: Optional[str] = None,  # 参加するマルチキャストグループ（送信側の destinations に同じグループを指定）
+        fec: str = "auto",   # "auto" / "none" / "low" / "mid" / "high" / "rs"（auto は v2 ヘッダの方式に従う）
         diff: str = "off",   # "on" / "off"
+        fec_k: int = 8,      # fec="rs" のデータ数（v1 ヘッダ時のみ使用）
+        fec_r: int = 4,      # fec="rs" のパリティ数（v1 ヘッダ時のみ使用）
+        reasm_timeout: float = DEFAULT_TIMEOUT,      # 未完成フレームを破棄するまでの秒数
+        reasm_max_frames: int = DEFAULT_MAX_FRAMES,  # 同時に再構成するフレーム数の上限
+        interleave_frames: int = 1,  # 送信側のフレーム間インターリーブ深さ（完成フレームを frame_id 順に並べ直す）
+        feedback: str = "on",        # 送信元へ損失レポートを返す（fec="adaptive" の送信側が使う）
+        feedback_interval: float = 0.5,
+        nack: str = "off",           # "on": 未着チャンクの再送を送信元へ要求する（送信側も nack="on"）
+        nack_delay: float = NACK_DELAY,  # フレームのパケットがこの秒数途切れたら未着分を要求する
+        recv_ring: str = "on",       # 事前確保したリングへバッチ受信（"off": 1 パケット毎に recvfrom）
+        ring_slots: int = DEFAULT_SLOTS,
+        max_packet: int = DEFAULT_SLOT_SIZE,  # 受信できる最大パケット長（送信側の payload 以上。既定でジャンボまで）
+        gro: str = "on",             # 受信ソケットで UDP GRO を有効にする（recv_ring="on"、Linux）
+        reassemble: str = "thread",  # "thread": 再構成スレッド / "inline": recv スレッド内で再構成（スレッド 1 段減）
+        decode_procs: int = 0,       # >0 なら N プロセスで復号（共有メモリ経由。0: 復号スレッド 1 本）
         buffer: str = "off",
         record: str = "off",
         packet_qsize: int = 1000,
@@ -48,8 +68,24 @@ class VideoReceiver:
         self.args = SimpleNamespace(
             bind_ip=bind_ip,
             port=port,
+            multicast_group=multicast_group,
             fec=fec,
             diff=diff,
+            fec_k=int(fec_k),
+            fec_r=int(fec_r),
+            reasm_timeout=float(reasm_timeout),
+            reasm_max_frames=int(reasm_max_frames),
+            interleave_frames=int(interleave_frames),
+            feedback=feedback,
+            feedback_interval=float(feedback_interval),
+            nack=nack,
+            nack_delay=float(nack_delay),
+            recv_ring=recv_ring,
+            ring_slots=int(ring_slots),
+            max_packet=int(max_packet),
+            gro=gro,
+            reassemble=reassemble,
+            decode_procs=int(decode_procs),
             buffer=buffer,
             record=record,
         )
@@ -59,27 +95,25 @@ class VideoReceiver:
         self._started = False
 
         self.sock: Optional[socket.socket] = None
+        self.feedback: Optional[FeedbackReporter] = None
+        self.nack: Optional[NackTracker] = None
 
         # server.py と同じキュー構成
-        self.packet_queue: "queue.Queue[bytes]" = queue.Queue(maxsize=packet_qsize)
+        self.packet_queue = SpscQueue(packet_qsize)#recv → reassemble（単一生産者・単一消費者）
         self.frame_queue: "queue.Queue[Any]" = queue.Queue(maxsize=frame_qsize)
         self.decoded_queue: "queue.Queue[Any]" = queue.Queue(maxsize=decoded_qsize)
 
         # FEC選択（server.py と同じ）
-        if self.args.fec == "none":
-            self.reassembler = SimpleFrameReassembler()
-        elif self.args.fec == "low":
-            self.reassembler = FECLowReassembler()
-        elif self.args.fec == "mid":
-            self.reassembler = FECMediumReassembler()
-        elif self.args.fec == "high":
-            self.reassembler = FECHighReassembler()
-        else:
-            self.reassembler = SimpleFrameReassembler()
+        self.reassembler = make_reassembler(self.args)
+        self.reorder = FrameReorder(self.args.interleave_frames)
+        self.ring = PacketRing(self.args.ring_slots, self.args.max_packet) if self.args.recv_ring == "on" else None
 
         # DiffDecoder（server.py と同じ）
         self.diff_decoder = DiffDecoder() if self.args.diff == "on" else None
 
+        # 復号プロセス（start() で起動）
+        self.pool: Optional[DecodePool] = None
+
         # 最新フレーム保持
         self._latest: Optional[Tuple[int, Any, int]] = None  # (frame_id, frame, recovered)
         self._tap_thread: Optional[threading.Thread] = None
@@ -102,24 +136,73 @@ class VideoReceiver:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.sock.bind((self.args.bind_ip, self.args.port))
             self.sock.settimeout(0.5)
+            if self.args.multicast_group:
+                join_multicast(self.sock, self.args.multicast_group)
+            if self.args.feedback == "on":
+                self.feedback = FeedbackReporter(self.sock, self.args.feedback_interval)
+            if self.args.nack == "on":
+                self.nack = NackTracker(self.sock, self.args.nack_delay)
 
             # server.py と同じスレッド開始（display_threadはSDKでは起動しない）
-            t_recv = start_recv_thread(sock=self.sock, packet_queue=self.packet_queue, stop_flag=self.stop_flag)
-            t_reasm = start_reassemble_thread(
-                packet_queue=self.packet_queue,
-                frame_queue=self.frame_queue,
-                stop_flag=self.stop_flag,
-                reassembler=self.reassembler,
-            )
-            t_dec = start_decode_thread(
-                frame_queue=self.frame_queue,
-                decoded_queue=self.decoded_queue,
-                stop_flag=self.stop_flag,
-                args=self.args,
-                diff_decoder=self.diff_decoder,
-            )
-
-            self._threads = [t_recv, t_reasm, t_dec]
+            # inline: recv スレッドが直接再構成する（packet_queue を使わない）
+            rx_target = self.packet_queue
+            on_idle = None
+            if self.args.reassemble == "inline":
+                rx_target = ReassembleSink(
+                    self.frame_queue, self.reassembler, self.reorder, self.ring, put_timeout=0, nack=self.nack
+                )
+                on_idle = rx_target.idle
+
+            if self.ring is not None:
+                t_recv = start_ring_recv_thread(
+                    sock=self.sock,
+                    ring=self.ring,
+                    packet_queue=rx_target,
+                    stop_flag=self.stop_flag,
+                    feedback=self.feedback,
+                    gro=self.args.gro == "on",
+                    on_idle=on_idle,
+                    nack=self.nack,
+                )
+            else:
+                t_recv = start_recv_thread(
+                    sock=self.sock,
+                    packet_queue=rx_target,
+                    stop_flag=self.stop_flag,
+                    feedback=self.feedback,
+                    on_idle=on_idle,
+                    nack=self.nack,
+                    max_packet=self.args.max_packet,
+                )
+            self._threads = [t_recv]
+            if self.args.reassemble == "thread":
+                self._threads.append(start_reassemble_thread(
+                    packet_queue=self.packet_queue,
+                    frame_queue=self.frame_queue,
+                    stop_flag=self.stop_flag,
+                    reassembler=self.reassembler,
+                    reorder=self.reorder,
+                    ring=self.ring,
+                    nack=self.nack,
+                ))
+            if self.args.decode_procs > 0:
+                # 複数プロセスで復号（frame_id 順に decoded_queue へ）
+                self.pool = DecodePool(self.args.decode_procs, self.args.diff)
+                self._threads.extend(start_decode_pool_threads(
+                    frame_queue=self.frame_queue,
+                    decoded_queue=self.decoded_queue,
+                    stop_flag=self.stop_flag,
+                    pool=self.pool,
+                ))
+            else:
+                t_dec = start_decode_thread(
+                    frame_queue=self.frame_queue,
+                    decoded_queue=self.decoded_queue,
+                    stop_flag=self.stop_flag,
+                    args=self.args,
+                    diff_decoder=self.diff_decoder,
+                )
+                self._threads.append(t_dec)
 
             # decoded_queue から最新フレームを拾う
             def tap():
@@ -155,6 +238,10 @@ class VideoReceiver:
             except Exception:
                 pass
             self.sock = None
+            if self.pool is not None:
+                for t in self._threads:#回収スレッドが共有メモリを読み終えてから閉じる
+                    t.join(timeout=0.5)
+                self.pool.close()
             self._started = False
 
     def status(self) -> dict:
@@ -170,4 +257,17 @@ class VideoReceiver:
             "latest_frame_id": None if self._latest is None else self._latest[0],
             "decoded_count": self._decoded_count,
             "age_since_start": age,
+            # 再構成器の統計（破棄フレーム数 evicted_timeout / evicted_overflow / late_dropped など）
+            "reassembler": self.reassembler.stats() if hasattr(self.reassembler, "stats") else None,
+            "reorder": self.reorder.stats(),
+            # 直近の損失レポート（送信元へ返したもの）
+            "feedback": None if self.feedback is None else self.feedback.stats(),
+            # 再送要求（efficiency = 要求したチャンクのうち再送で届いた割合）
+            "nack": None if self.nack is None else self.nack.stats(),
+            # 受信リングの統計（kernel_drops = SO_RXQ_OVFL、queue_dropped など）
+            "recv": None if self.ring is None else self.ring.stats(),
+            # recv → reassemble キューの深さ（high_water = 最大深さ。inline では使わない）
+            "packet_queue": self.packet_queue.stats(),
+            # 復号プロセス（decode_procs > 0 のとき）
+            "decode_pool": None if self.pool is None else self.pool.stats(),
         }